@@ -1,5 +1,7 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
@@ -15,9 +17,15 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    from app.serialization import json_provider
+    app.json = json_provider(app)
+
     db.init_app(app)
     login.init_app(app)
 
+    from app.database import configure_engine
+    configure_engine(app)
+
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
 
@@ -27,6 +35,23 @@ def create_app(config_class=Config):
     from app.api import bp as api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
 
+    # Imported for the session, mapper and DDL listeners they register
+    from app import audit, rollups, search, sla, stats, users, webhooks  # noqa: F401
+    from app import assignment, commands, instrumentation, jobs, scheduler
+    commands.register(app)
+    instrumentation.init_app(app)
+    jobs.init_app(app)
+
+    if not app.testing:
+        # Maintenance writes run in one designated process (see scheduler.start)
+        if app.config['SCHEDULER_ENABLED']:
+            scheduler.start(app)
+        # The assignment load is an in-memory cache of each process, so every
+        # process refreshes its own; this only reads
+        if app.config['ASSIGNMENT_ENABLED']:
+            scheduler.schedule(app, 'assignment-resync', app.config['ASSIGNMENT_RESYNC_INTERVAL'],
+                               assignment.resync)
+
     if not app.debug and not app.testing:
         if not os.path.exists('logs'):
             os.mkdir('logs')
@@ -35,7 +60,13 @@ def create_app(config_class=Config):
         file_handler.setFormatter(logging.Formatter(
             '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
         file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
+        # Requests only enqueue log records; formatting and file I/O happen
+        # on the listener thread.
+        log_queue = queue.Queue(-1)
+        listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        app.logger.addHandler(QueueHandler(log_queue))
 
         app.logger.setLevel(logging.INFO)
         app.logger.info('ITSM App startup')
@@ -1,27 +1,255 @@
-from flask import Blueprint, jsonify, request, current_app
-from app import db
-from app.models import Incident, User
+from datetime import datetime
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context, url_for
+from app import archive, assignment, db, export, rollups
+from app.audit import history
+from app.changes import changes_since, decode_seq, publisher, tail_cursor, wait_for_changes
+from app.conditional import make_etag, not_modified, with_validators
+from app.correlation import correlator
+from app.database import retry_on_busy
+from app.ingest import BulkIngest, iter_ndjson
+from app.models import Incident, IncidentArchive, User
+from app.queries import QueryError, apply_filters, page_size, keyset_page, iter_keyset, encode_cursor, sort_key
+from app.search import search
+from app.serialization import parse_fields, projected, serializer
+from app.sla import report as sla_report
+from app.stats import table_version
+from app.triage import BulkUpdate, TriageError, validate_changes, validate_filter, validate_ids
 
 bp = Blueprint('api', __name__)
 
 @bp.route('/incidents', methods=['GET'])
 def get_incidents():
     try:
-        incidents = Incident.query.all()
-        return jsonify([i.to_dict() for i in incidents])
+        # Any incident write bumps the table version, so an unchanged version
+        # means this exact URL would produce the same body.
+        etag = make_etag('incidents', table_version(), request.full_path, _wants_ndjson())
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        # Read-only listing: plain rows of the requested columns, no ORM objects
+        fields = parse_fields(request.args)
+        query = apply_filters(projected(fields), request.args)
+        cursor = request.args.get('cursor')
+        limit = page_size(request.args)
+        key = sort_key(request.args)
+
+        if _wants_ndjson():
+            return with_validators(_stream_ndjson(query, cursor, limit, serializer(fields), key), etag)
+
+        incidents = keyset_page(query, cursor, limit, key).all()
+        response = with_validators(jsonify(list(map(serializer(fields), incidents))), etag)
+        if len(incidents) == limit:
+            next_cursor = encode_cursor(incidents[-1], key)
+            args = request.args.to_dict()
+            args.update(cursor=next_cursor, limit=limit)
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{url_for("api.get_incidents", _external=True, **args)}>; rel="next"'
+        return response
+    except QueryError as e:
+        return jsonify({'error': 'Bad Request', 'message': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"API Error getting incidents: {str(e)}")
         return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
 
+def _wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+def _stream_ndjson(query, cursor, chunk_size, serialize, key):
+    # Streams every matching row, one keyset chunk at a time, instead of
+    # materializing the full list. `limit` only sets the chunk size here.
+    dumps = current_app.json.dumps
+
+    def generate():
+        try:
+            for chunk in iter_keyset(query, cursor, chunk_size, key):
+                yield ''.join(dumps(serialize(row)) + '\n' for row in chunk)
+        except Exception as e:
+            current_app.logger.error(f"API Error streaming incidents: {str(e)}")
+            raise
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@bp.route('/incidents/export', methods=['GET'])
+def export_incidents():
+    try:
+        fmt = request.args.get('format', 'csv')
+        if fmt not in export.FORMATS:
+            return jsonify({'error': 'Bad Request', 'message': f"format must be one of {', '.join(export.FORMATS)}"}), 400
+        fields = parse_fields(request.args)
+        query = apply_filters(projected(fields), request.args)
+        compress = request.args.get('gzip') == '1'
+        filename = f"incidents-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}" + ('.gz' if compress else '')
+        body = export.generate(query, fields, fmt, current_app.config['EXPORT_CHUNK_SIZE'], compress)
+        response = Response(stream_with_context(body),
+                            mimetype='application/gzip' if compress else export.FORMATS[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        current_app.logger.info(f"API: Export of incidents as {fmt} ({request.query_string.decode()})")
+        return response
+    except QueryError as e:
+        return jsonify({'error': 'Bad Request', 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"API Error exporting incidents: {str(e)}")
+        return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
+
+@bp.route('/incidents/search', methods=['GET'])
+def search_incidents():
+    try:
+        q = request.args.get('q', '').strip()
+        if not q:
+            return jsonify({'error': 'Bad Request', 'message': 'Must include a q parameter'}), 400
+        limit = min(page_size(request.args), 100)
+        offset = request.args.get('offset', 0, type=int)
+        fields = parse_fields(request.args)
+        query = search(apply_filters(projected(fields), request.args), q)
+        incidents = query.offset(max(offset, 0)).limit(limit).all()
+        return jsonify(list(map(serializer(fields), incidents)))
+    except QueryError as e:
+        return jsonify({'error': 'Bad Request', 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"API Error searching incidents: {str(e)}")
+        return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
+
+@bp.route('/incidents/changes', methods=['GET'])
+def get_incident_changes():
+    try:
+        since = request.args.get('since')
+        if not since:
+            # Start of a new feed: hand out the current tail to poll from
+            return jsonify({'changes': [], 'cursor': tail_cursor()})
+        limit = page_size(request.args)
+        wait = min(max(request.args.get('wait', 0, type=float), 0), current_app.config['CHANGES_MAX_WAIT'])
+        entries, cursor = wait_for_changes(since, limit, wait, current_app.config['CHANGES_POLL_INTERVAL'])
+        return jsonify({'changes': [incident.to_dict() for _, incident in entries], 'cursor': cursor})
+    except QueryError as e:
+        return jsonify({'error': 'Bad Request', 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"API Error getting incident changes: {str(e)}")
+        return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
+
+@bp.route('/incidents/changes/stream', methods=['GET'])
+def stream_incident_changes():
+    try:
+        cursor = request.headers.get('Last-Event-ID') or request.args.get('since') or tail_cursor()
+        decode_seq(cursor)
+    except QueryError as e:
+        return jsonify({'error': 'Bad Request', 'message': str(e)}), 400
+    heartbeat = current_app.config['CHANGES_POLL_INTERVAL']
+
+    def generate(cursor):
+        yield f"retry: {int(heartbeat * 1000)}\n\n"
+        try:
+            while True:
+                seq = publisher.seq
+                entries, cursor = changes_since(cursor, 100)
+                for event_id, incident in entries:
+                    yield f"id: {event_id}\nevent: incident\ndata: {current_app.json.dumps(incident.to_dict())}\n\n"
+                if not entries:
+                    db.session.close()
+                    if publisher.wait(seq, heartbeat) == seq:
+                        yield ": heartbeat\n\n"
+        except Exception as e:
+            current_app.logger.error(f"API Error streaming incident changes: {str(e)}")
+            raise
+
+    response = Response(stream_with_context(generate(cursor)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @bp.route('/incidents/<int:id>', methods=['GET'])
 def get_incident(id):
     try:
-        incident = Incident.query.get_or_404(id)
-        return jsonify(incident.to_dict())
+        model = Incident
+        updated_at = db.session.query(Incident.updated_at).filter(Incident.id == id).scalar()
+        if updated_at is None:
+            # Read-through to incidents moved out by the archival job
+            model = IncidentArchive
+            updated_at = db.session.query(IncidentArchive.updated_at).filter(IncidentArchive.id == id).scalar()
+        if updated_at is None:
+            return jsonify({'error': 'Not Found', 'message': 'Incident not found'}), 404
+        etag = make_etag(model.__tablename__, id, updated_at.isoformat())
+        cached = not_modified(etag, updated_at)
+        if cached:
+            return cached
+
+        incident = db.session.get(model, id)
+        return with_validators(jsonify(incident.to_dict()), etag, incident.updated_at)
     except Exception as e:
         current_app.logger.error(f"API Error getting incident {id}: {str(e)}")
         return jsonify({'error': 'Not Found', 'message': 'Incident not found'}), 404
 
+@bp.route('/incidents/<int:id>/history', methods=['GET'])
+def get_incident_history(id):
+    try:
+        events = history(id)
+        if not events and not archive.lookup(id):
+            return jsonify({'error': 'Not Found', 'message': 'Incident not found'}), 404
+        return jsonify([e.to_dict() for e in events])
+    except Exception as e:
+        current_app.logger.error(f"API Error getting history for incident {id}: {str(e)}")
+        return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
+
+@bp.route('/sla', methods=['GET'])
+def get_sla_report():
+    try:
+        days = request.args.get('days', 30, type=int)
+        soon = request.args.get('soon', 60, type=int)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 1000)
+        return jsonify(sla_report(days=days, soon_minutes=soon, limit=limit))
+    except Exception as e:
+        current_app.logger.error(f"API Error building SLA report: {str(e)}")
+        return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
+
+@bp.route('/reports/timeseries', methods=['GET'])
+def get_timeseries():
+    try:
+        filters = {name: request.args[param] for name, param in
+                   (('category', 'category'), ('priority', 'priority'), ('agent', 'agent_id')) if request.args.get(param)}
+        if 'agent' in filters:
+            if not filters['agent'].isdigit():
+                raise QueryError('agent_id must be an integer')
+            filters['agent'] = int(filters['agent'])
+        return jsonify(rollups.timeseries(days=request.args.get('days', 90, type=int),
+                                          group_by=request.args.get('group_by') or None, filters=filters))
+    except QueryError as e:
+        return jsonify({'error': 'Bad Request', 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"API Error building time series: {str(e)}")
+        return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
+
+@retry_on_busy
+def _create_incident(data, user):
+    # Fold duplicates of an open incident into it instead of adding a row
+    alert_correlator = correlator()
+    fp = alert_correlator.fingerprint(data) if alert_correlator else None
+    if fp is not None:
+        incident_id = alert_correlator.lookup(fp)
+        occurrences = alert_correlator.fold(fp, incident_id) if incident_id is not None else None
+        if occurrences is not None:
+            db.session.commit()
+            return db.session.get(Incident, incident_id), occurrences
+
+    incident = Incident(
+        title=data['title'],
+        description=data['description'],
+        category=data.get('category', 'General'),
+        priority=data.get('priority', 'Medium'),
+        comments=data.get('comments'),
+        author=user
+    )
+    if assignment.enabled():
+        incident.assigned_to_id = assignment.pick(incident.category)
+    db.session.add(incident)
+    if fp is not None:
+        db.session.flush()
+        alert_correlator.track([(fp, incident.id, data.get('source'), 1)])
+    db.session.commit()
+    if fp is not None:
+        alert_correlator.remember(fp, incident.id)
+    return incident, None
+
 @bp.route('/incidents', methods=['POST'])
 def create_incident():
     try:
@@ -33,16 +261,10 @@ def create_incident():
         if not user:
             return jsonify({'error': 'Bad Request', 'message': 'User not found'}), 400
 
-        incident = Incident(
-            title=data['title'],
-            description=data['description'],
-            category=data.get('category', 'General'),
-            priority=data.get('priority', 'Medium'),
-            comments=data.get('comments'),
-            author=user
-        )
-        db.session.add(incident)
-        db.session.commit()
+        incident, occurrences = _create_incident(data, user)
+        if occurrences is not None:
+            current_app.logger.info(f"API: Alert correlated into incident {incident.id} ({occurrences} occurrences)")
+            return jsonify(dict(incident.to_dict(), occurrences=occurrences, correlated=True)), 200
         current_app.logger.info(f"API: New incident created by user {user.username}: {incident.title}")
         return jsonify(incident.to_dict()), 201
     except Exception as e:
@@ -50,31 +272,81 @@ def create_incident():
         db.session.rollback()
         return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
 
+@bp.route('/incidents/bulk', methods=['POST'])
+def bulk_create_incidents():
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            items = iter_ndjson(request.stream)
+        else:
+            items = request.get_json(silent=True)
+            if not isinstance(items, list):
+                return jsonify({'error': 'Bad Request', 'message': 'Body must be a JSON array or NDJSON stream'}), 400
+
+        ingest = BulkIngest(chunk_size=current_app.config['BULK_CHUNK_SIZE'], correlator=correlator())
+        results = list(ingest.run(items))
+        current_app.logger.info(f"API: Bulk ingest created {ingest.created} incidents, "
+                                f"correlated {ingest.correlated}, {ingest.failed} failed")
+        return jsonify({'created': ingest.created, 'correlated': ingest.correlated,
+                        'failed': ingest.failed, 'results': results})
+    except Exception as e:
+        current_app.logger.error(f"API Error in bulk ingest: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
+
+@bp.route('/incidents', methods=['PATCH'])
+def patch_incidents():
+    # Mass triage: {"ids": [...]} or {"filter": {...}} plus {"changes": {...}}
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or ('ids' in data) == ('filter' in data):
+            return jsonify({'error': 'Bad Request', 'message': 'Must include changes and either ids or filter'}), 400
+        batch = BulkUpdate(validate_changes(data.get('changes')), chunk_size=current_app.config['BULK_CHUNK_SIZE'])
+        if 'ids' in data:
+            batch.run_ids(validate_ids(data['ids']))
+        else:
+            batch.run_filter(validate_filter(data['filter']))
+        current_app.logger.info(f"API: Batch update of {batch.matched} incidents, {batch.updated} changed: "
+                                f"{', '.join(sorted(batch.changes))}")
+        result = {'matched': batch.matched, 'updated': batch.updated, 'unchanged': batch.matched - batch.updated}
+        if 'ids' in data:
+            result['not_found'] = batch.missing
+        return jsonify(result)
+    except (TriageError, QueryError) as e:
+        return jsonify({'error': 'Bad Request', 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"API Error in batch update: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
+
 @bp.route('/incidents/<int:id>', methods=['PUT'])
 def update_incident(id):
     try:
-        incident = Incident.query.get_or_404(id)
-        data = request.get_json() or {}
-        
-        if 'title' in data:
-            incident.title = data['title']
-        if 'description' in data:
-            incident.description = data['description']
-        if 'category' in data:
-            incident.category = data['category']
-        if 'status' in data:
-            incident.status = data['status']
-        if 'priority' in data:
-            incident.priority = data['priority']
-        if 'comments' in data:
-            incident.comments = data['comments']
-        if 'assigned_to_id' in data:
-            incident.assigned_to_id = data['assigned_to_id']
-
-        db.session.commit()
+        incident = _update_incident(id, request.get_json() or {})
         current_app.logger.info(f"API: Incident {id} updated")
         return jsonify(incident.to_dict())
     except Exception as e:
         current_app.logger.error(f"API Error updating incident {id}: {str(e)}")
         db.session.rollback()
         return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
+
+@retry_on_busy
+def _update_incident(id, data):
+    incident = Incident.query.get_or_404(id)
+
+    if 'title' in data:
+        incident.title = data['title']
+    if 'description' in data:
+        incident.description = data['description']
+    if 'category' in data:
+        incident.category = data['category']
+    if 'status' in data:
+        incident.status = data['status']
+    if 'priority' in data:
+        incident.priority = data['priority']
+    if 'comments' in data:
+        incident.comments = data['comments']
+    if 'assigned_to_id' in data:
+        incident.assigned_to_id = data['assigned_to_id']
+
+    db.session.commit()
+    return incident
@@ -0,0 +1,66 @@
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
+from app import db
+from app.database import retry_on_busy
+from app.events import TRACKED_FIELDS, IncidentChange, notify
+from app.models import Incident, IncidentArchive, IncidentCorrelation
+from app.sla import RESOLVED_STATUSES
+
+archive_table = IncidentArchive.__table__
+COLUMNS = [Incident.id] + [getattr(Incident, field) for field in TRACKED_FIELDS]
+
+
+@retry_on_busy
+def _move_batch(cutoff, batch_size):
+    # Copies one batch into the archive and deletes it from incident in a
+    # single short transaction. Listeners get an 'archived' change per row,
+    # so counters, SLA records and assignment load drop them like deletions.
+    # The newest incident is never moved: SQLite hands out max(id) + 1, so
+    # archiving it would let a new incident reuse an archived id. No ORDER
+    # BY: any eligible batch will do, and sorting would read every closed row.
+    newest = select(func.max(Incident.id)).scalar_subquery()
+    rows = db.session.execute(
+        select(*COLUMNS)
+        .where(Incident.updated_at < cutoff, Incident.status.in_(RESOLVED_STATUSES), Incident.id < newest)
+        .limit(batch_size)).all()
+    if not rows:
+        return 0
+    ids = [row.id for row in rows]
+    now = datetime.utcnow()
+    db.session.execute(insert(archive_table), [dict(row._mapping, archived_at=now) for row in rows])
+    db.session.execute(delete(IncidentCorrelation.__table__).where(IncidentCorrelation.incident_id.in_(ids)))
+    db.session.execute(delete(Incident.__table__).where(Incident.id.in_(ids)))
+    notify(db.session, [IncidentChange('archived', row.id, {field: row._mapping[field] for field in TRACKED_FIELDS})
+                        for row in rows])
+    db.session.commit()
+    return len(rows)
+
+
+def run(days=None, batch_size=None, pause=None):
+    # Moves incidents Resolved or Closed for more than `days` (default
+    # ARCHIVE_AFTER_DAYS; 0 disables) into incident_archive, a batch per
+    # transaction with a pause in between so other writers get the lock.
+    config = current_app.config
+    days = config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    batch_size = batch_size or config['ARCHIVE_BATCH_SIZE']
+    pause = config['ARCHIVE_BATCH_PAUSE'] if pause is None else pause
+    if not days:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    total = 0
+    while True:
+        moved = _move_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            break
+        time.sleep(pause)
+    if total:
+        current_app.logger.info(f"Archived {total} incidents closed before {cutoff.isoformat()}")
+    return total
+
+
+def lookup(incident_id):
+    # Read-through by id: the live incident, else its archived copy
+    return db.session.get(Incident, incident_id) or db.session.get(IncidentArchive, incident_id)
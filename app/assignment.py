@@ -0,0 +1,233 @@
+import heapq
+import itertools
+import threading
+from collections import Counter
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+from app import db
+from app.events import on_flush
+from app.models import Incident, User
+from app.stats import OPEN_STATUSES
+
+AGENT_ROLE = 'Agent'
+# Value of the "Auto-assign" choice in the incident form
+AUTO_ASSIGN = -1
+
+
+class AssignmentEngine:
+    # Routes incidents to the least loaded agent with the category's skill.
+    # Open load per agent is kept in memory and adjusted from incident change
+    # events instead of being re-counted per decision. Each category has a
+    # heap of (load, sequence, agent id); entries are pushed whenever an
+    # agent's load changes and stale ones are skipped when they surface, so a
+    # decision costs O(log n) amortized. The sequence breaks ties in favour of
+    # the agent whose load changed least recently, i.e. round-robin among equals.
+
+    def __init__(self, agents, load, skills):
+        # agents: {id: username}; load: {id: open incidents};
+        # skills: {username: [categories]}, agents not listed take every category
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self.agents = dict(agents)
+        self.load = {agent_id: load.get(agent_id, 0) for agent_id in self.agents}
+        self.generalists = [a for a, name in self.agents.items() if name not in skills]
+        self.members = {}
+        for agent_id, name in self.agents.items():
+            for category in skills.get(name, ()):
+                self.members.setdefault(category, []).append(agent_id)
+        self.heaps = {}
+        self._any = []
+        self._round_robin = itertools.cycle(sorted(self.agents)) if self.agents else None
+        for agent_id in self.agents:
+            self._push(agent_id)
+
+    def _categories(self, agent_id):
+        if agent_id in self.generalists:
+            return None
+        return [c for c, members in self.members.items() if agent_id in members]
+
+    def _push(self, agent_id):
+        entry = (self.load[agent_id], next(self._seq), agent_id)
+        heapq.heappush(self._any, entry)
+        categories = self._categories(agent_id)
+        for category in (self.members if categories is None else categories):
+            heapq.heappush(self.heaps.setdefault(category, []), entry)
+        if categories is None:
+            # Generalists also sit in the heap used for categories nobody
+            # lists explicitly.
+            heapq.heappush(self.heaps.setdefault(None, []), entry)
+
+    def _top(self, heap):
+        while heap:
+            load, _, agent_id = heap[0]
+            if self.load.get(agent_id) == load:
+                return agent_id
+            heapq.heappop(heap)
+        return None
+
+    def _adjust(self, agent_id, delta):
+        self.load[agent_id] += delta
+        self._push(agent_id)
+        if len(self._any) > 4 * len(self.agents) + 64:
+            self._compact()
+
+    def _compact(self):
+        self.heaps = {}
+        self._any = []
+        for agent_id in self.agents:
+            self._push(agent_id)
+
+    def pick(self, category):
+        # Chooses an agent and counts the incident against them right away,
+        # so a burst of decisions spreads out before anything is flushed.
+        with self._lock:
+            if not self.agents:
+                return None
+            heap = self.heaps.get(category) if category in self.members else self.heaps.get(None)
+            agent_id = self._top(heap) if heap else None
+            if agent_id is None:
+                # Nobody covers this category: plain round-robin
+                agent_id = next(self._round_robin)
+            self._adjust(agent_id, 1)
+            return agent_id
+
+    def apply(self, deltas):
+        with self._lock:
+            for agent_id, delta in deltas.items():
+                if delta and agent_id in self.load:
+                    self._adjust(agent_id, delta)
+
+    def ranked(self):
+        with self._lock:
+            return sorted(self.load.items(), key=lambda item: (item[1], self.agents[item[0]]))
+
+
+def _build():
+    # Runs from pick() while the caller's incident may be pending; don't flush it.
+    with db.session.no_autoflush:
+        agents = dict(db.session.query(User.id, User.username).filter(User.role == AGENT_ROLE))
+        load = dict(db.session.query(Incident.assigned_to_id, func.count(Incident.id))
+                    .filter(Incident.assigned_to_id.in_(agents), Incident.status.in_(OPEN_STATUSES))
+                    .group_by(Incident.assigned_to_id)) if agents else {}
+    return AssignmentEngine(agents, load, current_app.config['ASSIGNMENT_SKILLS'])
+
+
+def engine():
+    ext = current_app.extensions.get('itsm_assignment')
+    if ext is None:
+        ext = current_app.extensions['itsm_assignment'] = _build()
+    return ext
+
+
+def resync():
+    # Reloads agents and committed load, dropping drift from writes made by
+    # other processes.
+    current_app.extensions['itsm_assignment'] = _build()
+
+
+def enabled():
+    return current_app.config['ASSIGNMENT_ENABLED']
+
+
+def pick(category, session=None):
+    session = session or db.session
+    agent_id = engine().pick(category)
+    if agent_id is not None:
+        # Ties the reservation to a transaction, which releases it if it ends
+        # without committing
+        session.connection()
+        session.info.setdefault('assignment_reserved', Counter())[agent_id] += 1
+        session.info.setdefault('assignment_applied', Counter())[agent_id] += 1
+    return agent_id
+
+
+def ranked_choices(choices):
+    # Orders (id, username) assignee choices for the incident form: agents
+    # least loaded first and labelled with their open incidents, then the
+    # rest (Admins) as given.
+    names = dict(choices)
+    ranked = [(agent_id, f'{names[agent_id]} ({load} open)')
+              for agent_id, load in engine().ranked() if agent_id in names]
+    ranked_ids = {agent_id for agent_id, _ in ranked}
+    return ranked + [choice for choice in choices if choice[0] not in ranked_ids]
+
+
+def _deltas(changes):
+    deltas = Counter()
+    for change in changes:
+        values = change.values
+        is_open = values['status'] in OPEN_STATUSES
+        if change.action == 'created':
+            if values['assigned_to_id'] and is_open:
+                deltas[values['assigned_to_id']] += 1
+        elif change.removed:
+            if values['assigned_to_id'] and is_open:
+                deltas[values['assigned_to_id']] -= 1
+        elif change.changed('status') or change.changed('assigned_to_id'):
+            old_agent = change.previous.get('assigned_to_id', values['assigned_to_id'])
+            if old_agent and change.previous.get('status', values['status']) in OPEN_STATUSES:
+                deltas[old_agent] -= 1
+            if values['assigned_to_id'] and is_open:
+                deltas[values['assigned_to_id']] += 1
+    return deltas
+
+
+@on_flush
+def _track_load(session, changes):
+    if not has_app_context() or 'itsm_assignment' not in current_app.extensions:
+        return
+    deltas = _deltas(changes)
+    # Creations assigned by pick() were already counted
+    reserved = session.info.get('assignment_reserved')
+    if reserved:
+        for agent_id in list(deltas):
+            consumed = min(max(deltas[agent_id], 0), reserved[agent_id])
+            deltas[agent_id] -= consumed
+            reserved[agent_id] -= consumed
+    engine().apply(deltas)
+    session.info.setdefault('assignment_applied', Counter()).update(deltas)
+
+
+def _release(counts):
+    if counts and has_app_context() and 'itsm_assignment' in current_app.extensions:
+        engine().apply({agent_id: -count for agent_id, count in counts.items() if count})
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    # Picks that never turned into a flushed incident are released
+    session.info.pop('assignment_applied', None)
+    _release(session.info.pop('assignment_reserved', None))
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _after_transaction_end(session, transaction):
+    # Rolled back or closed without committing: release everything the
+    # transaction counted, picks included
+    if transaction.parent is None:
+        session.info.pop('assignment_reserved', None)
+        _release(session.info.pop('assignment_applied', None))
+
+
+def _roster_changed():
+    # Rebuild on next use. Only for roster changes: a rebuilt engine loses
+    # the reservations of transactions in flight until the next resync.
+    if has_app_context():
+        current_app.extensions.pop('itsm_assignment', None)
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_delete')
+def _user_added_or_removed(mapper, connection, target):
+    if target.role == AGENT_ROLE:
+        _roster_changed()
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    # Skills are keyed by username; reporters signing up or passwords being
+    # rehashed on login leave the roster alone
+    state = inspect(target)
+    if state.attrs.role.history.has_changes() or state.attrs.username.history.has_changes():
+        _roster_changed()
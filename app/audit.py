@@ -0,0 +1,146 @@
+import atexit
+import queue
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert
+from app import db
+from app.database import retry_on_busy
+from app.events import on_commit
+from app.models import IncidentEvent
+
+event_table = IncidentEvent.__table__
+
+
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def event_rows(changes, now=None):
+    now = now or datetime.utcnow()
+    rows = []
+    for change in changes:
+        base = {'incident_id': change.incident_id, 'action': change.action,
+                'actor_id': change.actor_id, 'created_at': now}
+        if change.action == 'updated':
+            for field, old in change.previous.items():
+                rows.append(dict(base, field=field, old_value=_text(old),
+                                 new_value=_text(change.values[field])))
+        else:
+            rows.append(dict(base, field=None, old_value=None, new_value=None))
+    return rows
+
+
+class AuditWriter:
+    # Background thread that drains queued event rows and inserts them in
+    # batches, so requests only pay for a queue.put(). The queue is bounded
+    # and never waited on: if the writer falls that far behind, new events
+    # are counted in `overflowed` and logged instead of blocking the commit.
+
+    def __init__(self, app, batch_size=500, flush_interval=0.5, max_queue=10000):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.dropped = 0
+        self.overflowed = 0
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='itsm-audit-writer', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, rows):
+        if not rows:
+            return
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            self.overflowed += len(rows)
+            self.app.logger.error(f"Audit queue full, {len(rows)} events not recorded "
+                                  f"({self.overflowed} in total)")
+
+    def flush(self, timeout=5.0):
+        # Waits until everything enqueued so far has been written.
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stop(self):
+        self._stopping.set()
+        self.flush()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self.queue.empty()):
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch, waiters = [], []
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.extend(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write(self, batch):
+        with self.app.app_context():
+            try:
+                _insert(batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                self.app.logger.error(f"Audit writer failed to store {len(batch)} events: {str(e)}")
+
+
+@retry_on_busy
+def _insert(rows):
+    # Lock contention is exactly when the writer is busiest: retry with
+    # backoff before giving up on the batch
+    with db.engine.begin() as connection:
+        connection.execute(insert(event_table), rows)
+
+
+def writer():
+    ext = current_app.extensions.get('itsm_audit_writer')
+    if ext is None:
+        app = current_app._get_current_object()
+        ext = app.extensions['itsm_audit_writer'] = AuditWriter(
+            app, batch_size=app.config['AUDIT_BATCH_SIZE'],
+            flush_interval=app.config['AUDIT_FLUSH_INTERVAL'])
+        atexit.register(ext.stop)
+    return ext
+
+
+@on_commit
+def _record_changes(changes):
+    rows = event_rows(changes)
+    if current_app.config['AUDIT_ASYNC']:
+        writer().enqueue(rows)
+    elif rows:
+        # The session cannot emit SQL from inside its own after_commit hook.
+        with db.engine.begin() as connection:
+            connection.execute(insert(event_table), rows)
+
+
+def history(incident_id):
+    if current_app.config['AUDIT_ASYNC']:
+        writer().flush()
+    return (IncidentEvent.query.filter_by(incident_id=incident_id)
+            .order_by(IncidentEvent.created_at, IncidentEvent.id).all())
@@ -4,6 +4,7 @@ from urllib.parse import urlsplit
 from app import db
 from app.models import User
 from app.forms import LoginForm, RegistrationForm
+from app.passwords import HashPoolBusy
 
 bp = Blueprint('auth', __name__)
 
@@ -19,6 +20,11 @@ def login():
                 current_app.logger.warning(f"Failed login attempt for username: {form.username.data}")
                 flash('Invalid username or password', 'danger')
                 return redirect(url_for('auth.login'))
+            if user.password_needs_rehash():
+                # Hash parameters changed since this password was stored
+                user.set_password(form.password.data)
+                db.session.commit()
+                current_app.logger.info(f"Rehashed password for user: {user.username}")
             login_user(user, remember=form.remember_me.data)
             current_app.logger.info(f"User logged in: {user.username}")
             next_page = request.args.get('next')
@@ -26,6 +32,10 @@ def login():
                 next_page = url_for('main.index')
             return redirect(next_page)
         return render_template('login.html', title='Sign In', form=form)
+    except HashPoolBusy:
+        current_app.logger.warning('Login rejected: password hashing pool is saturated')
+        flash('The server is busy, please try again in a moment.', 'warning')
+        return render_template('login.html', title='Sign In', form=form), 503
     except Exception as e:
         current_app.logger.error(f"Error during login: {str(e)}")
         flash('An error occurred during login.', 'danger')
@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    # Thread-safe mapping whose entries expire `ttl` seconds after they were
+    # last written. Entries are kept in write order, which with a fixed TTL is
+    # also expiry order, so purging expired entries and evicting the oldest
+    # entry when full are both O(1).
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            now = self.clock()
+            self._data.pop(key, None)
+            self._data[key] = (value, now + self.ttl)
+            self._purge(now)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _purge(self, now):
+        while self._data:
+            key, (_, expires_at) = next(iter(self._data.items()))
+            if expires_at > now and len(self._data) <= self.maxsize:
+                return
+            del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,136 @@
+import threading
+import time
+from sqlalchemy import delete, func, insert, select, update
+from app import db
+from app.events import on_commit, on_flush
+from app.models import Incident, IncidentFeed
+from app.queries import QueryError, with_users
+from app.stats import stat_table
+
+feed_table = IncidentFeed.__table__
+# Counter row holding the last allocated sequence number
+SEQ_KEY = ('meta', 'change_seq')
+
+
+class ChangePublisher:
+    # Wakes up long-poll and SSE clients when an incident commit happens in
+    # this process. Clients re-read the database after waking, so the
+    # publisher only carries a sequence number, never the data itself.
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._seq = 0
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def publish(self):
+        with self._condition:
+            self._seq += 1
+            self._condition.notify_all()
+
+    def wait(self, seq, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq != seq, timeout)
+            return self._seq
+
+
+publisher = ChangePublisher()
+
+
+@on_commit
+def _publish(changes):
+    publisher.publish()
+
+
+def _allocate(connection, n):
+    # Reserves n sequence numbers and returns the last. The counter row is
+    # written inside the incident write's transaction, which holds SQLite's
+    # write lock until it commits, so numbers are handed out in commit order.
+    dimension, key = SEQ_KEY
+    last = connection.execute(
+        update(stat_table).where(stat_table.c.dimension == dimension, stat_table.c.key == key)
+        .values(count=stat_table.c.count + n).returning(stat_table.c.count)).scalar()
+    if last is None:
+        last = (connection.execute(select(func.max(feed_table.c.seq))).scalar() or 0) + n
+        connection.execute(insert(stat_table).values(dimension=dimension, key=key, count=last))
+    return last
+
+
+@on_flush
+def _sequence_changes(session, changes):
+    # Moves each created or updated incident to the end of the feed
+    connection = session.connection()
+    removed = [change.incident_id for change in changes if change.removed]
+    ids = list(dict.fromkeys(change.incident_id for change in changes if not change.removed))
+    stale = removed + ids
+    if stale:
+        connection.execute(delete(feed_table).where(feed_table.c.incident_id.in_(stale)))
+    if ids:
+        first = _allocate(connection, len(ids)) - len(ids) + 1
+        connection.execute(insert(feed_table), [{'incident_id': incident_id, 'seq': seq}
+                                                for seq, incident_id in enumerate(ids, first)])
+
+
+def backfill():
+    # Rebuilds the feed from the incident table in (updated_at, id) order,
+    # for databases filled without the session hooks
+    db.session.execute(delete(feed_table))
+    position = func.row_number().over(order_by=(Incident.updated_at, Incident.id))
+    count = db.session.execute(insert(feed_table).from_select(
+        ['incident_id', 'seq'], select(Incident.id, position))).rowcount
+    last = db.session.execute(select(func.max(feed_table.c.seq))).scalar() or 0
+    dimension, key = SEQ_KEY
+    db.session.execute(delete(stat_table).where(stat_table.c.dimension == dimension, stat_table.c.key == key))
+    db.session.execute(insert(stat_table).values(dimension=dimension, key=key, count=last))
+    db.session.commit()
+    return count
+
+
+def decode_seq(cursor):
+    try:
+        seq = int(cursor)
+    except ValueError:
+        raise QueryError('Invalid cursor')
+    if seq < 0:
+        raise QueryError('Invalid cursor')
+    return seq
+
+
+def tail_cursor():
+    dimension, key = SEQ_KEY
+    last = db.session.execute(select(stat_table.c.count).where(stat_table.c.dimension == dimension,
+                                                                stat_table.c.key == key)).scalar()
+    return str(last or 0)
+
+
+def changes_since(cursor, limit):
+    # (seq, incident) pairs after the cursor, in sequence order. Every create
+    # or update moves an incident to the end, and a sequence number only
+    # becomes visible once every smaller one has committed, so a cursor sees
+    # each incident's latest change after it exactly once.
+    seq = decode_seq(cursor) if cursor else 0
+    rows = (with_users(db.session.query(feed_table.c.seq, Incident))
+            .join(Incident, Incident.id == feed_table.c.incident_id)
+            .filter(feed_table.c.seq > seq)
+            .order_by(feed_table.c.seq).limit(limit).all())
+    next_cursor = str(rows[-1][0]) if rows else str(seq)
+    return rows, next_cursor
+
+
+def wait_for_changes(cursor, limit, timeout, poll_interval):
+    # Long-poll: returns as soon as there is something after the cursor, or
+    # empty-handed after `timeout`. The in-process publisher gives instant
+    # wakeups; `poll_interval` bounds the delay for writes made by other
+    # worker processes.
+    deadline = time.monotonic() + timeout
+    while True:
+        seq = publisher.seq
+        entries, next_cursor = changes_since(cursor, limit)
+        remaining = deadline - time.monotonic()
+        if entries or remaining <= 0:
+            return entries, next_cursor
+        # Don't hold a pooled connection while idle
+        db.session.close()
+        publisher.wait(seq, min(remaining, poll_interval))
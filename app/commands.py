@@ -0,0 +1,212 @@
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from app import archive, jobs, rollups, scheduler, schema, search, seed, sla, stats, webhooks
+
+schema_cli = AppGroup('schema', help='Database schema management.')
+
+
+@schema_cli.command('upgrade')
+def schema_upgrade():
+    """Create missing tables and indexes on an existing database."""
+    created = schema.upgrade()
+    for name in created:
+        click.echo(f"Created {name}")
+    click.echo('Schema is up to date.' if not created else f"{len(created)} objects created.")
+
+
+stats_cli = AppGroup('stats', help='Materialized dashboard statistics.')
+
+
+@stats_cli.command('reconcile')
+def stats_reconcile():
+    """Recompute dashboard counters from the incident table."""
+    counts = stats.reconcile()
+    click.echo(f"Reconciled {len(counts)} counters ({counts[('total', '')]} incidents).")
+
+search_cli = AppGroup('search', help='Full-text incident search index.')
+
+
+@search_cli.command('rebuild')
+def search_rebuild():
+    """Create the search index if missing and reindex all incidents."""
+    count = search.rebuild()
+    click.echo(f"Search index rebuilt for {count} incidents.")
+
+sla_cli = AppGroup('sla', help='Incident SLA due dates and breaches.')
+
+
+@sla_cli.command('backfill')
+def sla_backfill():
+    """Compute SLA due dates for incidents that have none."""
+    count = sla.backfill()
+    click.echo(f"Created SLA records for {count} incidents.")
+
+
+@sla_cli.command('sweep')
+def sla_sweep():
+    """Flag overdue SLA targets now instead of waiting for the scheduler."""
+    flagged = sla.sweep()
+    click.echo(f"Flagged {flagged['response']} response and {flagged['resolve']} resolve breaches.")
+
+
+reports_cli = AppGroup('reports', help='Daily rollups behind the time-series reports.')
+
+
+@reports_cli.command('backfill')
+def reports_backfill():
+    """Rebuild the daily rollups from the incident and archive tables."""
+    count = rollups.backfill()
+    click.echo(f"Rebuilt {count} daily rollup rows.")
+
+
+jobs_cli = AppGroup('jobs', help='Background job queue.')
+
+
+@jobs_cli.command('worker')
+@click.option('--processes', type=int, help='Worker processes (default JOBS_WORKERS; 1 runs in this process).')
+@click.option('--batch-size', type=int, help='Jobs claimed at a time per process (default JOBS_BATCH_SIZE).')
+@click.option('--poll-interval', type=float, help='Seconds between polls when idle (default JOBS_POLL_INTERVAL).')
+@click.option('--metrics-port', type=int, help='Serve worker metrics for scraping on this port.')
+def jobs_worker(processes, batch_size, poll_interval, metrics_port):
+    """Run queued jobs until interrupted."""
+    app = current_app._get_current_object()
+    processes = processes or app.config['JOBS_WORKERS']
+    if metrics_port:
+        jobs.serve_metrics(app, metrics_port)
+    click.echo(f"Running jobs with {processes} worker process{'es' if processes > 1 else ''}, Ctrl+C to stop.")
+    jobs.run_workers(processes, batch_size=batch_size, poll_interval=poll_interval)
+
+
+@jobs_cli.command('run')
+@click.option('--limit', type=int, help='Stop after this many jobs.')
+def jobs_run(limit):
+    """Run the jobs that are ready now, then exit."""
+    outcomes = jobs.run_pending(limit)
+    click.echo(f"Ran {sum(outcomes.values())} jobs: " +
+               (', '.join(f'{count} {outcome}' for outcome, count in sorted(outcomes.items())) or 'none ready') + '.')
+
+
+@jobs_cli.command('status')
+def jobs_status():
+    """Show the number of jobs per status."""
+    for status, count in sorted(jobs.counts().items()):
+        click.echo(f"{status:8} {count}")
+    click.echo(f"Oldest ready job has waited {jobs.ready_lag():.1f}s.")
+
+
+@jobs_cli.command('retry')
+@click.argument('ids', nargs=-1, type=int)
+def jobs_retry(ids):
+    """Requeue dead jobs (all, or the given ids)."""
+    count = jobs.retry_dead(ids)
+    click.echo(f"Requeued {count} dead jobs.")
+
+
+scheduler_cli = AppGroup('scheduler', help='Periodic maintenance tasks.')
+
+
+@scheduler_cli.command('run')
+def scheduler_run():
+    """Run the periodic maintenance tasks until interrupted."""
+    names = scheduler.start(current_app._get_current_object())
+    click.echo(f"Running {', '.join(names) or 'no tasks'}, Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+webhooks_cli = AppGroup('webhooks', help='Outbound webhook subscriptions.')
+
+
+@webhooks_cli.command('add')
+@click.argument('url')
+@click.option('--event', 'events', multiple=True, type=click.Choice(webhooks.EVENTS),
+              help='Event to send (repeatable; default all).')
+@click.option('--secret', help='Sign request bodies with HMAC-SHA256 using this secret.')
+@click.option('--window', type=float, help='Batching window in seconds (default WEBHOOK_BATCH_WINDOW).')
+def webhooks_add(url, events, secret, window):
+    """Subscribe URL to incident events."""
+    subscription = webhooks.subscribe(url, events=events, secret=secret, batch_window=window)
+    click.echo(f"Created subscription {subscription.id} for {subscription.events} "
+               f"(batched every {subscription.batch_window:g}s).")
+
+
+@webhooks_cli.command('list')
+def webhooks_list():
+    """Show subscriptions with their pending and dead event counts."""
+    for subscription, counts in webhooks.summary():
+        click.echo(f"{subscription.id:4} {'active  ' if subscription.active else 'inactive'} {subscription.url} "
+                   f"events={subscription.events} window={subscription.batch_window:g}s "
+                   f"pending={counts.get('pending', 0)} dead={counts.get('dead', 0)}")
+
+
+@webhooks_cli.command('remove')
+@click.argument('subscription_id', type=int)
+def webhooks_remove(subscription_id):
+    """Delete a subscription and its undelivered events."""
+    if not webhooks.unsubscribe(subscription_id):
+        raise click.UsageError(f'No subscription {subscription_id}.')
+    click.echo(f"Removed subscription {subscription_id}.")
+
+
+@webhooks_cli.command('retry')
+@click.option('--subscription', 'subscription_id', type=int, help='Only this subscription.')
+def webhooks_retry(subscription_id):
+    """Queue dead-lettered events for delivery again."""
+    count = webhooks.retry_dead(subscription_id)
+    click.echo(f"Requeued {count} dead events.")
+
+
+@click.command('seed')
+@click.option('--incidents', default=100000, show_default=True, help='Incidents to generate.')
+@click.option('--users', default=1000, show_default=True, help='Reporting users to create.')
+@click.option('--agents', default=50, show_default=True, help='Agents to create.')
+@click.option('--days', default=365, show_default=True, help='Spread incident creation over this many days.')
+@click.option('--chunk-size', default=50000, show_default=True, help='Rows per insert transaction.')
+@click.option('--prefix', default='seed', show_default=True, help='Username prefix for generated accounts.')
+@click.option('--password', default='seed', show_default=True, help='Password of every generated account.')
+@click.option('--random-seed', type=int, help='Seed for reproducible data.')
+@click.option('--skip-search-index', is_flag=True, help='Leave the search index for a later `search rebuild`.')
+def seed_command(incidents, users, agents, days, chunk_size, prefix, password, random_seed, skip_search_index):
+    """Generate users and incidents with realistic distributions."""
+    def progress(done, total, elapsed):
+        click.echo(f"  {done}/{total} incidents ({elapsed:.1f}s, {done / elapsed:.0f} rows/s)")
+
+    started = time.perf_counter()
+    result = seed.run(incidents, users=users, agents=agents, days=days, chunk_size=chunk_size, prefix=prefix,
+                      password=password, random_seed=random_seed, progress=progress,
+                      search_index=not skip_search_index)
+    click.echo(f"Created {result['users']} users, {result['agents']} agents and {result['incidents']} incidents "
+               f"in {time.perf_counter() - started:.1f}s.")
+
+
+archive_cli = AppGroup('archive', help='Archival of long-closed incidents.')
+
+
+@archive_cli.command('run')
+@click.option('--days', type=int, help='Archive incidents closed for more than this many days '
+                                       '(default ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, help='Incidents moved per transaction (default ARCHIVE_BATCH_SIZE).')
+def archive_run(days, batch_size):
+    """Move long-closed incidents to the archive table now."""
+    if not days and not current_app.config['ARCHIVE_AFTER_DAYS']:
+        raise click.UsageError('Pass --days or set ARCHIVE_AFTER_DAYS.')
+    count = archive.run(days=days, batch_size=batch_size)
+    click.echo(f"Archived {count} incidents.")
+
+
+def register(app):
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(sla_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(reports_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(scheduler_cli)
+    app.cli.add_command(webhooks_cli)
+    app.cli.add_command(seed_command)
@@ -0,0 +1,36 @@
+import hashlib
+from datetime import timezone
+from flask import Response, request
+
+
+def make_etag(*parts):
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()[:20]
+
+
+def _http_date(value):
+    # Last-Modified has one second resolution; stored timestamps are naive UTC.
+    return value.replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def not_modified(etag, last_modified=None):
+    # Returns a 304 response when the client's validators still match, so the
+    # caller can skip loading and serializing the resource altogether.
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110).
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif last_modified is not None and request.if_modified_since:
+        fresh = request.if_modified_since >= _http_date(last_modified)
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return with_validators(Response(status=304), etag, last_modified)
+
+
+def with_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _http_date(last_modified)
+    # Allow caching but require revalidation on every use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
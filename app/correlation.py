@@ -0,0 +1,103 @@
+import hashlib
+import re
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert, select, update
+from app import db
+from app.cache import TTLCache
+from app.models import Incident, IncidentCorrelation
+
+OPEN_STATUSES = ['Open', 'In Progress']
+
+correlation_table = IncidentCorrelation.__table__
+
+# Volatile parts of alert titles that should not split a storm into many
+# incidents: hex ids and long numbers (request ids, counters, timestamps).
+# Short numbers and addresses usually name the affected host or device.
+_VOLATILE = re.compile(r'\b(0x[0-9a-f]+|(?=[a-f]*\d)[0-9a-f]{8,}|\d{5,})\b')
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_title(title):
+    title = _VOLATILE.sub('#', str(title).lower())
+    return _NON_WORD.sub(' ', title).strip()
+
+
+def fingerprint(title, category, source):
+    raw = f"{normalize_title(title)}|{category}|{source}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class Correlator:
+    # Folds duplicate alerts into the open incident they belong to. The
+    # in-memory index answers the hot path during a storm in O(1); the
+    # indexed table covers other workers and restarts.
+
+    def __init__(self, window, maxsize):
+        self.window = window
+        self.index = TTLCache(maxsize=maxsize, ttl=window)
+
+    def fingerprint(self, data):
+        # Only alerts naming their `source` are correlated: reports typed in
+        # by people with the same title are distinct incidents
+        if not data.get('source'):
+            return None
+        return fingerprint(data.get('title', ''), data.get('category', 'General'), data.get('source'))
+
+    def lookup(self, fp):
+        incident_id = self.index.get(fp)
+        if incident_id is not None:
+            return incident_id
+        cutoff = datetime.utcnow() - timedelta(seconds=self.window)
+        incident_id = db.session.execute(
+            select(correlation_table.c.incident_id)
+            .join(Incident, Incident.id == correlation_table.c.incident_id)
+            .where(correlation_table.c.fingerprint == fp,
+                   correlation_table.c.last_seen >= cutoff,
+                   Incident.status.in_(OPEN_STATUSES))
+            .order_by(correlation_table.c.last_seen.desc())
+            .limit(1)).scalar()
+        if incident_id is not None:
+            self.index.set(fp, incident_id)
+        return incident_id
+
+    def fold(self, fp, incident_id, count=1):
+        # Adds occurrences to the incident's correlation row, provided the
+        # incident is still open. Returns the new occurrence count, or None
+        # if the match went stale and a new incident should be created.
+        still_open = select(Incident.id).where(Incident.id == incident_id,
+                                               Incident.status.in_(OPEN_STATUSES))
+        occurrences = db.session.execute(
+            update(correlation_table)
+            .where(correlation_table.c.fingerprint == fp,
+                   correlation_table.c.incident_id.in_(still_open))
+            .values(occurrences=correlation_table.c.occurrences + count,
+                    last_seen=datetime.utcnow())
+            .returning(correlation_table.c.occurrences)).scalars().all()
+        if not occurrences:
+            self.index.discard(fp)
+            return None
+        self.index.set(fp, incident_id)
+        return max(occurrences)
+
+    def track(self, entries):
+        # entries: (fingerprint, incident_id, source, occurrences); written in
+        # the caller's transaction, remembered once it commits.
+        now = datetime.utcnow()
+        db.session.execute(insert(correlation_table), [
+            {'fingerprint': fp, 'incident_id': incident_id, 'source': source,
+             'occurrences': occurrences, 'first_seen': now, 'last_seen': now}
+            for fp, incident_id, source, occurrences in entries])
+
+    def remember(self, fp, incident_id):
+        self.index.set(fp, incident_id)
+
+
+def correlator():
+    if not current_app.config['CORRELATION_ENABLED']:
+        return None
+    ext = current_app.extensions.get('itsm_correlator')
+    if ext is None:
+        ext = current_app.extensions['itsm_correlator'] = Correlator(
+            current_app.config['CORRELATION_WINDOW'], current_app.config['CORRELATION_MAX_ENTRIES'])
+    return ext
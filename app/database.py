@@ -0,0 +1,51 @@
+import functools
+import random
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from app import db
+
+
+def configure_engine(app):
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    busy_timeout_ms = int(app.config['SQLITE_BUSY_TIMEOUT'] * 1000)
+    pragmas = dict(app.config['SQLITE_PRAGMAS'])
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout = {busy_timeout_ms}')
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+
+def is_busy_error(exc):
+    message = str(getattr(exc, 'orig', exc)).lower()
+    return isinstance(exc, OperationalError) and ('database is locked' in message or 'database is busy' in message)
+
+
+def retry_on_busy(fn):
+    # Re-runs a unit of work (which must do its own commit) when SQLite reports
+    # the database as locked. The session is rolled back between attempts, so
+    # fn has to re-read whatever it modifies.
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        retries = current_app.config['COMMIT_RETRIES']
+        backoff = current_app.config['COMMIT_RETRY_BACKOFF']
+        for attempt in range(retries + 1):
+            try:
+                return fn(*args, **kwargs)
+            except OperationalError as e:
+                if not is_busy_error(e) or attempt == retries:
+                    raise
+                db.session.rollback()
+                delay = backoff * (2 ** attempt) * (1 + random.random())
+                current_app.logger.warning(f"Database busy in {fn.__name__}, retrying in {delay:.3f}s")
+                time.sleep(delay)
+    return wrapper
@@ -0,0 +1,145 @@
+from datetime import datetime
+from flask import current_app, has_app_context, has_request_context
+from flask_login import current_user
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.models import Incident
+
+# Fields whose changes are reported to listeners. Timestamps are carried in
+# `values` but never reported as changes on their own.
+TRACKED_FIELDS = ('title', 'description', 'category', 'status', 'priority', 'comments',
+                  'user_id', 'assigned_to_id', 'created_at', 'updated_at')
+DIFF_FIELDS = TRACKED_FIELDS[:-2]
+
+_flush_listeners = []
+_commit_listeners = []
+
+
+class IncidentChange:
+    __slots__ = ('action', 'incident_id', 'values', 'previous', 'actor_id')
+
+    def __init__(self, action, incident_id, values, previous=None, actor_id=None):
+        self.action = action            # 'created', 'updated', 'deleted' or 'archived'
+        self.incident_id = incident_id
+        self.values = values            # field -> value after the change
+        self.previous = previous or {}  # field -> value before, changed fields only
+        self.actor_id = actor_id
+
+    def changed(self, field):
+        return field in self.previous
+
+    @property
+    def removed(self):
+        # Gone from the incident table, by deletion or by app.archive
+        return self.action in ('deleted', 'archived')
+
+    def to_dict(self):
+        # JSON-safe form, e.g. for job payloads
+        def plain(values):
+            return {field: value.isoformat() if isinstance(value, datetime) else value
+                    for field, value in values.items()}
+        return {
+            'action': self.action,
+            'incident_id': self.incident_id,
+            'values': plain(self.values),
+            'previous': plain(self.previous),
+            'actor_id': self.actor_id,
+        }
+
+    def __repr__(self):
+        return f'<IncidentChange {self.action} {self.incident_id} {sorted(self.previous)}>'
+
+
+def on_flush(fn):
+    # fn(session, changes) runs inside the writing transaction, so anything it
+    # writes through session.connection() commits or rolls back with the change.
+    _flush_listeners.append(fn)
+    return fn
+
+
+def on_commit(fn):
+    # fn(changes) runs once the transaction has committed; use it for side
+    # effects that must never observe rolled back data.
+    _commit_listeners.append(fn)
+    return fn
+
+
+def notify(session, changes):
+    # Entry point for Core-level bulk writes, which bypass the unit of work and
+    # therefore the flush hook below.
+    if not changes:
+        return
+    for fn in _flush_listeners:
+        fn(session, changes)
+    session.info.setdefault('incident_changes', []).extend(changes)
+
+
+def current_actor_id():
+    if has_request_context() and current_user and current_user.is_authenticated:
+        return current_user.id
+    return None
+
+
+def snapshot(incident):
+    return {field: getattr(incident, field) for field in TRACKED_FIELDS}
+
+
+def _previous_values(incident):
+    state = inspect(incident)
+    previous = {}
+    for field in DIFF_FIELDS:
+        history = state.attrs[field].history
+        if history.added or history.deleted:
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+            if old != new:
+                previous[field] = old
+    return previous
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    # Attribute history still describes the pre-flush state here, while
+    # primary keys and column defaults of new rows are already populated.
+    actor_id = current_actor_id()
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Incident):
+            changes.append(IncidentChange('created', obj.id, snapshot(obj), actor_id=actor_id))
+    for obj in session.dirty:
+        if isinstance(obj, Incident):
+            previous = _previous_values(obj)
+            if previous:
+                changes.append(IncidentChange('updated', obj.id, snapshot(obj), previous, actor_id))
+    for obj in session.deleted:
+        if isinstance(obj, Incident):
+            changes.append(IncidentChange('deleted', obj.id, snapshot(obj), actor_id=actor_id))
+    notify(session, changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    changes = session.info.pop('incident_changes', None)
+    if not changes:
+        return
+    for fn in _commit_listeners:
+        try:
+            fn(changes)
+        except Exception as e:
+            if has_app_context():
+                current_app.logger.error(f"Error in incident commit listener {fn.__name__}: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('incident_changes', None)
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+# Make the tracked attributes load their previous value when assigned, so the
+# history seen at flush time always contains the old value being replaced.
+for _field in DIFF_FIELDS:
+    event.listen(getattr(Incident, _field), 'set', _load_old_value, active_history=True, retval=True)
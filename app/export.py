@@ -0,0 +1,71 @@
+import csv
+import io
+import zlib
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models import Incident
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _values(row, n_fields):
+    return [v.isoformat() if isinstance(v, datetime) else v for v in row[:n_fields]]
+
+
+def _csv_chunks(rows, fields, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for n, row in enumerate(rows, 1):
+        writer.writerow(_values(row, len(fields)))
+        if n % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(rows, fields, chunk_size):
+    dumps = current_app.json.dumps
+    lines = []
+    for row in rows:
+        lines.append(dumps(dict(zip(fields, _values(row, len(fields))))))
+        if len(lines) == chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _rows(query, chunk_size):
+    # Keyset chunks on id (rowid order): each chunk is a short query of its
+    # own, and its read transaction ends before the rows are handed out, so
+    # a slow download never holds a cursor or a read lock between chunks
+    last = 0
+    while True:
+        chunk = query.filter(Incident.id > last).order_by(Incident.id).limit(chunk_size).all()
+        db.session.commit()
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1].id
+
+
+def generate(query, fields, fmt, chunk_size, compress=False):
+    # Yields the export body in pieces of `chunk_size` rows, so neither the
+    # rows nor the output are ever held in full. Ordered by id.
+    chunks = (_csv_chunks if fmt == 'csv' else _ndjson_chunks)(_rows(query, chunk_size), fields, chunk_size)
+    return _gzipped(chunks) if compress else (chunk.encode() for chunk in chunks)
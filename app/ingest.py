@@ -0,0 +1,166 @@
+import json
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import insert
+from app import assignment, db
+from app.database import retry_on_busy
+from app.events import IncidentChange, notify
+from app.models import Incident, User
+
+REQUIRED_FIELDS = ('title', 'description', 'user_id')
+
+
+class IngestError(ValueError):
+    pass
+
+
+def iter_ndjson(stream):
+    # Decodes one JSON document per line without buffering the whole body.
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield IngestError(f"Invalid JSON: {str(e)}")
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _validate(item):
+    if isinstance(item, IngestError):
+        raise item
+    if not isinstance(item, dict):
+        raise IngestError('Each incident must be a JSON object')
+    missing = [f for f in REQUIRED_FIELDS if f not in item]
+    if missing:
+        raise IngestError(f"Must include {', '.join(missing)}")
+    try:
+        user_id = int(item['user_id'])
+    except (TypeError, ValueError):
+        raise IngestError('Invalid user_id')
+    return user_id
+
+
+def _row(item, user_id, now):
+    return {
+        'title': item['title'],
+        'description': item['description'],
+        'category': item.get('category', 'General'),
+        'status': 'Open',
+        'priority': item.get('priority', 'Medium'),
+        'comments': item.get('comments'),
+        'user_id': user_id,
+        'assigned_to_id': None,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+class BulkIngest:
+    def __init__(self, chunk_size=1000, correlator=None):
+        self.chunk_size = chunk_size
+        self.correlator = correlator
+        self.known_users = set()
+        self.created = 0
+        self.correlated = 0
+        self.failed = 0
+
+    def _check_users(self, user_ids):
+        # One set lookup per chunk, skipping ids already seen in earlier chunks.
+        unknown = set(user_ids) - self.known_users
+        if unknown:
+            found = db.session.query(User.id).filter(User.id.in_(unknown))
+            self.known_users.update(user_id for user_id, in found)
+
+    def run(self, items):
+        index = 0
+        for chunk in _chunks(items, self.chunk_size):
+            yield from self._ingest_chunk(index, chunk)
+            index += len(chunk)
+
+    def _ingest_chunk(self, offset, chunk):
+        results = [None] * len(chunk)
+        user_ids = {}
+        for i, item in enumerate(chunk):
+            try:
+                user_ids[i] = _validate(item)
+            except IngestError as e:
+                results[i] = {'index': offset + i, 'status': 'error', 'message': str(e)}
+        self._check_users(user_ids.values())
+
+        now = datetime.utcnow()
+        pending = []
+        for i, user_id in user_ids.items():
+            if user_id not in self.known_users:
+                results[i] = {'index': offset + i, 'status': 'error', 'message': 'User not found'}
+            else:
+                pending.append((i, _row(chunk[i], user_id, now)))
+
+        if pending:
+            try:
+                self._insert(offset, chunk, pending, results)
+            except Exception as e:
+                db.session.rollback()
+                for i, _ in pending:
+                    results[i] = {'index': offset + i, 'status': 'error', 'message': f"Insert failed: {str(e)}"}
+
+        for result in results:
+            if result['status'] == 'error':
+                self.failed += 1
+            elif result['status'] == 'correlated':
+                self.correlated += 1
+            else:
+                self.created += 1
+            yield result
+
+    @retry_on_busy
+    def _insert(self, offset, chunk, pending, results):
+        # Items sharing a fingerprint are grouped: a group either folds into an
+        # open incident found by the correlator, or becomes one new incident
+        # carrying the rest of the group as occurrences. Items without a
+        # fingerprint are never grouped.
+        groups = {}
+        for i, row in pending:
+            fp = self.correlator.fingerprint(chunk[i]) if self.correlator else None
+            groups.setdefault(i if fp is None else fp, (fp, []))[1].append((i, row))
+
+        new_groups = []
+        for fp, members in groups.values():
+            if fp is not None:
+                incident_id = self.correlator.lookup(fp)
+                if incident_id is not None and self.correlator.fold(fp, incident_id, len(members)) is not None:
+                    for i, _ in members:
+                        results[i] = {'index': offset + i, 'status': 'correlated', 'id': incident_id}
+                    continue
+            new_groups.append((fp, members))
+
+        if new_groups:
+            rows = [members[0][1] for _, members in new_groups]
+            if assignment.enabled():
+                for row in rows:
+                    row['assigned_to_id'] = assignment.pick(row['category'])
+            ids = db.session.execute(
+                insert(Incident).returning(Incident.id, sort_by_parameter_order=True), rows).scalars().all()
+            notify(db.session, [IncidentChange('created', incident_id, row)
+                                for incident_id, row in zip(ids, rows)])
+            tracked = [(fp, incident_id, chunk[members[0][0]].get('source'), len(members))
+                       for (fp, members), incident_id in zip(new_groups, ids) if fp is not None]
+            if tracked:
+                self.correlator.track(tracked)
+        db.session.commit()
+
+        for (fp, members), incident_id in zip(new_groups, ids if new_groups else []):
+            if fp is not None:
+                self.correlator.remember(fp, incident_id)
+            for n, (i, _) in enumerate(members):
+                status = 'created' if n == 0 else 'correlated'
+                results[i] = {'index': offset + i, 'status': status, 'id': incident_id}
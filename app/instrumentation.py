@@ -0,0 +1,230 @@
+import bisect
+import threading
+import time
+from flask import Response, current_app, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+from app import db
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.extend(self._samples(labels, value))
+        return lines
+
+    def _samples(self, labels, value):
+        return [f'{self.name}{_labels(labels)} {value}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    # Either set explicitly or computed at scrape time by `fn`, which returns
+    # a number or a {labels tuple: value} dict.
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn=None):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def render(self):
+        if self.fn:
+            value = self.fn()
+            values = value if isinstance(value, dict) else {(): value}
+            with self._lock:
+                self._values = dict(values)
+        return super().render()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self, labels, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{self.name}_bucket{_labels(labels, [("le", le)])} {cumulative}')
+        lines.append(f'{self.name}_sum{_labels(labels)} {total}')
+        lines.append(f'{self.name}_count{_labels(labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    # Metrics exposed on /metrics. Other modules add their own through
+    # registry().counter(...) etc.; asking twice for a name returns the same metric.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, help):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help, fn=None):
+        return self._get(Gauge, name, help, fn=fn)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def registry(app=None):
+    app = app or current_app
+    ext = app.extensions.get('itsm_metrics')
+    if ext is None:
+        ext = app.extensions['itsm_metrics'] = Registry()
+    return ext
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def init_app(app):
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+    metrics = registry(app)
+    requests_total = metrics.counter('itsm_http_requests_total', 'HTTP requests by endpoint, method and status.')
+    request_seconds = metrics.histogram('itsm_http_request_duration_seconds', 'Request wall time by endpoint.')
+    sql_queries = metrics.counter('itsm_sql_queries_total', 'SQL statements executed, by endpoint.')
+    sql_seconds = metrics.counter('itsm_sql_duration_seconds_total', 'Time spent in SQL, by endpoint.')
+    template_sql = metrics.counter('itsm_template_sql_queries_total',
+                                   'SQL statements issued while rendering templates (lazy loads).')
+    template_seconds = metrics.histogram('itsm_template_render_seconds', 'Template render time by template.')
+    slow_queries = metrics.counter('itsm_slow_queries_total', 'SQL statements slower than SLOW_QUERY_THRESHOLD.')
+    slow_query_s = app.config['SLOW_QUERY_THRESHOLD'] / 1000
+    slow_request_s = app.config['SLOW_REQUEST_THRESHOLD'] / 1000
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('itsm_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['itsm_query_start'].pop()
+        endpoint = 'background'
+        if has_request_context() and 'itsm_timing' in g:
+            timing = g.itsm_timing
+            timing['sql_count'] += 1
+            timing['sql_seconds'] += elapsed
+            if timing['rendering']:
+                timing['template_sql_count'] += 1
+                template_sql.inc(endpoint=_endpoint())
+            endpoint = _endpoint()
+        sql_queries.inc(endpoint=endpoint)
+        sql_seconds.inc(elapsed, endpoint=endpoint)
+        if elapsed >= slow_query_s:
+            slow_queries.inc(endpoint=endpoint)
+            app.logger.warning(f"Slow query ({elapsed * 1000:.1f} ms) in {endpoint}: {' '.join(statement.split())[:1000]}")
+
+    @before_render_template.connect_via(app)
+    def _before_render(sender, template, context, **extra):
+        if 'itsm_timing' in g:
+            g.itsm_timing['rendering'] += 1
+            g.itsm_timing['render_start'].append(time.perf_counter())
+
+    @template_rendered.connect_via(app)
+    def _rendered(sender, template, context, **extra):
+        if 'itsm_timing' in g and g.itsm_timing['render_start']:
+            elapsed = time.perf_counter() - g.itsm_timing['render_start'].pop()
+            g.itsm_timing['rendering'] -= 1
+            g.itsm_timing['template_seconds'] += elapsed
+            template_seconds.observe(elapsed, template=template.name or 'string')
+
+    @app.before_request
+    def _start_timing():
+        g.itsm_timing = {'start': time.perf_counter(), 'sql_count': 0, 'sql_seconds': 0.0,
+                         'template_sql_count': 0, 'template_seconds': 0.0, 'rendering': 0, 'render_start': []}
+
+    @app.after_request
+    def _record_timing(response):
+        timing = g.pop('itsm_timing', None)
+        if timing is None:
+            return response
+        elapsed = time.perf_counter() - timing['start']
+        endpoint = _endpoint()
+        requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        request_seconds.observe(elapsed, endpoint=endpoint)
+        # Streamed bodies are produced after this point and are not included.
+        response.headers['Server-Timing'] = ', '.join([
+            f'app;dur={elapsed * 1000:.1f}',
+            f'db;dur={timing["sql_seconds"] * 1000:.1f};desc="{timing["sql_count"]} queries"',
+            f'tpl;dur={timing["template_seconds"] * 1000:.1f};desc="{timing["template_sql_count"]} queries"',
+        ])
+        if elapsed >= slow_request_s:
+            app.logger.warning(
+                f"Slow request {request.method} {request.full_path} ({elapsed * 1000:.1f} ms): "
+                f"{timing['sql_count']} queries in {timing['sql_seconds'] * 1000:.1f} ms, "
+                f"templates {timing['template_seconds'] * 1000:.1f} ms "
+                f"({timing['template_sql_count']} queries while rendering)")
+        return response
+
+    def metrics_view():
+        return Response(registry().render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,329 @@
+import json
+import multiprocessing
+import os
+import queue
+import random
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, update
+from app import db
+from app.database import retry_on_busy
+from app.events import on_flush
+from app.instrumentation import registry
+from app.models import Job
+
+job_table = Job.__table__
+c = job_table.c
+
+# Claimable statuses: queued jobs once run_at has passed, running jobs once
+# their lease (run_at) has expired
+READY_STATUSES = ('queued', 'running')
+
+_handlers = {}
+_change_jobs = []
+
+
+class ClaimedJob:
+    __slots__ = ('id', 'name', 'payload', 'attempts', 'max_attempts', 'latency')
+
+    def __init__(self, id, name, payload, attempts, max_attempts, latency):
+        self.id = id
+        self.name = name
+        self.payload = payload
+        self.attempts = attempts            # including this one
+        self.max_attempts = max_attempts
+        self.latency = latency              # seconds between ready and claimed
+
+
+def handler(name, max_attempts=None):
+    # Registers fn(payload) as the handler of job `name`. It runs in a worker
+    # process inside an app context; raising schedules a retry.
+    def register(fn):
+        _handlers[name] = (fn, max_attempts)
+        return fn
+    return register
+
+
+def for_changes(name, accept=None):
+    # Enqueues job `name` in the transaction of every incident write, with
+    # the changes accept(change) is true for as payload['changes'].
+    _change_jobs.append((name, accept))
+
+
+def enqueue(name, payload, session=None, delay=0, max_attempts=None):
+    # Adds the job in the session's transaction, so it only exists if that
+    # commits. The caller commits.
+    session = session or db.session
+    now = datetime.utcnow()
+    default_attempts = _handlers.get(name, (None, None))[1]
+    session.connection().execute(insert(job_table).values(
+        name=name, payload=json.dumps(payload), status='queued', attempts=0,
+        max_attempts=max_attempts or default_attempts or current_app.config['JOBS_MAX_ATTEMPTS'],
+        run_at=now + timedelta(seconds=delay), created_at=now))
+
+
+@on_flush
+def _enqueue_change_jobs(session, changes):
+    for name, accept in _change_jobs:
+        selected = [change.to_dict() for change in changes if accept is None or accept(change)]
+        if selected:
+            enqueue(name, {'changes': selected}, session=session)
+
+
+@retry_on_busy
+def claim(limit, lease):
+    # Marks up to `limit` ready jobs as running for `lease` seconds. Ready
+    # ids are read first, so an idle poll never takes the write lock; the
+    # UPDATE re-checks readiness, so of two workers reading the same ids
+    # only the first to write gets them.
+    now = datetime.utcnow()
+    ready = (c.status.in_(READY_STATUSES), c.run_at <= now)
+    ready_at = dict(db.session.execute(select(c.id, c.run_at).where(*ready).order_by(c.run_at).limit(limit)).all())
+    db.session.commit()
+    if not ready_at:
+        return []
+    rows = db.session.execute(
+        update(job_table).where(c.id.in_(list(ready_at)), *ready)
+        .values(status='running', attempts=c.attempts + 1, started_at=now, run_at=now + timedelta(seconds=lease))
+        .returning(c.id, c.name, c.payload, c.attempts, c.max_attempts)).all()
+    db.session.commit()
+    return [ClaimedJob(row.id, row.name, row.payload, row.attempts, row.max_attempts,
+                       (now - ready_at[row.id]).total_seconds()) for row in rows]
+
+
+def _backoff(attempts):
+    config = current_app.config
+    return min(config['JOBS_BACKOFF'] * 2 ** (attempts - 1), config['JOBS_BACKOFF_MAX']) * (1 + random.random() / 2)
+
+
+def _outcome(job, error=None, retry=True):
+    now = datetime.utcnow()
+    if error is None:
+        return 'done', {'status': 'done', 'finished_at': now, 'last_error': None}
+    if retry and job.attempts < job.max_attempts:
+        return 'retry', {'status': 'queued', 'run_at': now + timedelta(seconds=_backoff(job.attempts)),
+                         'last_error': error}
+    return 'dead', {'status': 'dead', 'finished_at': now, 'last_error': error}
+
+
+@retry_on_busy
+def _store(results):
+    # Outcomes of a batch in one transaction. A job whose lease expired and
+    # was claimed again meanwhile (attempts moved on) is left to its new owner.
+    for job, values in results:
+        db.session.execute(update(job_table).where(c.id == job.id, c.attempts == job.attempts).values(values))
+    db.session.commit()
+
+
+def run_batch(jobs):
+    # Runs claimed jobs one after the other, each handler committing on its
+    # own, and returns (job, outcome, run seconds) for each
+    results, reports = [], []
+    for job in jobs:
+        started = time.perf_counter()
+        fn = _handlers.get(job.name, (None, None))[0]
+        if fn is None:
+            current_app.logger.error(f"No handler for job {job.id} ({job.name})")
+            outcome = _outcome(job, f'No handler for {job.name}', retry=False)
+        else:
+            try:
+                fn(json.loads(job.payload))
+                db.session.commit()
+                outcome = _outcome(job)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.warning(f"Job {job.id} ({job.name}) failed on attempt {job.attempts}: {str(e)}")
+                outcome = _outcome(job, f'{type(e).__name__}: {e}')
+        results.append((job, outcome[1]))
+        reports.append((job, outcome[0], time.perf_counter() - started))
+    if results:
+        _store(results)
+    return reports
+
+
+def work(stop, report, batch_size=None, poll_interval=None, lease=None):
+    # Claims and runs jobs until `stop` (an Event) is set, calling
+    # report(name, outcome, queue latency, run seconds) for each job.
+    config = current_app.config
+    batch_size = batch_size or config['JOBS_BATCH_SIZE']
+    poll_interval = poll_interval or config['JOBS_POLL_INTERVAL']
+    lease = lease or config['JOBS_LEASE']
+    while not stop.is_set():
+        jobs = []
+        try:
+            jobs = claim(batch_size, lease)
+            for job, outcome, seconds in run_batch(jobs):
+                report(job.name, outcome, job.latency, seconds)
+        except Exception as e:
+            current_app.logger.error(f"Job worker {os.getpid()} error: {str(e)}")
+        finally:
+            db.session.remove()
+        if len(jobs) < batch_size:
+            stop.wait(poll_interval)
+
+
+def run_pending(limit=None):
+    # Runs the jobs that are ready now in this process, e.g. from cron or
+    # tests, and returns the number of each outcome
+    config = current_app.config
+    outcomes = {}
+    processed = 0
+    while limit is None or processed < limit:
+        size = config['JOBS_BATCH_SIZE'] if limit is None else min(config['JOBS_BATCH_SIZE'], limit - processed)
+        jobs = claim(size, config['JOBS_LEASE'])
+        if not jobs:
+            break
+        for job, outcome, seconds in run_batch(jobs):
+            _record(current_app, job.name, outcome, job.latency, seconds)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        processed += len(jobs)
+    return outcomes
+
+
+def _record(app, name, outcome, latency, seconds):
+    metrics = registry(app)
+    metrics.counter('itsm_jobs_processed_total', 'Jobs run by workers, by name and outcome.').inc(
+        name=name, outcome=outcome)
+    metrics.histogram('itsm_job_queue_latency_seconds', 'Time from ready to claimed, by job name.').observe(
+        latency, name=name)
+    metrics.histogram('itsm_job_run_seconds', 'Job run time, by job name.').observe(seconds, name=name)
+
+
+def _serve(app, stop, reports, options):
+    # One worker: JOBS_THREADS threads running work(), each with its own app
+    # context and so its own session, so jobs waiting on I/O overlap
+    def loop():
+        with app.app_context():
+            work(stop, lambda *report: reports.put(report), **options)
+
+    threads = [threading.Thread(target=loop, name=f'itsm-job-thread-{n}', daemon=True)
+               for n in range(app.config['JOBS_THREADS'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _child(config, stop, reports, options):
+    # Entry point of a pool process: a fresh app (no scheduler)
+    from app import create_app
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    _serve(create_app(type('WorkerConfig', (), dict(config, SCHEDULER_ENABLED=False))), stop, reports, options)
+
+
+def serve_metrics(app, port, host='127.0.0.1'):
+    # Exposes the worker's registry on http://host:port/ for scraping
+    from werkzeug.serving import make_server
+
+    def metrics_app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4')])
+        return [registry(app).render().encode()]
+
+    server = make_server(host, port, metrics_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='itsm-jobs-metrics', daemon=True).start()
+    return server
+
+
+def run_workers(processes, stats_interval=60, **options):
+    # Runs `processes` worker processes (a thread of this one when 1) until
+    # SIGINT/SIGTERM, restarting any that die. Their per-job reports become
+    # metrics here and are summarized in the log every `stats_interval` seconds.
+    app = current_app._get_current_object()
+    if processes > 1:
+        context = multiprocessing.get_context('spawn')
+        stop, reports = context.Event(), context.Queue()
+        config = {key: value for key, value in app.config.items() if key.isupper()}
+        target, args = context.Process, (_child, (config, stop, reports, options))
+    else:
+        stop, reports = threading.Event(), queue.Queue()
+        target, args = threading.Thread, (_serve, (app, stop, reports, options))
+
+    def start():
+        worker = target(target=args[0], args=args[1], name='itsm-job-worker')
+        worker.start()
+        return worker
+
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    pool = [start() for _ in range(max(processes, 1))]
+    app.logger.info(f"Job workers started: {len(pool)}")
+    done, latency, last_summary = 0, 0.0, time.monotonic()
+    try:
+        while not stop.is_set():
+            try:
+                name, outcome, queue_latency, seconds = reports.get(timeout=1)
+                _record(app, name, outcome, queue_latency, seconds)
+                done += 1
+                latency += queue_latency
+            except queue.Empty:
+                pass
+            for i, worker in enumerate(pool):
+                if not worker.is_alive() and not stop.is_set():
+                    app.logger.error(f"Job worker {worker.name} died, restarting")
+                    pool[i] = start()
+            elapsed = time.monotonic() - last_summary
+            if elapsed >= stats_interval:
+                if done:
+                    app.logger.info(f"Jobs: {done} processed ({done / elapsed:.1f}/s), "
+                                    f"mean queue latency {latency / done * 1000:.0f} ms")
+                done, latency, last_summary = 0, 0.0, time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        # Keep reading while the workers finish their batch: a process exits
+        # only once everything it queued has been read
+        while any(worker.is_alive() for worker in pool) or not reports.empty():
+            try:
+                _record(app, *reports.get(timeout=0.1))
+            except queue.Empty:
+                pass
+        for worker in pool:
+            worker.join()
+    app.logger.info('Job workers stopped')
+
+
+def counts():
+    return dict(db.session.query(Job.status, func.count()).group_by(Job.status).all())
+
+
+def ready_lag():
+    # Seconds the oldest ready job has been waiting for a worker
+    oldest = db.session.query(func.min(Job.run_at)).filter(Job.status == 'queued',
+                                                           Job.run_at <= datetime.utcnow()).scalar()
+    return (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+
+
+def retry_dead(ids=None):
+    # Requeues dead jobs (all, or the given ids) for another max_attempts round
+    query = update(job_table).where(c.status == 'dead')
+    if ids:
+        query = query.where(c.id.in_(ids))
+    result = db.session.execute(query.values(status='queued', attempts=0, run_at=datetime.utcnow(),
+                                             finished_at=None))
+    db.session.commit()
+    return result.rowcount
+
+
+def prune(retention=None):
+    # Deletes jobs that finished successfully more than `retention` seconds
+    # ago; dead jobs stay for inspection
+    retention = current_app.config['JOBS_RETENTION'] if retention is None else retention
+    result = db.session.execute(delete(job_table).where(
+        c.status == 'done', c.finished_at < datetime.utcnow() - timedelta(seconds=retention)))
+    db.session.commit()
+    return result.rowcount
+
+
+def init_app(app):
+    # Queue depth and lag on the web app's /metrics; worker throughput and
+    # latency are exposed by the worker pool itself (--metrics-port)
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+    metrics = registry(app)
+    metrics.gauge('itsm_jobs', 'Jobs in the queue table, by status.',
+                  fn=lambda: {(('status', status),): count for status, count in counts().items()})
+    metrics.gauge('itsm_jobs_ready_lag_seconds', 'Age of the oldest job waiting for a worker.', fn=ready_lag)
@@ -1,7 +1,7 @@
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
-from app import db, login
+from app import db
+from app.passwords import hash_password, needs_rehash, verify_password
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -15,18 +15,17 @@ class User(UserMixin, db.Model):
     incidents_assigned = db.relationship('Incident', backref='assignee', lazy='dynamic', foreign_keys='Incident.assigned_to_id')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.username}>'
 
-@login.user_loader
-def load_user(id):
-    return User.query.get(int(id))
-
 class Incident(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(140))
@@ -41,6 +40,18 @@ class Incident(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     assigned_to_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
 
+    # Matched to the dashboard filters, which all sort by created_at desc, and
+    # to the GROUP BY columns of the admin stats (served from the leading column).
+    __table_args__ = (
+        db.Index('ix_incident_status_created_at', 'status', 'created_at'),
+        db.Index('ix_incident_status_priority_category_created_at', 'status', 'priority', 'category', 'created_at'),
+        db.Index('ix_incident_priority_created_at', 'priority', 'created_at'),
+        db.Index('ix_incident_category_created_at', 'category', 'created_at'),
+        db.Index('ix_incident_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_incident_assigned_to_id_created_at', 'assigned_to_id', 'created_at'),
+        db.Index('ix_incident_updated_at', 'updated_at'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -58,3 +69,256 @@ class Incident(db.Model):
 
     def __repr__(self):
         return f'<Incident {self.title}>'
+
+class IncidentStat(db.Model):
+    # Materialized dashboard counters, maintained by app.stats
+    dimension = db.Column(db.String(20), primary_key=True) # total, priority, status, category, agent, author
+    key = db.Column(db.String(64), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<IncidentStat {self.dimension}:{self.key}={self.count}>'
+
+class IncidentFeed(db.Model):
+    # Position of each live incident in the change feed, maintained by
+    # app.changes: its last change's sequence number, allocated in commit order
+    incident_id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.Index('ix_incident_feed_seq', 'seq', unique=True),)
+
+    def __repr__(self):
+        return f'<IncidentFeed {self.incident_id}@{self.seq}>'
+
+class IncidentCorrelation(db.Model):
+    # Alert fingerprints folded into an existing incident by app.correlation
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(40), nullable=False)
+    incident_id = db.Column(db.Integer, db.ForeignKey('incident.id'), nullable=False, index=True)
+    source = db.Column(db.String(64))
+    occurrences = db.Column(db.Integer, nullable=False, default=1)
+    first_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_incident_correlation_fingerprint_last_seen', 'fingerprint', 'last_seen'),)
+
+    def __repr__(self):
+        return f'<IncidentCorrelation {self.fingerprint} -> {self.incident_id} x{self.occurrences}>'
+
+class IncidentSla(db.Model):
+    # Due dates per incident, maintained by app.sla. NULL breach timestamps
+    # mean the sweeper has not (yet) flagged a breach.
+    incident_id = db.Column(db.Integer, primary_key=True)
+    priority = db.Column(db.String(20))
+    response_due = db.Column(db.DateTime, nullable=False)
+    resolve_due = db.Column(db.DateTime, nullable=False)
+    responded_at = db.Column(db.DateTime)
+    resolved_at = db.Column(db.DateTime)
+    response_breached_at = db.Column(db.DateTime)
+    resolve_breached_at = db.Column(db.DateTime)
+
+    # Pending targets sorted by due date: the sweeper and the report read
+    # index ranges instead of scanning open incidents.
+    __table_args__ = (
+        db.Index('ix_incident_sla_response_pending', 'responded_at', 'response_breached_at', 'response_due'),
+        db.Index('ix_incident_sla_resolve_pending', 'resolved_at', 'resolve_breached_at', 'resolve_due'),
+    )
+
+    def to_dict(self):
+        return {
+            'incident_id': self.incident_id,
+            'priority': self.priority,
+            'response_due': self.response_due.isoformat(),
+            'resolve_due': self.resolve_due.isoformat(),
+            'responded_at': self.responded_at.isoformat() if self.responded_at else None,
+            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None,
+            'response_breached_at': self.response_breached_at.isoformat() if self.response_breached_at else None,
+            'resolve_breached_at': self.resolve_breached_at.isoformat() if self.resolve_breached_at else None,
+        }
+
+    def __repr__(self):
+        return f'<IncidentSla {self.incident_id} resolve by {self.resolve_due}>'
+
+class IncidentDaily(db.Model):
+    # Daily rollups of incident events, maintained by app.rollups. A row
+    # counts the incidents that were created or moved into a status on `day`
+    # (UTC) with the given category and priority at that moment.
+    # Resolutions carry the open time for MTTR.
+    day = db.Column(db.Date, primary_key=True)
+    transition = db.Column(db.String(20), primary_key=True) # created, reopened, in_progress, resolved, closed
+    category = db.Column(db.String(50), primary_key=True)
+    priority = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    resolutions = db.Column(db.Integer, nullable=False, default=0)
+    resolve_seconds = db.Column(db.Float, nullable=False, default=0)
+    # Rows are stored in primary key order, so a date range is one
+    # sequential read without a rowid lookup per row
+    __table_args__ = ({'sqlite_with_rowid': False},)
+
+    def __repr__(self):
+        return f'<IncidentDaily {self.day} {self.transition} {self.category}/{self.priority}={self.count}>'
+
+class IncidentDailyAgent(db.Model):
+    # The same rollups per assignee (0 = unassigned). Kept apart from
+    # IncidentDaily so neither grows with the product of all dimensions.
+    day = db.Column(db.Date, primary_key=True)
+    transition = db.Column(db.String(20), primary_key=True)
+    agent_id = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    resolutions = db.Column(db.Integer, nullable=False, default=0)
+    resolve_seconds = db.Column(db.Float, nullable=False, default=0)
+    __table_args__ = ({'sqlite_with_rowid': False},)
+
+    def __repr__(self):
+        return f'<IncidentDailyAgent {self.day} {self.transition} {self.agent_id}={self.count}>'
+
+class IncidentArchive(db.Model):
+    # Resolved/Closed incidents moved out of the incident table by app.archive.
+    # Ids are kept, so archived incidents are still found by id.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(140))
+    description = db.Column(db.Text)
+    category = db.Column(db.String(50))
+    status = db.Column(db.String(20))
+    priority = db.Column(db.String(20))
+    comments = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    assigned_to_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    archived_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+
+    author = db.relationship('User', foreign_keys=[user_id])
+    assignee = db.relationship('User', foreign_keys=[assigned_to_id])
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'category': self.category,
+            'status': self.status,
+            'priority': self.priority,
+            'comments': self.comments,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'created_by': self.author.username if self.author else None,
+            'assigned_to': self.assignee.username if self.assignee else None,
+            'archived_at': self.archived_at.isoformat(),
+        }
+
+    def __repr__(self):
+        return f'<IncidentArchive {self.title}>'
+
+class IncidentEvent(db.Model):
+    # Field-level change history, written asynchronously by app.audit.
+    # incident_id deliberately has no foreign key so history outlives the row.
+    id = db.Column(db.Integer, primary_key=True)
+    incident_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(20), nullable=False) # created, updated, deleted
+    field = db.Column(db.String(50))
+    old_value = db.Column(db.Text)
+    new_value = db.Column(db.Text)
+    actor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    actor = db.relationship('User', foreign_keys=[actor_id])
+
+    __table_args__ = (db.Index('ix_incident_event_incident_id_created_at', 'incident_id', 'created_at'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'incident_id': self.incident_id,
+            'action': self.action,
+            'field': self.field,
+            'old_value': self.old_value,
+            'new_value': self.new_value,
+            'actor': self.actor.username if self.actor else None,
+            'created_at': self.created_at.isoformat(),
+        }
+
+    def __repr__(self):
+        return f'<IncidentEvent {self.incident_id} {self.action} {self.field}>'
+
+class Job(db.Model):
+    # Background job queue, served by `flask jobs worker` (app.jobs). A job
+    # is ready when queued and run_at has passed; while running, run_at is
+    # the end of the worker's lease, after which another worker takes it over.
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False) # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued, running, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_at': self.run_at.isoformat(),
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'last_error': self.last_error,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+class WebhookSubscription(db.Model):
+    # An endpoint notified of incident events by app.webhooks. Events are
+    # sent in batches, at most one per batch_window seconds. delivery_due is
+    # set while a delivery job is queued, so further events join that batch.
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), nullable=False)
+    events = db.Column(db.String(200), nullable=False, default='*') # comma separated, '*' for all
+    secret = db.Column(db.String(200)) # signs bodies with HMAC-SHA256 when set
+    batch_window = db.Column(db.Float, nullable=False)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivery_due = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'url': self.url,
+            'events': self.events,
+            'signed': bool(self.secret),
+            'batch_window': self.batch_window,
+            'active': self.active,
+            'created_at': self.created_at.isoformat(),
+        }
+
+    def __repr__(self):
+        return f'<WebhookSubscription {self.id} {self.url}>'
+
+class WebhookEvent(db.Model):
+    # Outbox of webhook events, one row per subscription and event. Written
+    # in the transaction of the incident change; status is pending until
+    # delivered (sent) or out of attempts (dead).
+    id = db.Column(db.Integer, primary_key=True)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('webhook_subscription.id'), nullable=False)
+    event = db.Column(db.String(50), nullable=False)
+    incident_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False) # JSON
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, sent, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    __table_args__ = (db.Index('ix_webhook_event_subscription_id_status_id', 'subscription_id', 'status', 'id'),)
+
+    def __repr__(self):
+        return f'<WebhookEvent {self.id} {self.event} {self.status}>'
@@ -0,0 +1,85 @@
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from flask import current_app, has_app_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class HashPoolBusy(RuntimeError):
+    pass
+
+
+def hash_method():
+    if has_app_context():
+        return current_app.config['PASSWORD_HASH_METHOD']
+    return DEFAULT_METHOD
+
+
+@lru_cache(maxsize=16)
+def _canonical(method):
+    # Werkzeug fills in default parameters ('pbkdf2' -> 'pbkdf2:sha256:600000');
+    # compare stored hashes against the fully expanded form.
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=hash_method())
+
+
+def needs_rehash(pwhash):
+    return not pwhash or pwhash.split('$', 1)[0] != _canonical(hash_method())
+
+
+class HashPool:
+    # Runs key derivation on a small fixed set of threads (hashlib releases the
+    # GIL while hashing). At most `workers` hashes run at once and at most
+    # `max_pending` wait, so a login burst cannot take every CPU from the
+    # requests being served alongside it.
+
+    def __init__(self, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='itsm-pwhash')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def submit(self, fn, *args, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise HashPoolBusy('Password hashing pool is saturated')
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def run(self, fn, *args, timeout=None):
+        return self.submit(fn, *args, timeout=timeout).result()
+
+
+def pool():
+    ext = current_app.extensions.get('itsm_hash_pool')
+    if ext is None:
+        ext = current_app.extensions['itsm_hash_pool'] = HashPool(
+            current_app.config['PASSWORD_HASH_WORKERS'], current_app.config['PASSWORD_HASH_MAX_PENDING'])
+        atexit.register(ext.executor.shutdown, wait=False)
+    return ext
+
+
+def verify_password(pwhash, password):
+    if not pwhash:
+        return False
+    if not has_app_context():
+        return check_password_hash(pwhash, password)
+    return pool().run(check_password_hash, pwhash, password,
+                      timeout=current_app.config['PASSWORD_HASH_QUEUE_TIMEOUT'])
+
+
+def hash_many(passwords):
+    # Hashes a batch in parallel on the pool, e.g. when provisioning users.
+    if not has_app_context():
+        return [hash_password(p) for p in passwords]
+    method = hash_method()
+    futures = [pool().submit(generate_password_hash, p, method) for p in passwords]
+    return [f.result() for f in futures]
@@ -0,0 +1,130 @@
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
+from app.models import Incident
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _parse_datetime(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"Invalid {name}: expected an ISO 8601 timestamp")
+
+
+def _split(value):
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def with_users(query):
+    # Loads author and assignee in the same SELECT so serializing or rendering
+    # a page never falls back to one lazy user lookup per row.
+    return query.options(joinedload(Incident.author), joinedload(Incident.assignee))
+
+
+def apply_filters(query, args):
+    # Equality filters accept a comma separated list, e.g. ?status=Open,In Progress
+    for name, column in (('status', Incident.status),
+                         ('priority', Incident.priority),
+                         ('category', Incident.category)):
+        values = _split(args.get(name, ''))
+        if len(values) == 1:
+            query = query.filter(column == values[0])
+        elif values:
+            query = query.filter(column.in_(values))
+
+    user_id = args.get('user_id', '')
+    if user_id:
+        try:
+            query = query.filter(Incident.user_id == int(user_id))
+        except ValueError:
+            raise QueryError('Invalid user_id')
+
+    assigned_to_id = args.get('assigned_to_id', '')
+    if assigned_to_id == 'none':
+        query = query.filter(Incident.assigned_to_id.is_(None))
+    elif assigned_to_id:
+        try:
+            query = query.filter(Incident.assigned_to_id == int(assigned_to_id))
+        except ValueError:
+            raise QueryError("Invalid assigned_to_id: expected an id or 'none'")
+
+    updated_since = args.get('updated_since', '')
+    if updated_since:
+        query = query.filter(Incident.updated_at >= _parse_datetime(updated_since, 'updated_since'))
+
+    # Creation date range, end exclusive
+    created_from = args.get('created_from', '')
+    if created_from:
+        query = query.filter(Incident.created_at >= _parse_datetime(created_from, 'created_from'))
+    created_to = args.get('created_to', '')
+    if created_to:
+        query = query.filter(Incident.created_at < _parse_datetime(created_to, 'created_to'))
+
+    return query
+
+
+def page_size(args):
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise QueryError('Invalid limit')
+    if limit < 1:
+        raise QueryError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_key(timestamp, incident_id):
+    raw = f"{timestamp.isoformat()}|{incident_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def sort_key(args):
+    # Incremental syncs (updated_since) page in (updated_at, id) order, so
+    # each page seeks straight into ix_incident_updated_at instead of
+    # walking the whole creation order for the few rows that changed
+    return 'updated_at' if args.get('updated_since') else 'created_at'
+
+
+def encode_cursor(incident, key='created_at'):
+    return encode_key(getattr(incident, key), incident.id)
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, incident_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(incident_id)
+    except (ValueError, UnicodeDecodeError):
+        raise QueryError('Invalid cursor')
+
+
+def keyset_page(query, cursor=None, limit=DEFAULT_PAGE_SIZE, key='created_at'):
+    # Keyset pagination on (key, id), key being created_at or updated_at:
+    # each page is an index range scan starting right after the last row of
+    # the previous page, so deep pages cost the same as the first one.
+    column = getattr(Incident, key)
+    if cursor:
+        timestamp, incident_id = decode_cursor(cursor)
+        query = query.filter(or_(column > timestamp, and_(column == timestamp, Incident.id > incident_id)))
+    return query.order_by(column.asc(), Incident.id.asc()).limit(limit)
+
+
+def iter_keyset(query, cursor=None, chunk_size=DEFAULT_PAGE_SIZE, key='created_at'):
+    # Walks the whole result set one keyset page at a time. Only a single
+    # chunk is alive at once, so memory stays flat regardless of table size.
+    while True:
+        chunk = keyset_page(query, cursor, chunk_size, key).all()
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        cursor = encode_cursor(chunk[-1], key)
@@ -0,0 +1,193 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from sqlalchemy import case, delete, func, insert, literal, select, union_all, update
+from app import db
+from app.events import on_flush
+from app.models import Incident, IncidentArchive, IncidentDaily, IncidentDailyAgent, User
+from app.queries import QueryError
+from app.sla import RESOLVED_STATUSES
+from app.stats import OPEN_STATUSES
+
+daily_table = IncidentDaily.__table__
+agent_table = IncidentDailyAgent.__table__
+
+CREATED = 'created'
+# Transition recorded when an incident moves into a status
+TRANSITIONS = {
+    'Open': 'reopened',
+    'In Progress': 'in_progress',
+    'Resolved': 'resolved',
+    'Closed': 'closed',
+}
+# Rollup table -> the dimensions it is keyed by after day and transition
+ROLLUPS = {
+    daily_table: ('category', 'priority'),
+    agent_table: ('agent_id',),
+}
+# group_by / filter name -> rollup column
+GROUPS = {
+    'category': daily_table.c.category,
+    'priority': daily_table.c.priority,
+    'agent': agent_table.c.agent_id,
+}
+MAX_DAYS = 366
+
+
+def _transition(status):
+    return TRANSITIONS.get(status) or (status or 'none').lower().replace(' ', '_')
+
+
+def _dimensions(values):
+    return {
+        'category': values['category'] or 'General',
+        'priority': values['priority'] or 'Medium',
+        'agent_id': values['assigned_to_id'] or 0,
+    }
+
+
+def _deltas(changes):
+    # table -> (day, transition, *dimensions) -> [count, resolutions, resolve seconds]
+    deltas = {table: defaultdict(lambda: [0, 0, 0.0]) for table in ROLLUPS}
+
+    def add(day, transition, values, resolved_after=None):
+        dimensions = _dimensions(values)
+        for table, names in ROLLUPS.items():
+            row = deltas[table][(day, transition) + tuple(dimensions[name] for name in names)]
+            row[0] += 1
+            if resolved_after is not None:
+                row[1] += 1
+                row[2] += resolved_after
+
+    for change in changes:
+        values = change.values
+        if change.action == CREATED:
+            add((values['created_at'] or datetime.utcnow()).date(), CREATED, values)
+        elif change.action == 'updated' and change.changed('status'):
+            when = values['updated_at'] or datetime.utcnow()
+            resolved_after = None
+            if change.previous['status'] in OPEN_STATUSES and values['status'] in RESOLVED_STATUSES:
+                resolved_after = max((when - values['created_at']).total_seconds(), 0)
+            add(when.date(), _transition(values['status']), values, resolved_after)
+        # Deletions and archival don't rewrite history
+    return {table: rows for table, rows in deltas.items() if rows}
+
+
+def apply_deltas(connection, deltas):
+    for table, rows in deltas.items():
+        columns = ('day', 'transition') + ROLLUPS[table]
+        c = table.c
+        for key, (count, resolutions, seconds) in rows.items():
+            result = connection.execute(
+                update(table).where(*[c[name] == value for name, value in zip(columns, key)])
+                .values(count=c.count + count, resolutions=c.resolutions + resolutions,
+                        resolve_seconds=c.resolve_seconds + seconds))
+            if result.rowcount == 0:
+                connection.execute(insert(table).values(
+                    dict(zip(columns, key), count=count, resolutions=resolutions, resolve_seconds=seconds)))
+
+
+@on_flush
+def _update_rollups(session, changes):
+    deltas = _deltas(changes)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def _events(model):
+    # One row per creation and, unless still Open, one for the move into
+    # the current status at updated_at
+    status = model.status
+    transition = case(*[(status == s, t) for s, t in TRANSITIONS.items()],
+                      else_=func.lower(func.replace(status, ' ', '_')))
+    resolved = status.in_(RESOLVED_STATUSES)
+    dimensions = [func.coalesce(model.category, 'General').label('category'),
+                  func.coalesce(model.priority, 'Medium').label('priority'),
+                  func.coalesce(model.assigned_to_id, 0).label('agent_id')]
+    created = select(func.date(model.created_at).label('day'), literal(CREATED).label('transition'), *dimensions,
+                     literal(0).label('resolved'), literal(0.0).label('seconds'))
+    moved = (select(func.date(model.updated_at), transition, *dimensions,
+                    case((resolved, 1), else_=0),
+                    case((resolved, (func.julianday(model.updated_at) - func.julianday(model.created_at)) * 86400),
+                         else_=0.0))
+             .where(status != 'Open'))
+    return [created, moved]
+
+
+def backfill():
+    # Rebuilds every rollup from the incident and archive tables. Only the
+    # current state is known there, so each incident counts as created plus,
+    # unless still Open, moved into its current status at updated_at.
+    # Exact from then on, as the flush hook records every transition.
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('Rollup backfill requires SQLite')
+    events = union_all(*_events(Incident), *_events(IncidentArchive)).subquery()
+    total = 0
+    for table, names in ROLLUPS.items():
+        keys = [events.c.day, events.c.transition] + [events.c[name] for name in names]
+        grouped = (select(*keys, func.count(), func.sum(events.c.resolved), func.sum(events.c.seconds))
+                   .group_by(*keys))
+        db.session.execute(delete(table))
+        result = db.session.execute(insert(table).from_select(
+            ['day', 'transition', *names, 'count', 'resolutions', 'resolve_seconds'], grouped))
+        total += result.rowcount
+    db.session.commit()
+    return total
+
+
+def timeseries(days=90, group_by=None, filters=None, today=None):
+    # Per-day volumes by transition and MTTR, zero-filled, optionally split
+    # by category, priority or agent. Reads only the rollup rows of the window.
+    filters = filters or {}
+    if not 1 <= days <= MAX_DAYS:
+        raise QueryError(f"days must be between 1 and {MAX_DAYS}")
+    if group_by is not None and group_by not in GROUPS:
+        raise QueryError(f"Unknown group_by: {group_by}. Available: {', '.join(GROUPS)}")
+    used = {group_by, *filters} - {None}
+    if 'agent' in used and used & {'category', 'priority'}:
+        raise QueryError('Agents cannot be combined with category or priority')
+    table = agent_table if 'agent' in used else daily_table
+
+    today = today or datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    dates = [start + timedelta(days=n) for n in range(days)]
+    index = {day: n for n, day in enumerate(dates)}
+
+    # Without group_by this groups in primary key order, no sort needed
+    c = table.c
+    group = [GROUPS[group_by]] if group_by else []
+    query = (db.session.query(c.day, c.transition, *group, func.sum(c.count), func.sum(c.resolutions),
+                              func.sum(c.resolve_seconds))
+             .filter(c.day >= start, c.day <= today, *[GROUPS[name] == value for name, value in filters.items()])
+             .group_by(c.day, c.transition, *group))
+
+    series = {}
+    resolved = {}
+    for row in query:
+        day, transition, count, resolutions, seconds = row[0], row[1], *row[-3:]
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        key = row[2] if group_by else 'all'
+        points = series.setdefault(key, {})
+        if transition not in points:
+            points[transition] = [0] * days
+        points[transition][index[day]] += count
+        if resolutions:
+            if key not in resolved:
+                resolved[key] = [[0, 0.0] for _ in dates]
+            totals = resolved[key][index[day]]
+            totals[0] += resolutions
+            totals[1] += seconds
+
+    for key, points in series.items():
+        totals = resolved.get(key)
+        points['mttr_hours'] = [round(s / n / 3600, 2) if n else None for n, s in totals] if totals else [None] * days
+    if group_by == 'agent':
+        names = dict(db.session.query(User.id, User.username).filter(User.id.in_([k for k in series if k])))
+        series = {names.get(key, str(key)) if key else 'unassigned': points for key, points in series.items()}
+    return {
+        'from': start.isoformat(),
+        'to': today.isoformat(),
+        'group_by': group_by,
+        'dates': [day.isoformat() for day in dates],
+        'series': series,
+    }
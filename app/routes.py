@@ -1,10 +1,12 @@
 from flask import Blueprint, render_template, flash, redirect, url_for, request, abort, current_app
 from flask_login import current_user, login_required
-from sqlalchemy import func
-from datetime import datetime, timedelta
-from app import db
-from app.models import User, Incident
+from app import archive, assignment, db
+from app.models import Incident, IncidentArchive
 from app.forms import IncidentForm
+from app.queries import with_users
+from app.search import search
+from app.stats import dashboard_stats
+from app.users import assignable_agents
 import logging
 
 bp = Blueprint('main', __name__)
@@ -25,14 +27,10 @@ def index():
 
         # Base Query
         if current_user.role == 'User':
-            query = Incident.query.filter_by(user_id=current_user.id)
+            query = with_users(Incident.query).filter_by(user_id=current_user.id)
         else:
-            query = Incident.query
+            query = with_users(Incident.query)
 
-        # Apply Search
-        if search_query:
-            query = query.filter(Incident.title.contains(search_query))
-        
         # Apply Filters
         if filter_status:
             query = query.filter(Incident.status == filter_status)
@@ -41,39 +39,20 @@ def index():
         if filter_category:
             query = query.filter(Incident.category == filter_category)
 
+        # Apply Search (ranked by relevance) or default ordering
+        if search_query:
+            query = search(query, search_query)
+        else:
+            query = query.order_by(Incident.created_at.desc())
+
         # Pagination
-        incidents_pagination = query.order_by(Incident.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
+        incidents_pagination = query.paginate(page=page, per_page=per_page, error_out=False)
         incidents = incidents_pagination.items
         
         stats = {}
         if current_user.role == 'Admin':
-            # Calculate Stats
-            stats['total'] = Incident.query.count()
-            stats['by_priority'] = dict(db.session.query(Incident.priority, func.count(Incident.id)).group_by(Incident.priority).all())
-            stats['by_category'] = dict(db.session.query(Incident.category, func.count(Incident.id)).group_by(Incident.category).all())
-            stats['by_status'] = dict(db.session.query(Incident.status, func.count(Incident.id)).group_by(Incident.status).all())
-            
-            # By Agent
-            stats['by_agent'] = dict(db.session.query(User.username, func.count(Incident.id)).join(Incident, Incident.assigned_to_id == User.id).group_by(User.username).all())
-            
-            # By User
-            stats['by_user'] = dict(db.session.query(User.username, func.count(Incident.id)).join(Incident, Incident.user_id == User.id).group_by(User.username).all())
-            
-            # Age Buckets (Open tickets only)
-            now = datetime.utcnow()
-            open_incidents = Incident.query.filter(Incident.status.in_(['Open', 'In Progress'])).all()
-            stats['age'] = {'< 1 Day': 0, '1-3 Days': 0, '3-7 Days': 0, '> 7 Days': 0}
-            
-            for inc in open_incidents:
-                age = now - inc.created_at
-                if age.days < 1:
-                    stats['age']['< 1 Day'] += 1
-                elif age.days < 3:
-                    stats['age']['1-3 Days'] += 1
-                elif age.days < 7:
-                    stats['age']['3-7 Days'] += 1
-                else:
-                    stats['age']['> 7 Days'] += 1
+            # Served from counters maintained on incident writes
+            stats = dashboard_stats()
 
         return render_template('dashboard.html', title='Dashboard', 
                             incidents=incidents, 
@@ -94,8 +73,15 @@ def new_incident():
     try:
         form = IncidentForm()
         # Populate assignable users (Agents and Admins)
-        agents = User.query.filter(User.role.in_(['Agent', 'Admin'])).all()
-        form.assigned_to.choices = [(0, 'Unassigned')] + [(u.id, u.username) for u in agents]
+        agents = assignable_agents()
+        if assignment.enabled():
+            # Agents ordered by open load, with auto-assignment preselected
+            form.assigned_to.choices = ([(assignment.AUTO_ASSIGN, 'Auto-assign'), (0, 'Unassigned')] +
+                                        assignment.ranked_choices(agents))
+            if request.method == 'GET':
+                form.assigned_to.data = assignment.AUTO_ASSIGN
+        else:
+            form.assigned_to.choices = [(0, 'Unassigned')] + agents
 
         if form.validate_on_submit():
             incident = Incident(title=form.title.data, description=form.description.data,
@@ -104,7 +90,11 @@ def new_incident():
             if current_user.role in ['Agent', 'Admin']:
                 incident.comments = form.comments.data
 
-            if form.assigned_to.data != 0:
+            # Users cannot choose an assignee; their incidents are routed automatically
+            if assignment.enabled() and (form.assigned_to.data == assignment.AUTO_ASSIGN or
+                                         current_user.role not in ['Agent', 'Admin']):
+                incident.assigned_to_id = assignment.pick(incident.category)
+            elif form.assigned_to.data != 0:
                 incident.assigned_to_id = form.assigned_to.data
             
             db.session.add(incident)
@@ -123,16 +113,23 @@ def new_incident():
 @login_required
 def incident(incident_id):
     try:
-        incident = Incident.query.get_or_404(incident_id)
+        incident = archive.lookup(incident_id)
+        if incident is None:
+            abort(404)
+        archived = isinstance(incident, IncidentArchive)
         # Check permissions: User can only see their own, Agents/Admins can see all
-        if current_user.role == 'User' and incident.author != current_user:
+        if current_user.role == 'User' and incident.user_id != current_user.id:
             current_app.logger.warning(f"Unauthorized access attempt by {current_user.username} to incident {incident_id}")
             abort(403)
 
         form = IncidentForm()
-        agents = User.query.filter(User.role.in_(['Agent', 'Admin'])).all()
-        form.assigned_to.choices = [(0, 'Unassigned')] + [(u.id, u.username) for u in agents]
+        agents = assignable_agents()
+        form.assigned_to.choices = [(0, 'Unassigned')] + (
+            assignment.ranked_choices(agents) if assignment.enabled() else agents)
 
+        if archived and request.method == 'POST':
+            flash('Archived incidents are read-only.', 'warning')
+            return redirect(url_for('main.incident', incident_id=incident_id))
         if form.validate_on_submit():
             incident.title = form.title.data
             incident.description = form.description.data
@@ -159,7 +156,8 @@ def incident(incident_id):
             form.comments.data = incident.comments
             form.assigned_to.data = incident.assigned_to_id if incident.assigned_to_id else 0
 
-        return render_template('incident_form.html', title='Incident Details', form=form, legend='Incident Details', incident=incident)
+        return render_template('incident_form.html', title='Incident Details', form=form, legend='Incident Details',
+                               incident=incident, archived=archived)
     except Exception as e:
         current_app.logger.error(f"Error accessing/updating incident {incident_id}: {str(e)}")
         db.session.rollback()
@@ -0,0 +1,48 @@
+import threading
+from app import db
+
+_threads = {}
+
+
+def start(app):
+    # Starts the periodic maintenance tasks. They write to the database, so
+    # exactly one process should run them: `flask scheduler run`, or the app
+    # itself with SCHEDULER_ENABLED when it is served by a single process.
+    # Returns the names of the tasks started.
+    from app import archive, jobs, sla, stats, webhooks
+    config = app.config
+    tasks = [('stats-reconcile', config['STATS_RECONCILE_INTERVAL'], stats.reconcile),
+             ('sla-sweep', config['SLA_SWEEP_INTERVAL'], sla.sweep),
+             ('jobs-prune', config['JOBS_PRUNE_INTERVAL'], jobs.prune),
+             ('webhooks-prune', config['JOBS_PRUNE_INTERVAL'], webhooks.prune)]
+    if config['ARCHIVE_AFTER_DAYS']:
+        tasks.append(('archive', config['ARCHIVE_INTERVAL'], archive.run))
+    return [name for name, interval, fn in tasks if schedule(app, name, interval, fn)]
+
+
+def schedule(app, name, interval, fn):
+    # Runs fn() every `interval` seconds on a daemon thread inside an app
+    # context. Each task runs at most once per process and app. Returns
+    # whether the task is scheduled.
+    if not interval or interval <= 0:
+        return False
+    key = (id(app), name)
+    if key in _threads:
+        return True
+    thread = threading.Thread(target=_run, args=(app, name, interval, fn),
+                              name=f'itsm-{name}', daemon=True)
+    _threads[key] = thread
+    thread.start()
+    return True
+
+
+def _run(app, name, interval, fn):
+    stop = threading.Event()
+    while not stop.wait(interval):
+        with app.app_context():
+            try:
+                fn()
+            except Exception as e:
+                app.logger.error(f"Scheduled task {name} failed: {str(e)}")
+            finally:
+                db.session.remove()
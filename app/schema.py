@@ -0,0 +1,36 @@
+from sqlalchemy import inspect
+from app import db
+from app import changes, rollups, search, sla
+
+
+def upgrade():
+    # Brings an existing database up to the current models: creates missing
+    # tables, then any index added to an existing table since it was created.
+    # db.create_all() alone skips indexes of tables that already exist.
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    db.create_all()
+
+    created = [f'table {name}' for name in db.metadata.tables if name not in existing_tables]
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=db.engine)
+                created.append(f'index {index.name}')
+
+    if db.engine.dialect.name == 'sqlite' and 'incident' in existing_tables and not search.fts_available():
+        search.rebuild()
+        created.append(f'search index {search.FTS_TABLE}')
+    if 'incident' in existing_tables and 'incident_sla' not in existing_tables:
+        count = sla.backfill()
+        created.append(f'SLA records for {count} incidents')
+    if 'incident' in existing_tables and 'incident_daily_agent' not in existing_tables:
+        count = rollups.backfill()
+        created.append(f'{count} daily rollup rows')
+    if 'incident' in existing_tables and 'incident_feed' not in existing_tables:
+        count = changes.backfill()
+        created.append(f'change feed positions for {count} incidents')
+    return created
@@ -0,0 +1,108 @@
+import re
+from flask import current_app
+from sqlalchemy import DDL, column, event, func, literal_column, or_, table, text
+from app import db
+from app.models import Incident
+
+FTS_TABLE = 'incident_fts'
+# Column weights for bm25(): title matches count most, then comments.
+FTS_WEIGHTS = (10.0, 1.0, 2.0)
+
+FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, description, comments, content='incident', content_rowid='id', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON incident BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description, comments) "
+    "VALUES (new.id, new.title, new.description, new.comments); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON incident BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, comments) "
+    "VALUES ('delete', old.id, old.title, old.description, old.comments); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, description, comments ON incident BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, comments) "
+    "VALUES ('delete', old.id, old.title, old.description, old.comments); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description, comments) "
+    "VALUES (new.id, new.title, new.description, new.comments); END",
+]
+
+# The index is kept in sync by triggers, so Core bulk writes are covered too.
+# db.create_all() creates it together with the incident table.
+for _statement in FTS_DDL:
+    event.listen(Incident.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
+fts = table(FTS_TABLE, column('rowid'))
+
+
+def _tokens(q):
+    return re.findall(r'\w+', q.lower())
+
+
+class LikeSearch:
+    # Fallback for databases without FTS5: substring match on every column.
+    name = 'like'
+
+    def apply(self, query, q):
+        tokens = _tokens(q)
+        if not tokens:
+            return query.filter(db.false())
+        for token in tokens:
+            query = query.filter(or_(Incident.title.contains(token),
+                                     Incident.description.contains(token),
+                                     Incident.comments.contains(token)))
+        return query.order_by(Incident.created_at.desc())
+
+
+class FTS5Search:
+    name = 'fts5'
+
+    def match_expression(self, q):
+        # Every token must match, each as a prefix: "vpn dow" -> "vpn"* "dow"*
+        return ' '.join(f'"{token}"*' for token in _tokens(q))
+
+    def apply(self, query, q):
+        expression = self.match_expression(q)
+        if not expression:
+            return query.filter(db.false())
+        rank = func.bm25(literal_column(FTS_TABLE), *FTS_WEIGHTS)
+        return (query.join(fts, fts.c.rowid == Incident.id)
+                .filter(literal_column(FTS_TABLE).op('MATCH')(expression))
+                .order_by(rank, Incident.created_at.desc()))
+
+
+BACKENDS = {'like': LikeSearch(), 'fts5': FTS5Search()}
+_fts_available = {}
+
+
+def fts_available():
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+    if engine.url not in _fts_available:
+        with engine.connect() as connection:
+            _fts_available[engine.url] = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE}).first() is not None
+    return _fts_available[engine.url]
+
+
+def backend():
+    name = current_app.config['SEARCH_BACKEND']
+    if name == 'auto':
+        name = 'fts5' if fts_available() else 'like'
+    return BACKENDS[name]
+
+
+def search(query, q):
+    return backend().apply(query, q)
+
+
+def rebuild():
+    # Creates the index and triggers if missing (e.g. a database created
+    # before search existed), then reindexes every incident.
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('The FTS5 search index requires SQLite')
+    with db.engine.begin() as connection:
+        for statement in FTS_DDL:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _fts_available[db.engine.url] = True
+    return db.session.query(func.count(Incident.id)).scalar()
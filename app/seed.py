@@ -0,0 +1,172 @@
+import bisect
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert
+from app import changes, db, rollups, search, sla, stats
+from app.models import Incident, User
+from app.passwords import hash_password
+
+CATEGORIES = {'Software': 30, 'Access': 25, 'Hardware': 20, 'Network': 15, 'General': 10}
+PRIORITIES = {'Low': 35, 'Medium': 40, 'High': 20, 'Critical': 5}
+TITLES = [
+    "System slow", "Cannot login", "Printer not working", "Wifi issue",
+    "Software update needed", "VPN down", "Email not syncing", "Blue screen error",
+    "Keyboard malfunction", "Mouse broken", "Monitor flickering", "Access denied",
+    "Password reset", "New account request", "Server unreachable"
+]
+LOCATIONS = ['London', 'Berlin', 'Pune', 'Austin', 'Sydney', 'Toronto', 'Dublin', 'Tokyo']
+
+# Status mix by incident age in days: recent tickets are mostly still open,
+# old ones mostly resolved or closed.
+STATUS_BY_AGE = [
+    (1, {'Open': 55, 'In Progress': 35, 'Resolved': 8, 'Closed': 2}),
+    (7, {'Open': 20, 'In Progress': 35, 'Resolved': 30, 'Closed': 15}),
+    (30, {'Open': 5, 'In Progress': 10, 'Resolved': 35, 'Closed': 50}),
+    (None, {'Open': 1, 'In Progress': 2, 'Resolved': 17, 'Closed': 80}),
+]
+# Mean hours from creation to the last update of a handled incident
+RESOLUTION_HOURS = {'Critical': 4, 'High': 16, 'Medium': 48, 'Low': 120}
+# Share of Open incidents that already have an assignee
+OPEN_ASSIGNED = 0.1
+
+
+def _cum_weights(weights):
+    return list(itertools.accumulate(weights))
+
+
+def _skewed(count, exponent):
+    # A few users file (and a few agents handle) most tickets.
+    return _cum_weights(1 / (rank + 1) ** exponent for rank in range(count))
+
+
+def create_users(n_users, n_agents, prefix='seed', password='seed', chunk_size=5000):
+    # Every generated account shares one precomputed hash: hashing thousands
+    # of passwords individually would dominate the run.
+    password_hash = hash_password(password)
+    first_id = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+    rows = [{'username': f'{prefix}_user{i}', 'email': f'{prefix}_user{i}@example.com',
+             'role': 'User', 'password_hash': password_hash} for i in range(n_users)]
+    rows += [{'username': f'{prefix}_agent{i}', 'email': f'{prefix}_agent{i}@example.com',
+              'role': 'Agent', 'password_hash': password_hash} for i in range(n_agents)]
+    for offset in range(0, len(rows), chunk_size):
+        db.session.execute(insert(User.__table__), rows[offset:offset + chunk_size])
+    db.session.commit()
+    user_ids = [id for id, in db.session.query(User.id).filter(User.id >= first_id, User.role == 'User')]
+    agent_ids = [id for id, in db.session.query(User.id).filter(User.id >= first_id, User.role == 'Agent')]
+    return user_ids, agent_ids
+
+
+def generate_incidents(count, user_ids, agent_ids, days=365, chunk_size=50000, rng=None, now=None):
+    # Yields lists of row dicts. Independent columns are drawn for a whole
+    # chunk at once with random.choices, which is far cheaper per row.
+    rng = rng or random.Random()
+    now = now or datetime.utcnow()
+    max_age = days * 86400
+    categories, category_weights = list(CATEGORIES), _cum_weights(CATEGORIES.values())
+    priorities, priority_weights = list(PRIORITIES), _cum_weights(PRIORITIES.values())
+    age_limits = [limit * 86400 for limit, _ in STATUS_BY_AGE[:-1]]
+    status_weights = [(list(weights), _cum_weights(weights.values())) for _, weights in STATUS_BY_AGE]
+    author_weights = _skewed(len(user_ids), 0.8)
+    agent_weights = _skewed(len(agent_ids), 0.5)
+
+    for offset in range(0, count, chunk_size):
+        n = min(chunk_size, count - offset)
+        category = rng.choices(categories, cum_weights=category_weights, k=n)
+        priority = rng.choices(priorities, cum_weights=priority_weights, k=n)
+        author = rng.choices(user_ids, cum_weights=author_weights, k=n)
+        agent = rng.choices(agent_ids, cum_weights=agent_weights, k=n) if agent_ids else [None] * n
+        title = rng.choices(TITLES, k=n)
+        location = rng.choices(LOCATIONS, k=n)
+        rows = []
+        for j in range(n):
+            # Ticket volume decays with age: a third of the range holds most rows.
+            age = min(int(rng.expovariate(3 / max_age)), max_age)
+            created_at = now - timedelta(seconds=age)
+            statuses, weights = status_weights[bisect.bisect(age_limits, age)]
+            status = statuses[bisect.bisect(weights, rng.random() * weights[-1])]
+            updated_at = created_at
+            if status != 'Open':
+                hours = rng.expovariate(1 / RESOLUTION_HOURS[priority[j]])
+                updated_at = created_at + timedelta(seconds=min(int(hours * 3600), age))
+            number = offset + j + 1
+            rows.append({
+                'title': f'{title[j]} in {location[j]} - {number}',
+                'description': f'Reported from the {location[j]} office, ticket {number}. Please investigate.',
+                'category': category[j],
+                'priority': priority[j],
+                'status': status,
+                'created_at': created_at,
+                'updated_at': updated_at,
+                'user_id': author[j],
+                'assigned_to_id': agent[j] if status != 'Open' or rng.random() < OPEN_ASSIGNED else None,
+            })
+        yield rows
+
+
+@contextmanager
+def bulk_load(connection, search_index=True):
+    # Maintaining the secondary indexes and the search index row by row is
+    # most of the insert cost. Drop them for the load and rebuild each in one
+    # sorted pass afterwards; also skip fsyncs on this connection only.
+    # With search_index=False the search index is left stale until the next
+    # `flask search rebuild`.
+    indexes = list(Incident.__table__.indexes)
+    indexed = search.fts_available()
+    pragmas = {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar() for name in ('synchronous', 'cache_size')}
+    connection.exec_driver_sql('PRAGMA synchronous = OFF')
+    connection.exec_driver_sql('PRAGMA cache_size = -262144')
+    connection.commit()
+    with connection.begin():
+        if indexed:
+            connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {search.FTS_TABLE}_ai')
+        for index in indexes:
+            index.drop(connection, checkfirst=True)
+    try:
+        yield
+    finally:
+        with connection.begin():
+            for index in indexes:
+                index.create(connection, checkfirst=True)
+            if indexed and not search_index:
+                for statement in search.FTS_DDL:
+                    connection.exec_driver_sql(statement)
+        for name, value in pragmas.items():
+            connection.exec_driver_sql(f'PRAGMA {name} = {value}')
+        connection.commit()
+        if indexed and search_index:
+            search.rebuild()
+
+
+def create_incidents(count, user_ids, agent_ids, days=365, chunk_size=50000, rng=None, progress=None,
+                     search_index=True):
+    # Chunked Core inserts on one connection, one transaction per chunk.
+    # Session hooks do not fire for these; run() backfills SLA due dates,
+    # daily rollups and the change feed and reconciles the dashboard counters
+    # afterwards.
+    started = time.perf_counter()
+    done = 0
+    with db.engine.connect() as connection, bulk_load(connection, search_index):
+        for chunk in generate_incidents(count, user_ids, agent_ids, days=days, chunk_size=chunk_size, rng=rng):
+            with connection.begin():
+                connection.execute(insert(Incident.__table__), chunk)
+            done += len(chunk)
+            if progress:
+                progress(done, count, time.perf_counter() - started)
+    return done
+
+
+def run(incidents, users=1000, agents=50, days=365, chunk_size=50000, prefix='seed', password='seed',
+        random_seed=None, progress=None, search_index=True):
+    rng = random.Random(random_seed)
+    user_ids, agent_ids = create_users(users, agents, prefix=prefix, password=password)
+    created = create_incidents(incidents, user_ids, agent_ids, days=days, chunk_size=chunk_size,
+                               rng=rng, progress=progress, search_index=search_index)
+    # Session hooks did not see the Core inserts
+    sla.backfill()
+    stats.reconcile()
+    rollups.backfill()
+    changes.backfill()
+    return {'users': len(user_ids), 'agents': len(agent_ids), 'incidents': created}
@@ -0,0 +1,117 @@
+import json
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import Incident, User
+from app.queries import QueryError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+Author = aliased(User)
+Assignee = aliased(User)
+
+# Output fields of an incident in Incident.to_dict() order, with the column
+# each one is read from
+FIELDS = {
+    'id': Incident.id,
+    'title': Incident.title,
+    'description': Incident.description,
+    'category': Incident.category,
+    'status': Incident.status,
+    'priority': Incident.priority,
+    'comments': Incident.comments,
+    'created_at': Incident.created_at,
+    'updated_at': Incident.updated_at,
+    'created_by': Author.username,
+    'assigned_to': Assignee.username,
+}
+# Always selected: the keyset cursor is built from them
+KEY_FIELDS = ('id', 'created_at', 'updated_at')
+
+
+def parse_fields(args):
+    # ?fields=id,status,priority; all fields when absent
+    fields = [f.strip() for f in args.get('fields', '').split(',') if f.strip()]
+    if not fields:
+        return list(FIELDS)
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+        raise QueryError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(FIELDS)}")
+    return list(dict.fromkeys(fields))
+
+
+def projected(fields):
+    # A query returning plain rows with just the requested columns. The
+    # users table is only joined for the username fields that are asked for.
+    # Filters, search and keyset_page() apply to it as to Incident.query.
+    # Requested fields come first, in order, so rows zip straight onto them
+    selected = fields + [f for f in KEY_FIELDS if f not in fields]
+    query = db.session.query(*[FIELDS[f].label(f) for f in selected]).select_from(Incident)
+    if 'created_by' in fields:
+        query = query.outerjoin(Author, Author.id == Incident.user_id)
+    if 'assigned_to' in fields:
+        query = query.outerjoin(Assignee, Assignee.id == Incident.assigned_to_id)
+    return query
+
+
+def serializer(fields):
+    # Returns a function turning a projected row into the response dict.
+    # Datetimes are formatted like to_dict() does, whatever the JSON provider.
+    dates = [f for f in fields if isinstance(FIELDS[f].type, db.DateTime)]
+
+    def serialize(row):
+        item = dict(zip(fields, row))
+        for f in dates:
+            if item[f] is not None:
+                item[f] = item[f].isoformat()
+        return item
+    return serialize
+
+
+class CompactJSONProvider(DefaultJSONProvider):
+    # The stdlib encoder without key sorting or ASCII escaping
+    sort_keys = False
+    ensure_ascii = False
+    compact = True
+
+
+class OrjsonProvider(JSONProvider):
+    # orjson for responses and request bodies. Datetimes and other types
+    # orjson would format differently go through Flask's default conversion,
+    # so output matches the stdlib provider apart from key order and spacing.
+    mimetype = 'application/json'
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def _dumps(self, obj):
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=self.option)
+
+    # Callers passing encoder/decoder options (the session cookie serializer
+    # uses object_hook to restore tuples) get the stdlib implementation.
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', DefaultJSONProvider.default)
+            return json.dumps(obj, **kwargs)
+        return self._dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps(obj), mimetype=self.mimetype)
+
+
+def json_provider(app):
+    name = app.config['JSON_PROVIDER']
+    if name == 'auto':
+        name = 'orjson' if orjson else 'stdlib'
+    if name == 'orjson':
+        if orjson is None:
+            raise RuntimeError('JSON_PROVIDER=orjson requires the orjson package')
+        return OrjsonProvider(app)
+    return CompactJSONProvider(app)
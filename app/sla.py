@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, delete, func, insert, select, update
+from app import db
+from app.database import retry_on_busy
+from app.events import on_flush
+from app.instrumentation import registry
+from app.models import Incident, IncidentSla
+
+RESOLVED_STATUSES = ('Resolved', 'Closed')
+DEFAULT_PRIORITY = 'Medium'
+
+sla_table = IncidentSla.__table__
+c = sla_table.c
+
+# (kind, completed column, breach flag column, due column)
+TARGETS = [
+    ('response', c.responded_at, c.response_breached_at, c.response_due),
+    ('resolve', c.resolved_at, c.resolve_breached_at, c.resolve_due),
+]
+
+
+def targets():
+    return current_app.config['SLA_TARGETS']
+
+
+def _minutes(priority):
+    return targets().get(priority) or targets()[DEFAULT_PRIORITY]
+
+
+def due_dates(priority, created_at):
+    response, resolve = _minutes(priority)
+    return created_at + timedelta(minutes=response), created_at + timedelta(minutes=resolve)
+
+
+def is_responded(values):
+    return values['status'] != 'Open'
+
+
+def is_resolved(values):
+    return values['status'] in RESOLVED_STATUSES
+
+
+def _new_row(incident_id, values):
+    created_at = values['created_at'] or datetime.utcnow()
+    response_due, resolve_due = due_dates(values['priority'], created_at)
+    return {
+        'incident_id': incident_id,
+        'priority': values['priority'],
+        'response_due': response_due,
+        'resolve_due': resolve_due,
+        'responded_at': created_at if is_responded(values) else None,
+        'resolved_at': created_at if is_resolved(values) else None,
+    }
+
+
+def _changed_values(change):
+    values = change.values
+    now = values['updated_at'] or datetime.utcnow()
+    changed = {}
+    if change.changed('priority'):
+        response_due, resolve_due = due_dates(values['priority'], values['created_at'])
+        changed.update(priority=values['priority'], response_due=response_due, resolve_due=resolve_due)
+        # A pending target that is no longer overdue loses its breach flag;
+        # the sweeper sets it again if the new due date passes.
+        for (_, done, breached, _), due in ((TARGETS[0], response_due), (TARGETS[1], resolve_due)):
+            if due > now:
+                changed[breached.name] = case((done.is_(None), None), else_=breached)
+    if change.changed('status'):
+        if is_responded(values):
+            changed['responded_at'] = func.coalesce(c.responded_at, now)
+        changed['resolved_at'] = func.coalesce(c.resolved_at, now) if is_resolved(values) else None
+    return changed
+
+
+@on_flush
+def _track_due_dates(session, changes):
+    connection = session.connection()
+    created = []
+    for change in changes:
+        if change.action == 'created':
+            created.append(_new_row(change.incident_id, change.values))
+        elif change.removed:
+            connection.execute(delete(sla_table).where(c.incident_id == change.incident_id))
+        else:
+            values = _changed_values(change)
+            if values:
+                connection.execute(update(sla_table).where(c.incident_id == change.incident_id).values(values))
+    if created:
+        connection.execute(insert(sla_table), created)
+
+
+def backfill():
+    # Creates rows for incidents that have none: databases created before
+    # SLAs existed and Core bulk loads (flask seed). One INSERT ... SELECT;
+    # incidents already responded to or resolved use updated_at as that time.
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('SLA backfill requires SQLite')
+
+    def due(index):
+        offsets = {priority: f'+{minutes[index]} minutes' for priority, minutes in targets().items()}
+        offset = case(offsets, value=Incident.priority, else_=f'+{_minutes(DEFAULT_PRIORITY)[index]} minutes')
+        return func.strftime('%Y-%m-%d %H:%M:%f', Incident.created_at, offset)
+
+    responded = Incident.status != 'Open'
+    source = (select(Incident.id, Incident.priority, due(0), due(1),
+                     case((responded, Incident.updated_at), else_=None),
+                     case((Incident.status.in_(RESOLVED_STATUSES), Incident.updated_at), else_=None))
+              .outerjoin(IncidentSla, IncidentSla.incident_id == Incident.id)
+              .where(IncidentSla.incident_id.is_(None)))
+    result = db.session.execute(insert(sla_table).from_select(
+        ['incident_id', 'priority', 'response_due', 'resolve_due', 'responded_at', 'resolved_at'], source))
+    db.session.commit()
+    return result.rowcount
+
+
+@retry_on_busy
+def _flag_batch(done, breached, due, now, batch_size):
+    ids = db.session.execute(
+        select(c.incident_id)
+        .where(done.is_(None), breached.is_(None), due < now)
+        .order_by(due)
+        .limit(batch_size)).scalars().all()
+    if ids:
+        db.session.execute(update(sla_table).where(c.incident_id.in_(ids)).values({breached.name: now}))
+        db.session.commit()
+    return len(ids)
+
+
+def sweep(batch_size=None):
+    # Flags pending targets whose due date has passed, a batch per
+    # transaction so writers are never blocked for long.
+    batch_size = batch_size or current_app.config['SLA_SWEEP_BATCH']
+    now = datetime.utcnow()
+    flagged = {}
+    for kind, done, breached, due in TARGETS:
+        total = 0
+        while True:
+            count = _flag_batch(done, breached, due, now, batch_size)
+            total += count
+            if count < batch_size:
+                break
+        flagged[kind] = total
+    if any(flagged.values()):
+        breaches = registry().counter('itsm_sla_breaches_total', 'SLA targets flagged as breached by the sweeper.')
+        for kind, count in flagged.items():
+            breaches.inc(count, target=kind)
+        current_app.logger.info(f"SLA sweep flagged {flagged['response']} response and "
+                                f"{flagged['resolve']} resolve breaches")
+    return flagged
+
+
+def report(now=None, days=30, soon_minutes=60, limit=50):
+    now = now or datetime.utcnow()
+    soon = now + timedelta(minutes=soon_minutes)
+
+    def count_if(condition):
+        return func.sum(case((condition, 1), else_=0))
+
+    # Open incidents: the resolved_at IS NULL range of the pending index
+    open_rows = db.session.query(
+        c.priority, func.count(),
+        count_if(c.responded_at.is_(None) & (c.response_due < now)),
+        count_if(c.resolve_due < now),
+        count_if((c.resolve_due >= now) & (c.resolve_due < soon)),
+    ).filter(c.resolved_at.is_(None)).group_by(c.priority)
+    open_stats = {priority: {'open': total, 'response_overdue': response_overdue,
+                             'resolve_overdue': resolve_overdue, 'due_soon': due_soon}
+                  for priority, total, response_overdue, resolve_overdue, due_soon in open_rows}
+
+    # Compliance of incidents resolved in the last `days` days
+    resolved_rows = db.session.query(
+        c.priority, func.count(), count_if(c.resolved_at <= c.resolve_due),
+    ).filter(c.resolved_at >= now - timedelta(days=days)).group_by(c.priority)
+    compliance = {priority: {'resolved': total, 'met': met, 'missed': total - met,
+                             'rate': round(met / total, 4) if total else None}
+                  for priority, total, met in resolved_rows}
+
+    overdue = db.session.execute(
+        select(c.incident_id, c.priority, c.resolve_due, c.resolve_breached_at)
+        .where(c.resolved_at.is_(None), c.resolve_due < now)
+        .order_by(c.resolve_due)
+        .limit(limit)).all()
+
+    return {
+        'generated_at': now.isoformat(),
+        'targets': {priority: {'response_minutes': response, 'resolve_minutes': resolve}
+                    for priority, (response, resolve) in targets().items()},
+        'open': open_stats,
+        'compliance_days': days,
+        'compliance': compliance,
+        'overdue': [{'incident_id': incident_id, 'priority': priority,
+                     'resolve_due': resolve_due.isoformat(),
+                     'overdue_minutes': int((now - resolve_due).total_seconds() // 60),
+                     'flagged_at': flagged_at.isoformat() if flagged_at else None}
+                    for incident_id, priority, resolve_due, flagged_at in overdue],
+    }
@@ -0,0 +1,151 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete, func, insert, update
+from app import db
+from app.events import on_flush
+from app.models import Incident, IncidentStat, User
+
+# Counter dimension -> Incident field. 'total' has a single empty key.
+DIMENSIONS = {
+    'priority': 'priority',
+    'status': 'status',
+    'category': 'category',
+    'agent': 'assigned_to_id',
+    'author': 'user_id',
+}
+OPEN_STATUSES = ['Open', 'In Progress']
+AGE_BUCKETS = ['< 1 Day', '1-3 Days', '3-7 Days', '> 7 Days']
+NONE_KEY = 'none'
+
+stat_table = IncidentStat.__table__
+
+
+def _key(value):
+    return NONE_KEY if value is None else str(value)
+
+
+def _deltas(changes):
+    deltas = Counter()
+    for change in changes:
+        if change.action == 'created':
+            deltas[('total', '')] += 1
+            for dimension, field in DIMENSIONS.items():
+                deltas[(dimension, _key(change.values[field]))] += 1
+        elif change.removed:
+            deltas[('total', '')] -= 1
+            for dimension, field in DIMENSIONS.items():
+                deltas[(dimension, _key(change.values[field]))] -= 1
+        else:
+            for dimension, field in DIMENSIONS.items():
+                if change.changed(field):
+                    deltas[(dimension, _key(change.previous[field]))] -= 1
+                    deltas[(dimension, _key(change.values[field]))] += 1
+    return deltas
+
+
+def apply_deltas(connection, deltas):
+    for (dimension, key), delta in deltas.items():
+        if not delta:
+            continue
+        result = connection.execute(
+            update(stat_table)
+            .where(stat_table.c.dimension == dimension, stat_table.c.key == key)
+            .values(count=stat_table.c.count + delta))
+        if result.rowcount == 0:
+            connection.execute(insert(stat_table).values(dimension=dimension, key=key, count=delta))
+
+
+@on_flush
+def _update_counters(session, changes):
+    deltas = _deltas(changes)
+    # Table version for conditional GETs on incident lists
+    deltas[('meta', 'version')] += len(changes)
+    apply_deltas(session.connection(), deltas)
+
+
+def table_version():
+    return db.session.query(IncidentStat.count).filter_by(dimension='meta', key='version').scalar() or 0
+
+
+def reconcile():
+    # Recomputes every counter from the incident table. Run periodically to
+    # correct drift from writes that bypassed the session hooks.
+    counts = {('total', ''): db.session.query(func.count(Incident.id)).scalar()}
+    for dimension, field in DIMENSIONS.items():
+        column = getattr(Incident, field)
+        for value, count in db.session.query(column, func.count(Incident.id)).group_by(column):
+            counts[(dimension, _key(value))] = count
+
+    db.session.execute(delete(stat_table).where(stat_table.c.dimension != 'meta'))
+    db.session.execute(insert(stat_table), [
+        {'dimension': dimension, 'key': key, 'count': count}
+        for (dimension, key), count in counts.items()])
+    _set_meta('reconciled_at', int(datetime.utcnow().timestamp()))
+    # Writes that bypassed the hooks never bumped the version; invalidate now.
+    apply_deltas(db.session.connection(), {('meta', 'version'): 1})
+    db.session.commit()
+    return counts
+
+
+def _set_meta(key, value):
+    updated = db.session.execute(
+        update(stat_table)
+        .where(stat_table.c.dimension == 'meta', stat_table.c.key == key)
+        .values(count=value)).rowcount
+    if not updated:
+        db.session.execute(insert(stat_table).values(dimension='meta', key=key, count=value))
+
+
+def _counters():
+    rows = db.session.query(IncidentStat.dimension, IncidentStat.key, IncidentStat.count).all()
+    if not any(dimension == 'meta' and key == 'reconciled_at' for dimension, key, _ in rows):
+        # First use on an existing database: materialize from scratch.
+        reconcile()
+        rows = db.session.query(IncidentStat.dimension, IncidentStat.key, IncidentStat.count).all()
+    counters = {}
+    for dimension, key, count in rows:
+        counters.setdefault(dimension, {})[key] = count
+    return counters
+
+
+def age_buckets(now=None):
+    # One aggregate over open incidents instead of loading them into Python.
+    now = now or datetime.utcnow()
+    bucket = case(
+        (Incident.created_at > now - timedelta(days=1), AGE_BUCKETS[0]),
+        (Incident.created_at > now - timedelta(days=3), AGE_BUCKETS[1]),
+        (Incident.created_at > now - timedelta(days=7), AGE_BUCKETS[2]),
+        else_=AGE_BUCKETS[3])
+    counts = dict(db.session.query(bucket, func.count(Incident.id))
+                  .filter(Incident.status.in_(OPEN_STATUSES))
+                  .group_by(bucket).all())
+    return {name: counts.get(name, 0) for name in AGE_BUCKETS}
+
+
+def _by_username(counts, usernames):
+    result = {}
+    for key, count in counts.items():
+        if key != NONE_KEY and count and int(key) in usernames:
+            result[usernames[int(key)]] = count
+    return dict(sorted(result.items()))
+
+
+def dashboard_stats():
+    counters = _counters()
+
+    def named(dimension):
+        return {k: v for k, v in sorted(counters.get(dimension, {}).items()) if v and k != NONE_KEY}
+
+    user_ids = {int(k) for dimension in ('agent', 'author')
+                for k in counters.get(dimension, {}) if k != NONE_KEY}
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(user_ids)).all()) if user_ids else {}
+
+    return {
+        'total': counters.get('total', {}).get('', 0),
+        'by_priority': named('priority'),
+        'by_category': named('category'),
+        'by_status': named('status'),
+        'by_agent': _by_username(counters.get('agent', {}), usernames),
+        'by_user': _by_username(counters.get('author', {}), usernames),
+        'age': age_buckets(),
+    }
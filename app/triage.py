@@ -0,0 +1,116 @@
+from datetime import datetime
+from sqlalchemy import update
+from app import db
+from app.database import retry_on_busy
+from app.events import TRACKED_FIELDS, IncidentChange, current_actor_id, notify
+from app.models import Incident, User
+from app.queries import apply_filters
+
+UPDATABLE_FIELDS = ('title', 'description', 'category', 'status', 'priority', 'comments', 'assigned_to_id')
+FILTER_FIELDS = ('status', 'priority', 'category', 'user_id', 'assigned_to_id', 'updated_since',
+                 'created_from', 'created_to')
+MAX_IDS = 100000
+
+COLUMNS = [getattr(Incident, field) for field in ('id',) + TRACKED_FIELDS]
+
+
+class TriageError(ValueError):
+    pass
+
+
+def validate_changes(changes):
+    if not isinstance(changes, dict) or not changes:
+        raise TriageError('changes must be a non-empty object')
+    unknown = sorted(set(changes) - set(UPDATABLE_FIELDS))
+    if unknown:
+        raise TriageError(f"Cannot update {', '.join(unknown)}")
+    assignee = changes.get('assigned_to_id')
+    if assignee is not None:
+        if not isinstance(assignee, int) or db.session.get(User, assignee) is None:
+            raise TriageError('Invalid assigned_to_id')
+    return changes
+
+
+def validate_filter(filters):
+    # Same criteria as GET /api/incidents; lists are accepted for the
+    # multi-value fields. An empty filter would match every incident.
+    if not isinstance(filters, dict) or not filters:
+        raise TriageError('filter must be a non-empty object')
+    unknown = sorted(set(filters) - set(FILTER_FIELDS))
+    if unknown:
+        raise TriageError(f"Unknown filter {', '.join(unknown)}")
+    return {name: ','.join(map(str, value)) if isinstance(value, list) else str(value)
+            for name, value in filters.items()}
+
+
+def validate_ids(ids):
+    if not isinstance(ids, list) or not ids:
+        raise TriageError('ids must be a non-empty list')
+    if len(ids) > MAX_IDS:
+        raise TriageError(f'At most {MAX_IDS} ids per request')
+    if not all(isinstance(i, int) for i in ids):
+        raise TriageError('ids must be integers')
+    return sorted(set(ids))
+
+
+class BulkUpdate:
+    # Applies the same field changes to many incidents with one SELECT and
+    # one set-based UPDATE per chunk, each chunk in its own transaction.
+    # The SELECT reads the current values so change listeners (audit, stats,
+    # SLA, change feed) see the same IncidentChange events a per-row PUT
+    # produces; rows already holding the new values are left untouched.
+
+    def __init__(self, changes, chunk_size=1000):
+        self.changes = changes
+        self.chunk_size = chunk_size
+        self.matched = 0
+        self.updated = 0
+        self.missing = []
+
+    def run_ids(self, ids):
+        for start in range(0, len(ids), self.chunk_size):
+            chunk = ids[start:start + self.chunk_size]
+            found, _ = self._apply(db.session.query(*COLUMNS).filter(Incident.id.in_(chunk)))
+            if found < len(chunk):
+                self.missing.extend(self._missing(chunk))
+        return self
+
+    def run_filter(self, filters):
+        # Keyset over id; the filter is re-evaluated in every chunk's
+        # transaction, so rows changed meanwhile by other writers are judged
+        # on their current values.
+        query = apply_filters(db.session.query(*COLUMNS), filters)
+        after_id = 0
+        while True:
+            found, after_id = self._apply(query.filter(Incident.id > after_id))
+            if found < self.chunk_size:
+                return self
+
+    def _missing(self, chunk):
+        existing = {i for i, in db.session.query(Incident.id).filter(Incident.id.in_(chunk))}
+        return [i for i in chunk if i not in existing]
+
+    @retry_on_busy
+    def _apply(self, query):
+        # Returns the number of matching rows and the last id in the chunk
+        rows = query.order_by(Incident.id).limit(self.chunk_size).all()
+        now = datetime.utcnow()
+        actor_id = current_actor_id()
+        changes = []
+        for row in rows:
+            values = row._asdict()
+            incident_id = values.pop('id')
+            previous = {field: values[field] for field, value in self.changes.items() if values[field] != value}
+            if previous:
+                values.update(self.changes, updated_at=now)
+                changes.append(IncidentChange('updated', incident_id, values, previous, actor_id))
+        if changes:
+            db.session.execute(update(Incident)
+                               .where(Incident.id.in_([change.incident_id for change in changes]))
+                               .values(dict(self.changes, updated_at=now))
+                               .execution_options(synchronize_session=False))
+            notify(db.session, changes)
+        db.session.commit()
+        self.matched += len(rows)
+        self.updated += len(changes)
+        return len(rows), rows[-1].id if rows else None
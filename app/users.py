@@ -0,0 +1,69 @@
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from app import db, login
+from app.cache import TTLCache
+from app.models import User
+
+ASSIGNABLE_ROLES = ['Agent', 'Admin']
+_AGENTS_KEY = 'assignable_agents'
+
+
+def _caches():
+    ext = current_app.extensions.get('itsm_user_cache')
+    if ext is None:
+        size, ttl = current_app.config['USER_CACHE_SIZE'], current_app.config['USER_CACHE_TTL']
+        ext = current_app.extensions['itsm_user_cache'] = {
+            'users': TTLCache(maxsize=size, ttl=ttl),
+            'lists': TTLCache(maxsize=16, ttl=ttl),
+        }
+    return ext
+
+
+def _detached_copy(user):
+    # A session-independent copy that can be merged into any request's session
+    # without a round-trip; ORM instances themselves belong to one session.
+    copy = User(id=user.id, username=user.username, email=user.email,
+                password_hash=user.password_hash, role=user.role)
+    make_transient_to_detached(copy)
+    return copy
+
+
+@login.user_loader
+def load_user(id):
+    cache = _caches()['users']
+    cached = cache.get(int(id))
+    if cached is not None:
+        return db.session.merge(cached, load=False)
+    user = db.session.get(User, int(id))
+    if user is not None:
+        cache.set(user.id, _detached_copy(user))
+    return user
+
+
+def assignable_agents():
+    # (id, username) of everyone incidents can be assigned to
+    cache = _caches()['lists']
+    agents = cache.get(_AGENTS_KEY)
+    if agents is None:
+        agents = [tuple(row) for row in db.session.query(User.id, User.username)
+                  .filter(User.role.in_(ASSIGNABLE_ROLES)).order_by(User.username)]
+        cache.set(_AGENTS_KEY, agents)
+    return agents
+
+
+def invalidate(user_id=None):
+    caches = _caches()
+    if user_id is not None:
+        caches['users'].discard(user_id)
+    caches['lists'].clear()
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    # Covers registration and role/username changes in this process; other
+    # workers pick the change up once their entries expire.
+    if has_app_context():
+        invalidate(target.id)
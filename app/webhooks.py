@@ -0,0 +1,260 @@
+import hashlib
+import hmac
+import json
+import random
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+import requests
+from flask import current_app, has_app_context
+from sqlalchemy import delete, event, exists, func, insert, or_, select, update
+from app import db, jobs
+from app.cache import TTLCache
+from app.database import retry_on_busy
+from app.events import on_flush
+from app.models import WebhookEvent, WebhookSubscription
+
+subscription_table = WebhookSubscription.__table__
+event_table = WebhookEvent.__table__
+sc, ec = subscription_table.c, event_table.c
+
+EVENTS = ('incident.created', 'incident.assigned', 'incident.status_changed')
+DELIVER_JOB = 'webhooks.deliver'
+# A delivery still due this long after its time has been lost (its job
+# died); the next event schedules a new one
+STALE_DELIVERY = timedelta(hours=1)
+_SUBSCRIPTIONS_KEY = 'subscriptions'
+
+_local = threading.local()
+
+
+def _cache():
+    ext = current_app.extensions.get('itsm_webhooks')
+    if ext is None:
+        ext = current_app.extensions['itsm_webhooks'] = TTLCache(maxsize=1, ttl=current_app.config['WEBHOOK_CACHE_TTL'])
+    return ext
+
+
+def subscriptions(connection):
+    # (id, event names or None for all, batch window) of active subscriptions
+    cache = _cache()
+    subs = cache.get(_SUBSCRIPTIONS_KEY)
+    if subs is None:
+        subs = [(id, None if names.strip() == '*' else {n.strip() for n in names.split(',')}, window)
+                for id, names, window in connection.execute(
+                    select(sc.id, sc.events, sc.batch_window).where(sc.active.is_(True)))]
+        cache.set(_SUBSCRIPTIONS_KEY, subs)
+    return subs
+
+
+def event_names(change):
+    if change.action == 'created':
+        yield 'incident.created'
+    elif change.action == 'updated':
+        if change.changed('assigned_to_id'):
+            yield 'incident.assigned'
+        if change.changed('status'):
+            yield 'incident.status_changed'
+
+
+@on_flush
+def _queue_events(session, changes):
+    # Adds an outbox row per subscription and event in the writing
+    # transaction, and a delivery job for each subscription that has none
+    # pending. A storm of changes therefore costs one job and one request
+    # per subscription and batch window, whatever the number of events.
+    connection = session.connection()
+    subs = subscriptions(connection)
+    if not subs:
+        return
+    now = datetime.utcnow()
+    rows = []
+    for change in changes:
+        names = list(event_names(change))
+        if not names:
+            continue
+        data = change.to_dict()
+        for name in names:
+            payload = json.dumps({'event': name, 'incident_id': change.incident_id, 'occurred_at': now.isoformat(),
+                                  'incident': data['values'], 'previous': data['previous'],
+                                  'actor_id': change.actor_id})
+            rows.extend({'subscription_id': id, 'event': name, 'incident_id': change.incident_id,
+                         'payload': payload, 'status': 'pending', 'attempts': 0, 'created_at': now}
+                        for id, accepted, _ in subs if accepted is None or name in accepted)
+    if not rows:
+        return
+    connection.execute(insert(event_table), rows)
+    windows = {id: window for id, _, window in subs}
+    for id in {row['subscription_id'] for row in rows}:
+        _schedule(session, id, windows[id], now, only_if_idle=True)
+
+
+def _schedule(session, subscription_id, delay, now, only_if_idle=False):
+    # Queues the subscription's next delivery in `delay` seconds. With
+    # only_if_idle, not if one is already due (the events join that batch).
+    query = update(subscription_table).where(sc.id == subscription_id)
+    if only_if_idle:
+        query = query.where(or_(sc.delivery_due.is_(None), sc.delivery_due < now - STALE_DELIVERY))
+    due = now + timedelta(seconds=delay)
+    if session.connection().execute(query.values(delivery_due=due)).rowcount:
+        jobs.enqueue(DELIVER_JOB, {'subscription_id': subscription_id}, session=session, delay=delay)
+
+
+def _session():
+    # One pooled keep-alive session per worker thread
+    http = getattr(_local, 'session', None)
+    if http is None:
+        http = _local.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=current_app.config['WEBHOOK_POOL_SIZE'],
+                                                pool_maxsize=current_app.config['WEBHOOK_POOL_SIZE'])
+        http.mount('http://', adapter)
+        http.mount('https://', adapter)
+        http.headers['User-Agent'] = 'itsm-webhooks'
+    return http
+
+
+def sign(secret, body):
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def _body(subscription_id, rows):
+    # Stored payloads are spliced in as they are, each with its outbox id
+    # (stable across retries, for de-duplication by the receiver)
+    events = ','.join(f'{{"id":{row.id},{row.payload[1:]}' for row in rows)
+    return f'{{"subscription_id":{subscription_id},"events":[{events}]}}'.encode()
+
+
+def post(subscription, rows):
+    # Returns None on a 2xx response, else the error
+    body = _body(subscription.id, rows)
+    headers = {'Content-Type': 'application/json'}
+    if subscription.secret:
+        headers['X-ITSM-Signature'] = sign(subscription.secret, body)
+    try:
+        response = _session().post(subscription.url, data=body, headers=headers,
+                                   timeout=current_app.config['WEBHOOK_TIMEOUT'])
+        # Read the body so the connection goes back to the pool
+        response.content
+    except requests.RequestException as e:
+        return f'{type(e).__name__}: {e}'
+    return None if response.ok else f'HTTP {response.status_code}'
+
+
+def _backoff(attempts):
+    config = current_app.config
+    return min(config['WEBHOOK_BACKOFF'] * 2 ** (attempts - 1), config['WEBHOOK_BACKOFF_MAX']) * (1 + random.random() / 2)
+
+
+@retry_on_busy
+def _settle(subscription, ids, attempts, error):
+    # Records the outcome and, in the same transaction, either queues the
+    # next delivery or marks the subscription idle. Events added while the
+    # request was in flight saw a delivery due and queued nothing, so they
+    # are picked up here.
+    config = current_app.config
+    now = datetime.utcnow()
+    if error is None:
+        db.session.execute(update(event_table).where(ec.id.in_(ids)).values(status='sent', sent_at=now))
+    else:
+        db.session.execute(update(event_table).where(ec.id.in_(ids))
+                           .values(attempts=ec.attempts + 1, last_error=error))
+        dead = db.session.execute(update(event_table).where(ec.id.in_(ids),
+                                                            ec.attempts >= config['WEBHOOK_MAX_ATTEMPTS'])
+                                  .values(status='dead')).rowcount
+        if dead:
+            current_app.logger.error(f"Webhook {subscription.id}: {dead} events dead after "
+                                     f"{config['WEBHOOK_MAX_ATTEMPTS']} attempts ({error})")
+    pending = subscription.active and db.session.query(
+        exists().where(ec.subscription_id == subscription.id, ec.status == 'pending')).scalar()
+    if pending:
+        _schedule(db.session, subscription.id, 0 if error is None else _backoff(attempts + 1), now)
+    else:
+        db.session.execute(update(subscription_table).where(sc.id == subscription.id).values(delivery_due=None))
+    db.session.commit()
+
+
+@jobs.handler(DELIVER_JOB)
+def deliver(payload):
+    # Sends the subscription's pending events, oldest first, as one request
+    subscription = db.session.get(WebhookSubscription, payload['subscription_id'])
+    if subscription is None:
+        return
+    rows = []
+    if subscription.active:
+        rows = db.session.execute(
+            select(ec.id, ec.payload, ec.attempts)
+            .where(ec.subscription_id == subscription.id, ec.status == 'pending')
+            .order_by(ec.id).limit(current_app.config['WEBHOOK_MAX_BATCH'])).all()
+    # End the read transaction: the request may take a while
+    db.session.commit()
+    error = post(subscription, rows) if rows else None
+    if error:
+        current_app.logger.warning(f"Webhook {subscription.id} delivery of {len(rows)} events to "
+                                   f"{subscription.url} failed: {error}")
+    _settle(subscription, [row.id for row in rows], min((row.attempts for row in rows), default=0), error)
+
+
+def subscribe(url, events=None, secret=None, batch_window=None):
+    unknown = set(events or ()) - set(EVENTS)
+    if unknown:
+        raise ValueError(f"Unknown events: {', '.join(sorted(unknown))}. Available: {', '.join(EVENTS)}")
+    subscription = WebhookSubscription(
+        url=url, events=','.join(events) if events else '*', secret=secret,
+        batch_window=current_app.config['WEBHOOK_BATCH_WINDOW'] if batch_window is None else batch_window)
+    db.session.add(subscription)
+    db.session.commit()
+    return subscription
+
+
+def unsubscribe(subscription_id):
+    # Deletes the subscription with its events; a queued delivery finds it gone
+    subscription = db.session.get(WebhookSubscription, subscription_id)
+    if subscription is None:
+        return False
+    db.session.execute(delete(event_table).where(ec.subscription_id == subscription_id))
+    db.session.delete(subscription)
+    db.session.commit()
+    return True
+
+
+def summary():
+    # (subscription, {status: count}) for each subscription, delivered events excluded
+    counts = defaultdict(dict)
+    for subscription_id, status, count in db.session.execute(
+            select(ec.subscription_id, ec.status, func.count())
+            .where(ec.status != 'sent').group_by(ec.subscription_id, ec.status)):
+        counts[subscription_id][status] = count
+    return [(subscription, counts[subscription.id])
+            for subscription in WebhookSubscription.query.order_by(WebhookSubscription.id)]
+
+
+def retry_dead(subscription_id=None):
+    # Gives dead events a fresh set of attempts and queues their delivery
+    query = update(event_table).where(ec.status == 'dead')
+    if subscription_id:
+        query = query.where(ec.subscription_id == subscription_id)
+    subscription_ids = db.session.execute(
+        query.values(status='pending', attempts=0).returning(ec.subscription_id)).scalars().all()
+    now = datetime.utcnow()
+    for id in set(subscription_ids):
+        _schedule(db.session, id, 0, now, only_if_idle=True)
+    db.session.commit()
+    return len(subscription_ids)
+
+
+def prune(retention=None):
+    # Deletes delivered events older than `retention` seconds; dead ones stay
+    retention = current_app.config['WEBHOOK_RETENTION'] if retention is None else retention
+    result = db.session.execute(delete(event_table).where(
+        ec.status == 'sent', ec.sent_at < datetime.utcnow() - timedelta(seconds=retention)))
+    db.session.commit()
+    return result.rowcount
+
+
+@event.listens_for(WebhookSubscription, 'after_insert')
+@event.listens_for(WebhookSubscription, 'after_update')
+@event.listens_for(WebhookSubscription, 'after_delete')
+def _subscription_changed(mapper, connection, target):
+    # Other processes see the change once their cache entry expires
+    if has_app_context():
+        _cache().clear()
@@ -0,0 +1,136 @@
+"""Auto-assignment decision rate and alert-storm ingest throughput.
+
+Run with: python -m benchmarks.bench_assignment [--agents 10 50 200] [--incidents 100000]
+                                                [--storm 10000] [--seconds 3]
+
+1. Engine: picks per second on an in-memory AssignmentEngine (half the
+   agents restricted to one or two categories), from 1 and 4 threads, with
+   every fourth decision followed by a resolve. For comparison, the rate of
+   choosing the agent by re-counting open incidents with a GROUP BY per
+   decision on a database seeded with --incidents rows.
+2. Storm: POST /api/incidents/bulk with --storm distinct alerts against the
+   seeded database, with ASSIGNMENT_ENABLED off and then on. Reports incidents
+   per second, how many agents received alerts and the open load range
+   across agents afterwards.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from sqlalchemy import func
+from app import create_app, db
+from app.assignment import AssignmentEngine
+from app.models import Incident, User
+from app.stats import OPEN_STATUSES
+from app.seed import CATEGORIES
+from benchmarks.common import bench_config, seed
+
+CATEGORY_NAMES = list(CATEGORIES)
+
+
+def make_engine(n_agents, rng):
+    agents = {i: f'agent{i}' for i in range(1, n_agents + 1)}
+    skills = {name: rng.sample(CATEGORY_NAMES, rng.randint(1, 2))
+              for i, name in agents.items() if i % 2 == 0}
+    load = {i: rng.randint(0, 50) for i in agents}
+    return AssignmentEngine(agents, load, skills)
+
+
+def bench_engine(n_agents, threads, seconds):
+    rng = random.Random(0)
+    engine = make_engine(n_agents, rng)
+    stop = threading.Event()
+    counts = [0] * threads
+
+    def loop(slot):
+        local = random.Random(slot)
+        n = 0
+        while not stop.is_set():
+            agent_id = engine.pick(local.choice(CATEGORY_NAMES))
+            if n % 4 == 0:
+                engine.apply({agent_id: -1})
+            n += 1
+        counts[slot] = n
+
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def bench_recount(app, seconds):
+    # The naive alternative: one aggregate query per decision
+    with app.app_context():
+        agent_ids = [i for i, in db.session.query(User.id).filter(User.role == 'Agent')]
+        n = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            load = dict(db.session.query(Incident.assigned_to_id, func.count(Incident.id))
+                        .filter(Incident.assigned_to_id.in_(agent_ids), Incident.status.in_(OPEN_STATUSES))
+                        .group_by(Incident.assigned_to_id))
+            min(agent_ids, key=lambda i: load.get(i, 0))
+            n += 1
+        return n / (time.perf_counter() - start)
+
+
+def bench_storm(app, size, enabled):
+    app.config['ASSIGNMENT_ENABLED'] = enabled
+    app.extensions.pop('itsm_assignment', None)
+    client = app.test_client()
+    with app.app_context():
+        reporter = db.session.query(User.id).filter(User.role == 'User').limit(1).scalar()
+        first_id = db.session.query(func.max(Incident.id)).scalar() or 0
+    rng = random.Random(size)
+    tag = 'on' if enabled else 'off'
+    alerts = [{'title': f'Storm alert {i}', 'description': 'Monitoring alert', 'user_id': reporter,
+               'category': rng.choice(CATEGORY_NAMES), 'priority': 'High', 'source': f'storm-{tag}-{i}'}
+              for i in range(size)]
+    start = time.perf_counter()
+    response = client.post('/api/incidents/bulk', json=alerts)
+    elapsed = time.perf_counter() - start
+    with app.app_context():
+        agent_ids = [i for i, in db.session.query(User.id).filter(User.role == 'Agent')]
+        load = dict(db.session.query(Incident.assigned_to_id, func.count(Incident.id))
+                    .filter(Incident.assigned_to_id.in_(agent_ids), Incident.status.in_(OPEN_STATUSES))
+                    .group_by(Incident.assigned_to_id))
+        received = dict(db.session.query(Incident.assigned_to_id, func.count(Incident.id))
+                        .filter(Incident.id > first_id, Incident.assigned_to_id.isnot(None))
+                        .group_by(Incident.assigned_to_id))
+    open_load = [load.get(i, 0) for i in agent_ids]
+    return {'created': response.json['created'], 'incidents_per_sec': round(response.json['created'] / elapsed),
+            'agents_used': len(received), 'open_load_min': min(open_load), 'open_load_max': max(open_load)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--incidents', type=int, default=100000, help='seeded incidents for the database tests')
+    parser.add_argument('--storm', type=int, default=10000, help='alerts per bulk request')
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    for n_agents in args.agents:
+        for threads in (1, 4):
+            rate = bench_engine(n_agents, threads, args.seconds)
+            print(json.dumps({'test': 'engine', 'agents': n_agents, 'threads': threads,
+                              'decisions_per_sec': round(rate)}))
+
+    app = create_app(bench_config())
+    with app.app_context():
+        db.create_all()
+        seed(args.incidents, n_agents=args.agents[0])
+    print(json.dumps({'test': 'recount', 'incidents': args.incidents, 'agents': args.agents[0],
+                      'decisions_per_sec': round(bench_recount(app, args.seconds), 1)}))
+    for enabled in (False, True):
+        result = bench_storm(app, args.storm, enabled)
+        print(json.dumps(dict({'test': 'storm', 'assignment': enabled, 'alerts': args.storm}, **result)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Mixed read/write throughput with the default and the production SQLite profile.
+
+Run with: python -m benchmarks.bench_concurrency [--readers 8] [--writers 4] [--seconds 10]
+
+Readers page through GET /api/incidents, writers alternate POST and PUT.
+Each profile gets a fresh database; results are printed as JSON lines.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from config import Config, ProductionConfig
+from app import create_app, db
+from benchmarks.common import seed
+
+
+def make_profile_app(base):
+    path = os.path.join(tempfile.mkdtemp(prefix='itsm-bench-'), 'bench.db')
+
+    class BenchConfig(base):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        CORRELATION_ENABLED = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def reader(client, stop, counts):
+    while not stop.is_set():
+        response = client.get(f'/api/incidents?limit=50&status={random.choice(["Open", "Closed"])}')
+        counts['reads' if response.status_code == 200 else 'read_errors'] += 1
+
+
+def writer(client, stop, counts, user_ids, max_id):
+    while not stop.is_set():
+        if random.random() < 0.5:
+            response = client.post('/api/incidents', json={
+                'title': f'Concurrency test {random.random()}', 'description': 'bench',
+                'user_id': random.choice(user_ids)})
+        else:
+            response = client.put(f'/api/incidents/{random.randint(1, max_id)}',
+                                  json={'status': random.choice(['Open', 'In Progress', 'Resolved'])})
+        if response.status_code in (200, 201):
+            counts['writes'] += 1
+        else:
+            counts['write_errors'] += 1
+            if 'locked' in response.get_data(as_text=True):
+                counts['locked'] += 1
+
+
+def run(name, base, args):
+    app = make_profile_app(base)
+    with app.app_context():
+        seed(args.incidents)
+        from app.models import User
+        user_ids = [u.id for u in User.query.filter_by(role='User')]
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+
+    stop = threading.Event()
+    counters = []
+    threads = []
+    for i in range(args.readers + args.writers):
+        counts = {'reads': 0, 'read_errors': 0, 'writes': 0, 'write_errors': 0, 'locked': 0}
+        counters.append(counts)
+        client = app.test_client()
+        if i < args.readers:
+            target, extra = reader, ()
+        else:
+            target, extra = writer, (user_ids, args.incidents)
+        threads.append(threading.Thread(target=target, args=(client, stop, counts) + extra))
+
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    totals = {key: sum(c[key] for c in counters) for key in counters[0]}
+    print(json.dumps(dict(
+        profile=name, journal_mode=journal_mode, readers=args.readers, writers=args.writers,
+        reads_per_sec=round(totals['reads'] / args.seconds, 1),
+        writes_per_sec=round(totals['writes'] / args.seconds, 1), **totals)), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--incidents', type=int, default=20000)
+    args = parser.parse_args()
+    run('default', Config, args)
+    run('production', ProductionConfig, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""End-to-end latency and throughput for the dashboard pages and every API route.
+
+Run with: python -m benchmarks.bench_http [--sizes 10000 100000] [--requests 200] [--concurrency 1]
+                                          [--output http.json] [--baseline http.json]
+          python -m benchmarks.bench_http --url http://127.0.0.1:5000 [--user user1:user1] ...
+
+In-process runs seed a fresh database per size and go through the Flask test
+client. With --url the same scenarios run against a live server and its
+existing data; --user, --agent and --admin give the login for each role
+(defaults match init_db.py). Results are printed as JSON lines; --output
+writes them to a file, and --baseline flags scenarios whose p50 or p95
+latency regressed by more than --tolerance against an earlier file.
+"""
+import argparse
+import itertools
+import json
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import requests
+from app import db
+from app.models import User
+from benchmarks.common import make_app, seed
+
+ROLES = ('user', 'agent', 'admin')
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+class InProcessClient:
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json=None, data=None, headers=None):
+        response = self.client.open(path, method=method, json=json, data=data, headers=headers)
+        return response.status_code, response.headers, response.get_data()
+
+
+class LiveClient:
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, json=None, data=None, headers=None):
+        response = self.session.request(method, self.url + path, json=json, data=data, headers=headers,
+                                        allow_redirects=False)
+        return response.status_code, response.headers, response.content
+
+
+def login(client, username, password):
+    _, _, body = client.request('GET', '/auth/login')
+    data = {'username': username, 'password': password}
+    token = CSRF_TOKEN.search(body.decode())
+    if token:
+        data['csrf_token'] = token.group(1)
+    status, _, _ = client.request('POST', '/auth/login', data=data)
+    if status != 302:
+        raise RuntimeError(f'Login failed for {username} ({status})')
+
+
+class Scenario:
+
+    def __init__(self, name, path, role=None, method='GET', body=None, headers=None, expect=(200,)):
+        self.name = name
+        self.path = path
+        self.role = role
+        self.method = method
+        self.body = body
+        self.headers = headers
+        self.expect = expect
+
+    def request(self, client, context, n):
+        path = self.path.format(**context)
+        headers = {k: v.format(**context) for k, v in (self.headers or {}).items()}
+        body = self.body(context, n) if self.body else None
+        return client.request(self.method, path, json=body, headers=headers)
+
+
+def _new_incident(context, n):
+    # A distinct source per request keeps alert correlation from folding
+    # the creates into one incident.
+    return {'title': f'HTTP bench incident {n}', 'description': 'bench', 'source': f'bench-{context["run"]}-{n}',
+            'user_id': context['user_id'], 'category': 'Software', 'priority': 'Medium'}
+
+
+def _bulk(context, n):
+    return [_new_incident(context, f'{n}-{i}') for i in range(10)]
+
+
+def _update(context, n):
+    return {'status': ('Open', 'In Progress', 'Resolved')[n % 3]}
+
+
+def _patch(context, n):
+    return {'ids': context['page_ids'], 'changes': _update(context, n)}
+
+
+def scenarios():
+    for role in ROLES:
+        yield Scenario(f'{role} index', '/index', role)
+        yield Scenario(f'{role} index status', '/index?status=Open', role)
+        yield Scenario(f'{role} index status+priority+category',
+                       '/index?status=In+Progress&priority=High&category=Network', role)
+        yield Scenario(f'{role} index search', '/index?q=vpn+london', role)
+        yield Scenario(f'{role} index page 20', '/index?page=20', role)
+    yield Scenario('user new incident form', '/incident/new', 'user')
+    for role in ('agent', 'admin'):
+        yield Scenario(f'{role} incident detail', '/incident/{incident_id}', role)
+
+    yield Scenario('api list', '/api/incidents?limit=100')
+    yield Scenario('api list filtered', '/api/incidents?status=Open,In+Progress&priority=High&limit=100')
+    yield Scenario('api list next page', '/api/incidents?limit=100&cursor={cursor}')
+    yield Scenario('api list not modified', '/api/incidents?limit=100',
+                   headers={'If-None-Match': '{list_etag}'}, expect=(304,))
+    yield Scenario('api list ndjson', '/api/incidents?format=ndjson&status=Open&priority=Critical')
+    yield Scenario('api search', '/api/incidents/search?q=printer')
+    yield Scenario('api changes tail', '/api/incidents/changes')
+    yield Scenario('api changes since', '/api/incidents/changes?since={tail}&limit=100')
+    yield Scenario('api get', '/api/incidents/{incident_id}')
+    yield Scenario('api get not modified', '/api/incidents/{incident_id}',
+                   headers={'If-None-Match': '{incident_etag}'}, expect=(304,))
+    yield Scenario('api history', '/api/incidents/{incident_id}/history', expect=(200, 404))
+    # Writes last: they change the validators the scenarios above rely on.
+    yield Scenario('api create', '/api/incidents', method='POST', body=_new_incident, expect=(201,))
+    yield Scenario('api bulk 10', '/api/incidents/bulk', method='POST', body=_bulk)
+    yield Scenario('api update', '/api/incidents/{incident_id}', method='PUT', body=_update)
+    yield Scenario('api patch 100', '/api/incidents', method='PATCH', body=_patch)
+
+
+def discover(client, user_id):
+    # Ids, cursors and validators the scenarios need, read through the API
+    # so live runs work against any data set.
+    status, headers, body = client.request('GET', '/api/incidents?limit=100')
+    incidents = json.loads(body)
+    if status != 200 or not incidents:
+        raise RuntimeError('No incidents to benchmark against')
+    context = {'incident_id': incidents[0]['id'], 'page_ids': [i['id'] for i in incidents], 'user_id': user_id,
+               'cursor': headers.get('X-Next-Cursor', ''), 'list_etag': headers.get('ETag', ''),
+               'run': int(time.time())}
+    _, headers, _ = client.request('GET', f'/api/incidents/{context["incident_id"]}')
+    context['incident_etag'] = headers.get('ETag', '')
+    _, _, body = client.request('GET', '/api/incidents/changes')
+    context['tail'] = json.loads(body)['cursor']
+    return context
+
+
+def measure(scenario, clients, context, n_requests, warmup):
+    counter = itertools.count()
+    for _ in range(warmup):
+        scenario.request(clients[0], context, next(counter))
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = -(-n_requests // len(clients))
+
+    def worker(client):
+        local, failed = [], []
+        for _ in range(per_thread):
+            n = next(counter)
+            start = time.perf_counter()
+            status, _, _ = scenario.request(client, context, n)
+            local.append((time.perf_counter() - start) * 1000)
+            if status not in scenario.expect:
+                failed.append(status)
+        with lock:
+            latencies.extend(local)
+            errors.extend(failed)
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'scenario': scenario.name,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_statuses': sorted(set(errors)),
+        'rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'p50_ms': round(_percentile(latencies, 50), 3),
+        'p90_ms': round(_percentile(latencies, 90), 3),
+        'p95_ms': round(_percentile(latencies, 95), 3),
+        'p99_ms': round(_percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+    }
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(label, make_client, credentials, user_id, args):
+    context = discover(make_client(), user_id)
+    results = []
+    for scenario in scenarios():
+        if args.only and not any(word in scenario.name for word in args.only):
+            continue
+        clients = [make_client() for _ in range(args.concurrency)]
+        if scenario.role:
+            for client in clients:
+                login(client, *credentials[scenario.role])
+        result = dict(measure(scenario, clients, context, args.requests, args.warmup), size=label)
+        print(json.dumps(result), flush=True)
+        results.append(result)
+    return results
+
+
+def seeded_app(size):
+    app = make_app()
+    with app.app_context():
+        seed(size, n_users=max(50, size // 1000), n_agents=max(10, size // 10000))
+        admin = User(username='bench_admin', email='bench_admin@example.com', role='Admin')
+        admin.set_password('bench')
+        db.session.add(admin)
+        db.session.commit()
+        reporter_id = User.query.filter_by(username='bench_user0').first().id
+    return app, reporter_id
+
+
+def _credentials(value):
+    username, _, password = value.partition(':')
+    return username, password or username
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    previous = {(r['size'], r['scenario']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['size'], result['scenario']))
+        if not before:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if result[key] > before[key] * tolerance:
+                regressions.append(f"{result['size']} {result['scenario']}: {key} "
+                                   f"{before[key]} -> {result[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000])
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads per scenario')
+    parser.add_argument('--only', nargs='+', help='run scenarios whose name contains any of these words')
+    parser.add_argument('--url', help='benchmark a running server instead of an in-process app')
+    parser.add_argument('--user', type=_credentials, default=('user1', 'user1'))
+    parser.add_argument('--agent', type=_credentials, default=('agent1', 'agent1'))
+    parser.add_argument('--admin', type=_credentials, default=('admin', 'admin'))
+    parser.add_argument('--reporter-id', type=int, default=1, help='user id for incidents created with --url')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against a previous --output file')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='allowed p50/p95 slowdown factor against the baseline')
+    args = parser.parse_args()
+
+    results = []
+    if args.url:
+        credentials = {'user': args.user, 'agent': args.agent, 'admin': args.admin}
+        results += run('live', lambda: LiveClient(args.url), credentials, args.reporter_id, args)
+    else:
+        credentials = {'user': ('bench_user0', 'bench'), 'agent': ('bench_agent0', 'bench'),
+                       'admin': ('bench_admin', 'bench')}
+        for size in args.sizes:
+            app, reporter_id = seeded_app(size)
+            results += run(size, lambda: InProcessClient(app), credentials, reporter_id, args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': _commit(), 'url': args.url, 'concurrency': args.concurrency,
+                       'results': results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
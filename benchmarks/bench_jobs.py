@@ -0,0 +1,101 @@
+"""Background job throughput and queue latency.
+
+Run with: python -m benchmarks.bench_jobs [--jobs 2000] [--work-ms 20] [--processes 1 2 4] [--requests 300]
+
+1. Enqueue: mean POST /api/incidents latency without a job subscription,
+   with one enqueuing a job per write (the cost added to the request), and
+   with the job's work (--work-ms of sleep, standing in for an HTTP call)
+   done inline in the request instead.
+2. Drain: --jobs queued jobs of --work-ms each run by `flask jobs worker`
+   with each --processes count. Reports jobs per second and the mean and
+   worst time from enqueue to start.
+"""
+import argparse
+import itertools
+import json
+import os
+import signal
+import threading
+import time
+from sqlalchemy import func
+from app import db, jobs
+from app.models import Job
+from benchmarks.common import make_app, seed
+
+WORK = {'ms': 20}
+_sources = itertools.count()
+
+
+@jobs.handler('bench.work')
+def work(payload):
+    time.sleep(payload.get('ms', WORK['ms']) / 1000)
+
+
+def post_latency(app, n, inline=False):
+    client = app.test_client()
+    total = 0.0
+    for i in range(n):
+        start = time.perf_counter()
+        response = client.post('/api/incidents', json={'title': f'bench {i}', 'description': 'x', 'user_id': 1,
+                                                      'source': f'bench-{next(_sources)}'})
+        if inline:
+            work({})
+        total += time.perf_counter() - start
+        assert response.status_code == 201, response.status_code
+    return total / n * 1000
+
+
+def stop_when_drained(app):
+    # run_workers() stops on SIGTERM
+    with app.app_context():
+        while True:
+            counts = jobs.counts()
+            db.session.remove()
+            if not counts.get('queued') and not counts.get('running'):
+                break
+            time.sleep(0.02)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def drain(app, n_jobs, processes):
+    with app.app_context():
+        db.session.query(Job).delete()
+        for _ in range(n_jobs):
+            jobs.enqueue('bench.work', {'ms': WORK['ms']})
+        db.session.commit()
+        start = time.perf_counter()
+        threading.Thread(target=stop_when_drained, args=(app,), daemon=True).start()
+        jobs.run_workers(processes, stats_interval=3600, poll_interval=0.05)
+        elapsed = time.perf_counter() - start
+        waited = func.julianday(Job.started_at) - func.julianday(Job.created_at)
+        mean_wait, max_wait = db.session.query(func.avg(waited), func.max(waited)).one()
+        return {'jobs_per_sec': round(n_jobs / elapsed, 1), 'mean_wait_ms': round(mean_wait * 86400000),
+                'max_wait_ms': round(max_wait * 86400000)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--work-ms', type=float, default=20)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+    WORK['ms'] = args.work_ms
+
+    app = make_app()
+    with app.app_context():
+        seed(1000)
+
+    print(json.dumps({'test': 'enqueue', 'path': 'no job', 'post_ms': round(post_latency(app, args.requests), 2)}))
+    print(json.dumps({'test': 'enqueue', 'path': 'inline work',
+                      'post_ms': round(post_latency(app, args.requests, inline=True), 2)}))
+    jobs.for_changes('bench.work', accept=lambda change: change.action == 'created')
+    print(json.dumps({'test': 'enqueue', 'path': 'job per write',
+                      'post_ms': round(post_latency(app, args.requests), 2)}))
+    for processes in args.processes:
+        print(json.dumps(dict({'test': 'drain', 'processes': processes, 'jobs': args.jobs}, **drain(
+            app, args.jobs, processes))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Password verification and login throughput per hash method.
+
+Run with: python -m benchmarks.bench_login [--methods scrypt:32768:8:1 pbkdf2:sha256:600000]
+                                           [--threads 1 2 4] [--seconds 5]
+
+For each method, first measures raw check_password_hash calls on the bounded
+hash pool, then full POST /auth/login round trips through the test client
+from concurrent threads. Results are printed as JSON lines; *_per_core
+divides by os.cpu_count().
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from werkzeug.security import check_password_hash, generate_password_hash
+from app import create_app, db
+from app.models import User
+from app.passwords import HashPool
+from benchmarks.common import bench_config
+
+CORES = os.cpu_count() or 1
+
+
+def run_threads(n, seconds, fn):
+    stop = threading.Event()
+    counts = [{'ok': 0, 'busy': 0} for _ in range(n)]
+
+    def loop(counter):
+        while not stop.is_set():
+            counter['ok' if fn() else 'busy'] += 1
+
+    threads = [threading.Thread(target=loop, args=(c,)) for c in counts]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return sum(c['ok'] for c in counts) / elapsed, sum(c['busy'] for c in counts)
+
+
+def bench_verify(method, threads, seconds):
+    pwhash = generate_password_hash('bench', method=method)
+    pool = HashPool(workers=threads, max_pending=threads)
+
+    def verify():
+        return pool.run(check_password_hash, pwhash, 'bench')
+
+    rate, _ = run_threads(threads, seconds, verify)
+    pool.executor.shutdown()
+    return rate
+
+
+def bench_logins(method, threads, seconds):
+    class LoginConfig(bench_config()):
+        PASSWORD_HASH_METHOD = method
+        PASSWORD_HASH_WORKERS = threads
+        PASSWORD_HASH_MAX_PENDING = threads
+        PASSWORD_HASH_QUEUE_TIMEOUT = 0.5
+
+    app = create_app(LoginConfig)
+    with app.app_context():
+        db.create_all()
+        for i in range(threads):
+            user = User(username=f'login{i}', email=f'login{i}@example.com', role='User')
+            user.set_password('bench')
+            db.session.add(user)
+        db.session.commit()
+
+    local = threading.local()
+
+    def login():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+            local.username = f'login{threading.get_ident() % threads}'
+        response = local.client.post('/auth/login', data={'username': local.username, 'password': 'bench'})
+        local.client.get('/auth/logout')
+        return response.status_code == 302
+
+    return run_threads(threads, seconds, login)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--methods', nargs='+', default=['scrypt:32768:8:1', 'scrypt:16384:8:1',
+                                                         'pbkdf2:sha256:600000', 'pbkdf2:sha256:100000'])
+    parser.add_argument('--threads', nargs='+', type=int, default=sorted({1, CORES, CORES * 2}))
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    for method in args.methods:
+        for threads in args.threads:
+            verify_rate = bench_verify(method, threads, args.seconds)
+            login_rate, busy = bench_logins(method, threads, args.seconds)
+            print(json.dumps({
+                'method': method, 'threads': threads, 'cores': CORES,
+                'verifies_per_sec': round(verify_rate, 1),
+                'verifies_per_sec_per_core': round(verify_rate / CORES, 1),
+                'logins_per_sec': round(login_rate, 1),
+                'logins_per_sec_per_core': round(login_rate / CORES, 1),
+                'logins_rejected_busy': busy,
+            }), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Records EXPLAIN QUERY PLAN and latency for every dashboard filter combination.
+
+Run with: python -m benchmarks.bench_query_plans [--incidents 1000000] [--output plans.json]
+          python -m benchmarks.bench_query_plans --baseline plans.json
+
+Exits non-zero when a query falls back to a full table scan, walks a whole
+index of a table it filters instead of seeking into it, needs a temp B-tree
+sort, or (with --baseline) when its median latency regresses by more
+than --tolerance against the baseline run.
+"""
+import argparse
+import itertools
+import json
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, text
+from sqlalchemy.sql import visitors
+from app import archive, changes, db, sla, stats
+from app.models import Incident, IncidentDaily, IncidentFeed, IncidentSla
+from benchmarks.common import make_app
+import init_db
+
+FILTERS = {'status': 'In Progress', 'priority': 'High', 'category': 'Network'}
+
+
+def dashboard_queries(user_id):
+    # The routes.index query for each role/filter combination: the page
+    # itself and the COUNT issued by paginate().
+    for owner, names in itertools.product([None, user_id], _powerset(FILTERS)):
+        query = Incident.query
+        if owner:
+            query = query.filter_by(user_id=owner)
+        for name in names:
+            query = query.filter(getattr(Incident, name) == FILTERS[name])
+        label = '+'.join((['user_id'] if owner else []) + list(names)) or 'none'
+        yield f'index[{label}] page', query.order_by(Incident.created_at.desc()).limit(10)
+        yield f'index[{label}] count', query.with_entities(func.count(Incident.id))
+
+
+def other_queries(agent_id):
+    yield 'api keyset page', Incident.query.order_by(Incident.created_at, Incident.id).limit(100)
+    yield 'api updated_since', (Incident.query
+                                .filter(Incident.updated_at >= datetime.utcnow() - timedelta(days=1))
+                                .order_by(Incident.updated_at, Incident.id).limit(100))
+    yield 'changes since', (select(IncidentFeed.seq, Incident.id)
+                            .join(Incident, Incident.id == IncidentFeed.incident_id)
+                            .where(IncidentFeed.seq > 0).order_by(IncidentFeed.seq).limit(100))
+    yield 'agent assigned', (Incident.query.filter(Incident.assigned_to_id == agent_id)
+                             .order_by(Incident.created_at.desc()).limit(10))
+    for column in ('priority', 'status', 'category', 'assigned_to_id', 'user_id'):
+        attr = getattr(Incident, column)
+        yield f'stats group by {column}', db.session.query(attr, func.count(Incident.id)).group_by(attr)
+    yield 'sla sweep batch', (select(IncidentSla.incident_id)
+                              .where(IncidentSla.resolved_at.is_(None), IncidentSla.resolve_breached_at.is_(None),
+                                     IncidentSla.resolve_due < datetime.utcnow())
+                              .order_by(IncidentSla.resolve_due).limit(500))
+    # As archive._move_batch
+    yield 'archive batch', (select(*archive.COLUMNS)
+                            .where(Incident.updated_at < datetime.utcnow() - timedelta(days=30),
+                                   Incident.status.in_(sla.RESOLVED_STATUSES),
+                                   Incident.id < select(func.max(Incident.id)).scalar_subquery())
+                            .limit(500))
+    daily = IncidentDaily.__table__.c
+    yield 'rollup timeseries', (select(daily.day, daily.transition, func.sum(daily.count), func.sum(daily.resolutions))
+                                .where(daily.day >= datetime.utcnow().date() - timedelta(days=89))
+                                .group_by(daily.day, daily.transition))
+    yield 'stats open age', Incident.query.filter(Incident.status.in_(stats.OPEN_STATUSES)).with_entities(
+        Incident.created_at)
+
+
+def _powerset(names):
+    names = list(names)
+    return itertools.chain.from_iterable(itertools.combinations(names, r) for r in range(len(names) + 1))
+
+
+def _sql(query):
+    statement = query.statement if hasattr(query, 'statement') else query
+    return str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+
+
+def _filtered_tables(query):
+    # Tables whose columns appear in the WHERE clause
+    where = query.whereclause
+    if where is None:
+        return set()
+    return {element.table.name for element in visitors.iterate(where)
+            if element.__visit_name__ == 'column' and getattr(element, 'table', None) is not None}
+
+
+def _problem(step, filtered):
+    if 'TEMP B-TREE' in step:
+        return True
+    scan = re.match(r'SCAN (\w+)', step)
+    if not scan:
+        return False
+    # A full pass over the table, or over a whole index of a table the query
+    # filters on: the filter is checked row by row instead of seeked
+    return scan.group(1) in filtered or (scan.group(1) == 'incident' and 'INDEX' not in step)
+
+
+def measure(name, query, repeat):
+    sql = _sql(query)
+    plan = [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.session.execute(text(sql)).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    filtered = _filtered_tables(query)
+    problems = [step for step in plan if _problem(step, filtered)]
+    return {'query': name, 'median_ms': round(statistics.median(timings), 3),
+            'plan': plan, 'problems': problems}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--incidents', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare latencies against a previous --output file')
+    parser.add_argument('--tolerance', type=float, default=2.0,
+                        help='allowed slowdown factor against the baseline')
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        agents, users = init_db.create_users()
+        init_db.bulk_create_incidents(agents, users, args.incidents)
+        changes.backfill()
+        db.session.execute(text('ANALYZE'))
+        queries = itertools.chain(dashboard_queries(users[0].id), other_queries(agents[0].id))
+        results = [measure(name, query, args.repeat) for name, query in queries]
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {r['query']: r for r in json.load(f)['results']}
+
+    failed = False
+    for result in results:
+        flags = list(result['problems'])
+        previous = baseline.get(result['query'])
+        if previous and result['median_ms'] > previous['median_ms'] * args.tolerance:
+            flags.append(f"slower than baseline ({previous['median_ms']} ms)")
+        failed = failed or bool(flags)
+        print(f"{result['query']:45s} {result['median_ms']:10.3f} ms  {' | '.join(result['plan'])}"
+              + (f"  <-- {'; '.join(flags)}" if flags else ''))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'incidents': args.incidents, 'results': results}, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""Compares FTS5 search against the LIKE scan it replaced.
+
+Run with: python -m benchmarks.bench_search [--sizes 100000 1000000] [--repeat 5]
+Prints one JSON object per (size, backend, query) to stdout.
+"""
+import argparse
+import json
+import statistics
+import time
+from app import db
+from app.models import Incident
+from app.search import BACKENDS
+from benchmarks.common import make_app, seed
+
+QUERIES = ['vpn', 'printer london', 'pass', 'server unreachable tokyo', 'ticket 4242', 'nomatch']
+
+
+def legacy_like(query, q):
+    # The dashboard search before the index existed: title-only substring scan.
+    return query.filter(Incident.title.contains(q)).order_by(Incident.created_at.desc())
+
+
+def run(size, repeat, page_size):
+    app = make_app()
+    with app.app_context():
+        started = time.perf_counter()
+        seed(size)
+        seed_seconds = time.perf_counter() - started
+        searches = {'legacy_like': legacy_like, 'like': BACKENDS['like'].apply, 'fts5': BACKENDS['fts5'].apply}
+        for q in QUERIES:
+            for name, apply in searches.items():
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    rows = apply(Incident.query, q).limit(page_size).all()
+                    timings.append((time.perf_counter() - start) * 1000)
+                print(json.dumps({
+                    'size': size, 'backend': name, 'query': q, 'rows': len(rows),
+                    'median_ms': round(statistics.median(timings), 3),
+                    'min_ms': round(min(timings), 3),
+                    'seed_seconds': round(seed_seconds, 1),
+                }), flush=True)
+        db.session.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--page-size', type=int, default=10)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.repeat, args.page_size)
+
+
+if __name__ == '__main__':
+    main()
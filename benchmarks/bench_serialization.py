@@ -0,0 +1,97 @@
+"""Incident list serialization throughput in rows per second.
+
+Run with: python -m benchmarks.bench_serialization [--incidents 20000] [--limit 1000] [--seconds 3]
+
+Compares the previous listing path (ORM objects with joined users,
+Incident.to_dict() and the stdlib encoder with sorted keys) against
+column-projected rows encoded by the compact stdlib provider and by orjson,
+with all fields and with ?fields=id,status,priority. "encode" times the
+query plus encoding of one page inside an app context; "http" times full
+GET /api/incidents requests through the test client.
+"""
+import argparse
+import json
+import time
+from app import create_app, db
+from app.models import Incident
+from app.queries import keyset_page, with_users
+from app.serialization import orjson, parse_fields, projected, serializer
+from benchmarks.common import bench_config, seed
+
+SMALL_FIELDS = 'id,status,priority'
+
+
+def rate(seconds, fn):
+    rows = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        rows += fn()
+    return rows / (time.perf_counter() - start)
+
+
+def orm_page(app, limit):
+    def run():
+        incidents = keyset_page(with_users(Incident.query), None, limit).all()
+        json.dumps([i.to_dict() for i in incidents], sort_keys=True, separators=(',', ':'))
+        db.session.remove()
+        return len(incidents)
+    return run
+
+
+def projected_page(app, limit, fields):
+    fields = parse_fields({'fields': fields or ''})
+
+    def run():
+        rows = keyset_page(projected(fields), None, limit).all()
+        app.json.dumps(list(map(serializer(fields), rows)))
+        db.session.remove()
+        return len(rows)
+    return run
+
+
+def http_page(client, limit, fields):
+    path = f'/api/incidents?limit={limit}' + (f'&fields={fields}' if fields else '')
+
+    def run():
+        response = client.get(path)
+        assert response.status_code == 200, response.status_code
+        return limit
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--incidents', type=int, default=20000)
+    parser.add_argument('--limit', type=int, default=1000, help='rows per page')
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    config = bench_config()
+    providers = ['stdlib'] + (['orjson'] if orjson else [])
+    apps = {}
+    for provider in providers:
+        config = type(f'{provider}Config', (config,), {'JSON_PROVIDER': provider})
+        apps[provider] = create_app(config)
+    with apps['stdlib'].app_context():
+        db.create_all()
+        seed(args.incidents)
+
+    def report(test, path, provider, fields, rows_per_sec):
+        print(json.dumps({'test': test, 'path': path, 'json': provider, 'fields': fields or 'all',
+                          'rows_per_sec': round(rows_per_sec)}))
+
+    with apps['stdlib'].app_context():
+        report('encode', 'orm+to_dict', 'stdlib sorted', None, rate(args.seconds, orm_page(apps['stdlib'], args.limit)))
+    for provider, app in apps.items():
+        for fields in (None, SMALL_FIELDS):
+            with app.app_context():
+                report('encode', 'projected', provider, fields,
+                       rate(args.seconds, projected_page(app, args.limit, fields)))
+    for provider, app in apps.items():
+        for fields in (None, SMALL_FIELDS):
+            report('http', 'projected', provider, fields,
+                   rate(args.seconds, http_page(app.test_client(), args.limit, fields)))
+
+
+if __name__ == '__main__':
+    main()
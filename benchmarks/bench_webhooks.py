@@ -0,0 +1,110 @@
+"""Webhook delivery under an update storm.
+
+Run with: python -m benchmarks.bench_webhooks [--updates 2000] [--subscriptions 2] [--windows 0 1]
+                                              [--fail-rate 0] [--delay-ms 20] [--processes 1]
+
+For each batching window, --updates status changes are made through
+PUT /api/incidents/<id> while `flask jobs worker` delivers to --subscriptions
+local stub receivers (benchmarks.webhook_receiver) answering after --delay-ms
+and failing --fail-rate of requests. Reports HTTP requests and connections
+against events delivered, duplicates, and the mean and worst time from
+change to delivery.
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import threading
+import time
+from sqlalchemy import func
+from app import db, jobs, webhooks
+from app.models import Incident, WebhookEvent, WebhookSubscription
+from benchmarks.common import make_app, seed
+from benchmarks.webhook_receiver import Receiver
+
+STATUSES = ('Open', 'In Progress', 'Resolved', 'Closed')
+
+
+def storm(app, n, done):
+    client = app.test_client()
+    with app.app_context():
+        ids = [id for id, in db.session.query(Incident.id)]
+    for _ in range(n):
+        response = client.put(f'/api/incidents/{random.choice(ids)}', json={'status': random.choice(STATUSES)})
+        assert response.status_code == 200, response.status_code
+    done.set()
+
+
+def stop_when_delivered(app, storm_done):
+    # run_workers() stops on SIGTERM
+    with app.app_context():
+        while True:
+            pending = WebhookEvent.query.filter_by(status='pending').count()
+            db.session.remove()
+            if storm_done.is_set() and not pending:
+                break
+            time.sleep(0.05)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def run(app, args, window):
+    receivers = [Receiver(fail_rate=args.fail_rate, delay_ms=args.delay_ms).start()
+                 for _ in range(args.subscriptions)]
+    with app.app_context():
+        db.session.query(WebhookEvent).delete()
+        db.session.query(WebhookSubscription).delete()
+        db.session.commit()
+        for receiver in receivers:
+            webhooks.subscribe(receiver.url, events=['incident.status_changed'], batch_window=window)
+
+        storm_done = threading.Event()
+        start = time.perf_counter()
+        threading.Thread(target=storm, args=(app, args.updates, storm_done), daemon=True).start()
+        threading.Thread(target=stop_when_delivered, args=(app, storm_done), daemon=True).start()
+        jobs.run_workers(args.processes, stats_interval=3600, poll_interval=0.05)
+        elapsed = time.perf_counter() - start
+
+        waited = func.julianday(WebhookEvent.sent_at) - func.julianday(WebhookEvent.created_at)
+        events, mean_wait, max_wait = db.session.query(func.count(), func.avg(waited), func.max(waited)).filter(
+            WebhookEvent.status == 'sent').one()
+        dead = WebhookEvent.query.filter_by(status='dead').count()
+    for receiver in receivers:
+        receiver.stop()
+    received = sum(len(receiver.received) for receiver in receivers)
+    return {
+        'window_s': window,
+        'events': events,
+        'received': received,
+        'duplicates': sum(sum(receiver.received.values()) for receiver in receivers) - received,
+        'dead': dead,
+        'requests': sum(receiver.stats['requests'] for receiver in receivers),
+        'failed': sum(receiver.stats['failed'] for receiver in receivers),
+        'connections': sum(receiver.stats['connections'] for receiver in receivers),
+        'mean_delay_ms': round((mean_wait or 0) * 86400000),
+        'max_delay_ms': round((max_wait or 0) * 86400000),
+        'seconds': round(elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--subscriptions', type=int, default=2)
+    parser.add_argument('--windows', type=float, nargs='+', default=[0, 1])
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--delay-ms', type=float, default=20)
+    parser.add_argument('--processes', type=int, default=1)
+    args = parser.parse_args()
+
+    app = make_app()
+    # Retry quickly so failures don't dominate the run
+    app.config.update(WEBHOOK_BACKOFF=0.2, WEBHOOK_BACKOFF_MAX=2)
+    with app.app_context():
+        seed(1000)
+    for window in args.windows:
+        print(json.dumps(dict({'test': 'storm', 'updates': args.updates}, **run(app, args, window))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Asserts that listing incidents, through the API and on the dashboard,
+issues a constant number of SQL queries.
+
+Run with: python -m benchmarks.check_query_count
+"""
+import re
+import sys
+from benchmarks.common import make_app, seed, count_queries
+
+PAGE_SIZES = [10, 100, 1000]
+ROW_LINK = re.compile(rb'href="/incident/\d+"')
+DASHBOARD_PAGES = [1, 2, 3]
+# The page itself and the COUNT issued by paginate()
+DASHBOARD_QUERIES = 2
+# Seeded accounts (password 'bench'): reporters see their own incidents,
+# agents all of them
+DASHBOARD_ROLES = {'user': 'bench_user0', 'agent': 'bench_agent0'}
+
+
+def dashboard_counts(app, username):
+    # routes.index renders each row's author and assignee, the N+1 to avoid
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': username, 'password': 'bench'})
+    assert response.status_code == 302, response.status_code
+    # Warm up the per-process caches (logged-in user, agents) first
+    client.get('/')
+    counts = {}
+    for page in DASHBOARD_PAGES:
+        with app.app_context(), count_queries() as counter:
+            response = client.get(f'/?page={page}')
+            assert response.status_code == 200 and len(ROW_LINK.findall(response.data)) == 10, page
+        counts[page] = counter['count']
+    return counts
+
+
+def main():
+    app = make_app()
+    with app.app_context():
+        seed(2000, n_users=200, n_agents=40)
+
+    client = app.test_client()
+    counts = {}
+    for size in PAGE_SIZES:
+        with app.app_context(), count_queries() as api_counter:
+            response = client.get(f'/api/incidents?limit={size}')
+            assert response.status_code == 200 and len(response.json) == size
+        with app.app_context(), count_queries() as stream_counter:
+            response = client.get(f'/api/incidents?format=ndjson&limit={size}')
+            assert len(response.data.splitlines()) == 2000
+        counts[size] = (api_counter['count'], stream_counter['count'])
+        print(f"limit={size:5d}  list queries={api_counter['count']}  ndjson queries={stream_counter['count']}")
+
+    list_counts = {c[0] for c in counts.values()}
+    if len(list_counts) != 1:
+        print(f"FAIL: list query count depends on page size: {counts}")
+        return 1
+    # The stream issues one query per chunk and nothing per row.
+    for size, (_, stream_count) in counts.items():
+        if stream_count > 2000 // size + 2:
+            print(f"FAIL: ndjson stream issued {stream_count} queries for chunk size {size}")
+            return 1
+
+    for role, username in DASHBOARD_ROLES.items():
+        dashboard = dashboard_counts(app, username)
+        print(f"dashboard {role:5s}  " + '  '.join(f"page {page}: {count} queries" for page, count in dashboard.items()))
+        if set(dashboard.values()) != {DASHBOARD_QUERIES}:
+            print(f"FAIL: dashboard for {role} issued {dashboard} queries per page, expected {DASHBOARD_QUERIES}")
+            return 1
+    print("OK: query count is independent of the number of rows")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from config import Config
+from app import create_app, db
+from app import seed as app_seed
+
+
+def bench_config(path=None):
+    path = path or os.path.join(tempfile.mkdtemp(prefix='itsm-bench-'), 'bench.db')
+
+    class BenchConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+
+    return BenchConfig
+
+
+def make_app(path=None):
+    app = create_app(bench_config(path))
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def seed(n_incidents, n_users=50, n_agents=10, chunk_size=10000):
+    # Every benchmark account's password is 'bench'.
+    return app_seed.run(n_incidents, users=n_users, agents=n_agents, days=90, chunk_size=chunk_size,
+                        prefix='bench', password='bench', random_seed=0)
+
+
+@contextmanager
+def count_queries():
+    counter = {'count': 0}
+
+    def before_cursor_execute(*args):
+        counter['count'] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextmanager
+def timer():
+    result = {}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result['seconds'] = time.perf_counter() - start
@@ -0,0 +1,116 @@
+"""Stub webhook receiver for trying out and benchmarking app.webhooks.
+
+Run with: python -m benchmarks.webhook_receiver [--port 8900] [--secret S] [--fail-rate 0.2] [--delay-ms 50]
+
+Accepts POSTed batches on any path, checks X-ITSM-Signature when --secret is
+given (401 if it doesn't match), fails a --fail-rate share of requests with a
+503 and answers after --delay-ms. Prints a line per batch and, on Ctrl+C,
+the totals. Receiver.start() runs one in a background thread.
+"""
+import argparse
+import hmac
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.webhooks import sign
+
+
+class Receiver:
+    def __init__(self, port=0, secret=None, fail_rate=0.0, delay_ms=0.0, verbose=False):
+        self.secret = secret
+        self.fail_rate = fail_rate
+        self.delay_ms = delay_ms
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.batches = []           # decoded bodies of accepted requests
+        self.received = {}          # event id -> times received
+        self.stats = {'requests': 0, 'connections': 0, 'failed': 0, 'rejected': 0}
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/hook'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def events(self):
+        with self.lock:
+            return [event for batch in self.batches for event in batch['events']]
+
+    def _handle(self, headers, body):
+        # Returns the response status
+        with self.lock:
+            self.stats['requests'] += 1
+        if self.delay_ms:
+            time.sleep(self.delay_ms / 1000)
+        if self.secret and not hmac.compare_digest(headers.get('X-ITSM-Signature', ''), sign(self.secret, body)):
+            with self.lock:
+                self.stats['rejected'] += 1
+            return 401
+        if random.random() < self.fail_rate:
+            with self.lock:
+                self.stats['failed'] += 1
+            return 503
+        batch = json.loads(body)
+        with self.lock:
+            self.batches.append(batch)
+            for event in batch['events']:
+                self.received[event['id']] = self.received.get(event['id'], 0) + 1
+        if self.verbose:
+            print(f"subscription {batch['subscription_id']}: {len(batch['events'])} events "
+                  f"({', '.join(sorted({event['event'] for event in batch['events']}))})", flush=True)
+        return 204
+
+    def _handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so connection reuse by the sender shows in the stats
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with receiver.lock:
+                    receiver.stats['connections'] += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.send_response(receiver._handle(self.headers, body))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--secret')
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--delay-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    receiver = Receiver(args.port, args.secret, args.fail_rate, args.delay_ms, verbose=True)
+    print(f"Listening on {receiver.url}, Ctrl+C to stop.")
+    try:
+        receiver.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(dict(receiver.stats, batches=len(receiver.batches), events=len(receiver.received),
+                          duplicates=sum(receiver.received.values()) - len(receiver.received))))
+
+
+if __name__ == '__main__':
+    main()
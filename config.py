@@ -1,3 +1,4 @@
+import json
 import os
 
 class Config:
@@ -5,3 +6,164 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # SQLite connection tuning, applied by app.database to every new connection.
+    # busy_timeout is how long a writer waits for the lock before 'database is locked'.
+    SQLITE_PRAGMAS = {}
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5))
+    # Retries (with exponential backoff) for API writes that still hit a locked database
+    COMMIT_RETRIES = int(os.environ.get('COMMIT_RETRIES', 3))
+    COMMIT_RETRY_BACKOFF = float(os.environ.get('COMMIT_RETRY_BACKOFF', 0.05))
+
+    # In-process cache for the login user loader and the assignable agent list
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))
+
+    # Password hashing. Any werkzeug method string ('scrypt:N:r:p',
+    # 'pbkdf2:sha256:iterations'); stored hashes using other parameters are
+    # upgraded on the next successful login. Verification runs on a bounded
+    # thread pool: at most WORKERS hashes at once, MAX_PENDING queued, and
+    # logins beyond that fail fast after QUEUE_TIMEOUT seconds.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', 2))
+
+    # Incident search: 'auto' uses the SQLite FTS5 index when present, else 'like'
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+
+    # JSON encoding of responses: 'orjson', 'stdlib' (compact), or 'auto' to
+    # use orjson when it is installed
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'auto')
+
+    # Rows per chunk read and written by GET /api/incidents/export
+    EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 5000))
+
+    # Rows per transaction for POST /api/incidents/bulk
+    BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 1000))
+
+    # Alert correlation: duplicates of an open incident from the same `source`
+    # seen within the window (seconds since the last occurrence) are folded
+    # into it. Off by default, as it changes what POST /api/incidents returns.
+    CORRELATION_ENABLED = os.environ.get('CORRELATION_ENABLED', '0') == '1'
+    CORRELATION_WINDOW = int(os.environ.get('CORRELATION_WINDOW', 900))
+    CORRELATION_MAX_ENTRIES = int(os.environ.get('CORRELATION_MAX_ENTRIES', 100000))
+
+    # Incident audit history: events are queued on commit and inserted in
+    # batches by a background writer (set AUDIT_ASYNC=0 to write inline)
+    AUDIT_ASYNC = os.environ.get('AUDIT_ASYNC', '1') == '1'
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 500))
+    AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 0.5))
+
+    # Incident change feed: longest long-poll wait, and how often waiting
+    # clients re-check the database for writes from other processes
+    CHANGES_MAX_WAIT = float(os.environ.get('CHANGES_MAX_WAIT', 30))
+    CHANGES_POLL_INTERVAL = float(os.environ.get('CHANGES_POLL_INTERVAL', 5))
+    # Seconds between the dashboard's change banner polls. They return at
+    # once (no wait), so open dashboards never hold a request worker.
+    DASHBOARD_POLL_INTERVAL = float(os.environ.get('DASHBOARD_POLL_INTERVAL', 15))
+
+    # Auto-assignment of new incidents to the least loaded Agent. SKILLS maps
+    # agent usernames to the categories they handle, as JSON
+    # ('{"agent1": ["Network", "Hardware"]}'); agents not listed take any
+    # category. In-memory load is re-read from the database every RESYNC_INTERVAL seconds.
+    ASSIGNMENT_ENABLED = os.environ.get('ASSIGNMENT_ENABLED', '1') == '1'
+    ASSIGNMENT_SKILLS = json.loads(os.environ.get('ASSIGNMENT_SKILLS', '{}'))
+    ASSIGNMENT_RESYNC_INTERVAL = int(os.environ.get('ASSIGNMENT_RESYNC_INTERVAL', 300))
+
+    # SLA targets per priority in minutes: (first response, resolution).
+    # An incident is responded to once it leaves Open; being assigned, which
+    # may happen automatically, does not count.
+    SLA_TARGETS = {
+        'Critical': (15, 4 * 60),
+        'High': (60, 8 * 60),
+        'Medium': (4 * 60, 3 * 24 * 60),
+        'Low': (8 * 60, 5 * 24 * 60),
+    }
+    # The sweeper flags overdue incidents every SLA_SWEEP_INTERVAL seconds,
+    # SLA_SWEEP_BATCH rows per transaction
+    SLA_SWEEP_INTERVAL = int(os.environ.get('SLA_SWEEP_INTERVAL', 60))
+    SLA_SWEEP_BATCH = int(os.environ.get('SLA_SWEEP_BATCH', 500))
+
+    # Archival: incidents Resolved/Closed for more than ARCHIVE_AFTER_DAYS
+    # days (0 = never) are moved to incident_archive every ARCHIVE_INTERVAL
+    # seconds, ARCHIVE_BATCH_SIZE rows per transaction with ARCHIVE_BATCH_PAUSE
+    # seconds between batches
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 0))
+    ARCHIVE_INTERVAL = int(os.environ.get('ARCHIVE_INTERVAL', 24 * 3600))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+    ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE', 0.05))
+
+    # Background jobs (app.jobs), run by `flask jobs worker`: WORKERS
+    # processes of THREADS threads each claim up to BATCH_SIZE ready jobs at a
+    # time, polling every POLL_INTERVAL seconds when idle. A claimed job is taken over by another
+    # worker if not finished within LEASE seconds. Failed jobs are retried
+    # after BACKOFF * 2^(attempt - 1) seconds (at most BACKOFF_MAX) and marked
+    # dead after MAX_ATTEMPTS. Done jobs are deleted after RETENTION seconds.
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+    JOBS_THREADS = int(os.environ.get('JOBS_THREADS', 4))
+    JOBS_BATCH_SIZE = int(os.environ.get('JOBS_BATCH_SIZE', 10))
+    JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 1))
+    JOBS_LEASE = int(os.environ.get('JOBS_LEASE', 300))
+    JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 5))
+    JOBS_BACKOFF = float(os.environ.get('JOBS_BACKOFF', 10))
+    JOBS_BACKOFF_MAX = float(os.environ.get('JOBS_BACKOFF_MAX', 3600))
+    JOBS_RETENTION = int(os.environ.get('JOBS_RETENTION', 7 * 24 * 3600))
+    JOBS_PRUNE_INTERVAL = int(os.environ.get('JOBS_PRUNE_INTERVAL', 3600))
+
+    # Outbound webhooks (app.webhooks), delivered by the job workers. Events
+    # for a subscription are batched for its window (BATCH_WINDOW seconds by
+    # default), up to MAX_BATCH per request. Failed requests are retried after
+    # BACKOFF * 2^(attempt - 1) seconds (at most BACKOFF_MAX); events still
+    # undelivered after MAX_ATTEMPTS are dead-lettered. Each worker thread
+    # keeps up to POOL_SIZE keep-alive connections per host. Subscription
+    # changes reach other processes within CACHE_TTL seconds; delivered events
+    # are deleted after RETENTION seconds.
+    WEBHOOK_BATCH_WINDOW = float(os.environ.get('WEBHOOK_BATCH_WINDOW', 5))
+    WEBHOOK_MAX_BATCH = int(os.environ.get('WEBHOOK_MAX_BATCH', 500))
+    WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', 10))
+    WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
+    WEBHOOK_BACKOFF = float(os.environ.get('WEBHOOK_BACKOFF', 5))
+    WEBHOOK_BACKOFF_MAX = float(os.environ.get('WEBHOOK_BACKOFF_MAX', 900))
+    WEBHOOK_POOL_SIZE = int(os.environ.get('WEBHOOK_POOL_SIZE', 10))
+    WEBHOOK_CACHE_TTL = int(os.environ.get('WEBHOOK_CACHE_TTL', 30))
+    WEBHOOK_RETENTION = int(os.environ.get('WEBHOOK_RETENTION', 7 * 24 * 3600))
+
+    # Request instrumentation: Server-Timing headers, a Prometheus /metrics
+    # endpoint, and warnings for queries/requests slower than the thresholds (ms)
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '0') == '1'
+    SLOW_QUERY_THRESHOLD = float(os.environ.get('SLOW_QUERY_THRESHOLD', 100))
+    SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 1000))
+
+    # Periodic maintenance (stats reconciliation, SLA sweep, archival, pruning)
+    # must run in exactly one process: `flask scheduler run`. Set to 1 to run
+    # it inside the app instead, only when the app is served by one process.
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '0') == '1'
+    STATS_RECONCILE_INTERVAL = int(os.environ.get('STATS_RECONCILE_INTERVAL', 3600))
+
+
+class ProductionConfig(Config):
+    # WAL lets readers proceed while a write is in progress; synchronous=NORMAL
+    # is durable across application crashes under WAL and avoids an fsync per commit.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'cache_size': -int(os.environ.get('SQLITE_CACHE_KB', 64 * 1024)),
+        'temp_store': 'MEMORY',
+    }
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 15))
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 3600)),
+    }
+
+configs = {
+    'development': Config,
+    'production': ProductionConfig,
+}
+
+def config_from_env():
+    return configs[os.environ.get('ITSM_ENV', 'development')]
@@ -1,69 +1,66 @@
-from app import create_app, db
+from app import create_app, db, seed
+from config import config_from_env
 from app.models import User, Incident
+from app.passwords import hash_many
+import argparse
 import os
 import random
 from datetime import datetime, timedelta
 
-app = create_app()
+# Sample Data Lists
+categories = ['Hardware', 'Software', 'Network', 'Access', 'General']
+priorities = ['Low', 'Medium', 'High', 'Critical']
+statuses = ['Open', 'In Progress', 'Resolved', 'Closed']
+titles = [
+    "System slow", "Cannot login", "Printer not working", "Wifi issue", 
+    "Software update needed", "VPN down", "Email not syncing", "Blue screen error",
+    "Keyboard malfunction", "Mouse broken", "Monitor flickering", "Access denied",
+    "Password reset", "New account request", "Server unreachable"
+]
 
-# Delete existing database to start fresh with new schema
-db_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'app.db')
-if os.path.exists(db_path):
-    os.remove(db_path)
-    print("Existing database removed.")
+def create_users():
+    # (user, password) pairs; passwords are hashed in parallel below
+    accounts = []
 
-with app.app_context():
-    db.create_all()
-    
     # Create Admin
     admin = User(username='admin', email='admin@example.com', role='Admin')
-    admin.set_password('admin')
-    db.session.add(admin)
+    accounts.append((admin, 'admin'))
 
     # Create 5 Agents
     agents = []
     for i in range(1, 6):
         agent = User(username=f'agent{i}', email=f'agent{i}@example.com', role='Agent')
-        agent.set_password(f'agent{i}')
+        accounts.append((agent, f'agent{i}'))
         agents.append(agent)
-        db.session.add(agent)
 
     # Create 5 Users
     users = []
     for i in range(1, 6):
         user = User(username=f'user{i}', email=f'user{i}@example.com', role='User')
-        user.set_password(f'user{i}')
+        accounts.append((user, f'user{i}'))
         users.append(user)
-        db.session.add(user)
     
     # Create AI Users
     ai_user = User(username='AI-User', email='ai-user@example.com', role='User')
-    ai_user.set_password('AI-User')
-    db.session.add(ai_user)
+    accounts.append((ai_user, 'AI-User'))
     # users.append(ai_user) # Excluded from random incident generation
 
     ai_agent = User(username='AI-SRE-Agent', email='ai-sre-agent@example.com', role='Agent')
-    ai_agent.set_password('AI-SRE-Agent')
-    db.session.add(ai_agent)
+    accounts.append((ai_agent, 'AI-SRE-Agent'))
     # agents.append(ai_agent) # Excluded from random assignment
 
+    hashes = hash_many([password for _, password in accounts])
+    for (user, _), password_hash in zip(accounts, hashes):
+        user.password_hash = password_hash
+        db.session.add(user)
+
     db.session.commit()
     print("Users created: admin, 5 agents, 5 users, AI-User, AI-SRE-Agent")
+    return agents, users
 
-    # Sample Data Lists
-    categories = ['Hardware', 'Software', 'Network', 'Access', 'General']
-    priorities = ['Low', 'Medium', 'High', 'Critical']
-    statuses = ['Open', 'In Progress', 'Resolved', 'Closed']
-    titles = [
-        "System slow", "Cannot login", "Printer not working", "Wifi issue", 
-        "Software update needed", "VPN down", "Email not syncing", "Blue screen error",
-        "Keyboard malfunction", "Mouse broken", "Monitor flickering", "Access denied",
-        "Password reset", "New account request", "Server unreachable"
-    ]
-
-    # Create 100 Sample Incidents
+def create_sample_incidents(agents, users, count=100):
     incidents = []
-    for i in range(100):
+    for i in range(count):
         # Randomize creation time (within last 30 days)
         days_ago = random.randint(0, 30)
         created_at = datetime.utcnow() - timedelta(days=days_ago)
@@ -92,6 +89,49 @@ with app.app_context():
     
     db.session.add_all(incidents)
     db.session.commit()
-    print("100 Sample incidents created.")
-    
-    print("Database initialized successfully.")
+    print(f"{count} Sample incidents created.")
+
+def bulk_create_incidents(agents, users, count, chunk_size=50000, days=365):
+    # Large data sets for benchmarking; see `flask seed` for generating
+    # thousands of users as well.
+    def progress(done, total, elapsed):
+        print(f"  {done}/{total} incidents ({elapsed:.1f}s)")
+
+    seed.create_incidents(count, [u.id for u in users], [a.id for a in agents], days=days,
+                          chunk_size=chunk_size, progress=progress)
+    print(f"{count} Sample incidents created.")
+
+def init_db(count=100):
+    db.create_all()
+    agents, users = create_users()
+    if count > 1000:
+        bulk_create_incidents(agents, users, count)
+    else:
+        create_sample_incidents(agents, users, count)
+
+    from app import changes, rollups, sla, stats
+    sla.backfill()
+    stats.reconcile()
+    rollups.backfill()
+    changes.backfill()
+
+def main():
+    parser = argparse.ArgumentParser(description='Create a fresh database with sample data.')
+    parser.add_argument('--incidents', type=int, default=100,
+                        help='number of sample incidents (bulk inserted above 1000)')
+    args = parser.parse_args()
+
+    app = create_app(config_from_env())
+
+    # Delete existing database to start fresh with new schema
+    db_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'app.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+        print("Existing database removed.")
+
+    with app.app_context():
+        init_db(args.incidents)
+        print("Database initialized successfully.")
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 from app import create_app, db
+from config import config_from_env
+from app.schema import upgrade
 from app.models import User, Incident
 
-app = create_app()
+app = create_app(config_from_env())
 
 @app.shell_context_processor
 def make_shell_context():
@@ -9,5 +11,5 @@ def make_shell_context():
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade()
     app.run(debug=True)